@@ -4,7 +4,9 @@ from os import environ as env
 from dataclasses import dataclass, field
 from typing import Optional
 
-from src.utils import get_formatted_date, int_from_env, bool_from_env, int_list_from_env, get_formatted_timestamp
+from src.utils import (
+    get_formatted_date, int_from_env, float_from_env, bool_from_env, int_list_from_env, get_formatted_timestamp
+)
 
 
 @dataclass(slots=True)
@@ -133,6 +135,13 @@ class FilepathConfig:
     _download_failed_ids_to_retry_json_name: str = env.get(
         "DOWNLOAD_FAILED_IDS_TO_RETRY_JSON_NAME", "download_failed_ids_to_retry.json"
     )
+    _download_rest_validators_json_name: str = env.get(
+        "DOWNLOAD_REST_VALIDATORS_JSON_NAME", "download_rest_validators.json"
+    )
+    _ligand_ccd_cache_name: str = env.get("LIGAND_CCD_CACHE_FOLDER_NAME", "ccd_source_cache")
+    _ligand_ccd_state_json_name: str = env.get("LIGAND_CCD_STATE_JSON_NAME", "download_ccd_state.json")
+    _ligand_cifs_manifest_json_name: str = env.get("LIGAND_CIFS_MANIFEST_JSON_NAME", "ligand_cifs_manifest.json")
+    _extraction_cache_name: str = env.get("EXTRACTION_CACHE_FOLDER_NAME", "extraction_cache")
 
     # output names used as input too
     _familiar_name_translations_json_name: str = env.get("FAMILIAR_NAME_TRANSLATIONS_NAME", "nametranslation.json")
@@ -197,6 +206,26 @@ class FilepathConfig:
     def download_failed_ids_to_retry_json(self) -> str:
         return path.join(self.dataset_root_path, self._download_failed_ids_to_retry_json_name)
 
+    @property
+    def download_rest_validators_json(self) -> str:
+        return path.join(self.dataset_root_path, self._download_rest_validators_json_name)
+
+    @property
+    def ligand_ccd_cache(self) -> str:
+        return path.join(self.dataset_root_path, self._ligand_ccd_cache_name)
+
+    @property
+    def ligand_ccd_state_json(self) -> str:
+        return path.join(self.dataset_root_path, self._ligand_ccd_state_json_name)
+
+    @property
+    def ligand_cifs_manifest_json(self) -> str:
+        return path.join(self.dataset_root_path, self._ligand_cifs_manifest_json_name)
+
+    @property
+    def extraction_cache(self) -> str:
+        return path.join(self.dataset_root_path, self._extraction_cache_name)
+
     @property
     def familiar_name_translations_json(self) -> str:
         return path.join(self.output_root_path, self._familiar_name_translations_json_name)
@@ -241,6 +270,14 @@ class FilepathConfig:
     def xml_rsync_log(self) -> str:
         return path.join(self.archive_rsync_logs, f"{self._run_start_timesetamp}_xml_rsync_log.txt")
 
+    @property
+    def download_metrics_json(self) -> str:
+        return path.join(self.archive_rsync_logs, f"{self._run_start_timesetamp}_download_metrics.json")
+
+    @property
+    def download_metrics_csv(self) -> str:
+        return path.join(self.archive_rsync_logs, f"{self._run_start_timesetamp}_download_metrics.csv")
+
 
 @dataclass(slots=True)
 class DownloadTimeoutConfig:
@@ -248,8 +285,124 @@ class DownloadTimeoutConfig:
     Configuration for download timeouts.
     """
 
-    rest_timeout_s: int = env.get("DOWNLOAD_REST_TIMEOUT_S", 100)
-    ligand_cifs_timeout_s: int = env.get("DOWNLOAD_LIGAND_CIFS_TIMEOUT_S", 30*60)
+    # read timeouts (max time waiting for the server between bytes of response)
+    rest_timeout_s: int = int_from_env("DOWNLOAD_REST_TIMEOUT_S", 100)
+    ligand_cifs_timeout_s: int = int_from_env("DOWNLOAD_LIGAND_CIFS_TIMEOUT_S", 30*60)
+    # connect timeout (max time waiting for the connection to be established)
+    connect_timeout_s: int = int_from_env("DOWNLOAD_CONNECT_TIMEOUT_S", 10)
+
+    @property
+    def rest_timeouts_s(self) -> tuple[int, int]:
+        """
+        Connect and read timeout for rest requests.
+        """
+        return self.connect_timeout_s, self.rest_timeout_s
+
+    @property
+    def ligand_cifs_timeouts_s(self) -> tuple[int, int]:
+        """
+        Connect and read timeout for ligand cifs download.
+        """
+        return self.connect_timeout_s, self.ligand_cifs_timeout_s
+
+
+@dataclass(slots=True)
+class DownloadConfig:
+    """
+    Configuration for data download behaviour (parallelism, limits).
+    """
+
+    # number of data sources (mmcif rsync, xml rsync, ligand cifs, each rest type) synchronized at the same time
+    max_parallel_sources: int = int_from_env("DOWNLOAD_MAX_PARALLEL_SOURCES", 4)
+    max_requests_in_flight_per_host: int = int_from_env("DOWNLOAD_MAX_REQUESTS_IN_FLIGHT_PER_HOST", 8)
+    # number of processes unpacking files recieved by rsync (while rsync is still running)
+    max_unpacking_workers: int = int_from_env("DOWNLOAD_MAX_UNPACKING_WORKERS", 4)
+    # number of rsync processes each rsynced folder is split between (by pdb "divided" hash directories), max 36
+    rsync_shards: int = int_from_env("DOWNLOAD_RSYNC_SHARDS", 1)
+    # number of threads hashing and saving ligand cifs (while the big ccd files are being split)
+    max_ligand_cif_workers: int = int_from_env("DOWNLOAD_MAX_LIGAND_CIF_WORKERS", 4)
+    http_pool_size: int = int_from_env("DOWNLOAD_HTTP_POOL_SIZE", 8)
+    rest_conditional_requests: bool = bool_from_env("DOWNLOAD_REST_CONDITIONAL_REQUESTS", True)
+    # number of ids downloaded in one request from pdbe rest api (1 means one request per id)
+    rest_batch_size: int = int_from_env("DOWNLOAD_REST_BATCH_SIZE", 100)
+    # ids that failed n times in a row are retried after base * 2^(n-1) days, but at most after max days
+    failed_ids_retry_base_interval_days: int = int_from_env("DOWNLOAD_FAILED_IDS_RETRY_BASE_INTERVAL_DAYS", 1)
+    failed_ids_retry_max_interval_days: int = int_from_env("DOWNLOAD_FAILED_IDS_RETRY_MAX_INTERVAL_DAYS", 32)
+    # maximum number of previously failed ids of one source retried in one run (0 means no limit)
+    failed_ids_max_retried_per_run: int = int_from_env("DOWNLOAD_FAILED_IDS_MAX_RETRIED_PER_RUN", 0)
+    # base urls of the data sources (may be pointed to a local stand-in server, see tests/download_benchmark)
+    pdbe_rest_base_url: str = env.get("DOWNLOAD_PDBE_REST_BASE_URL", "https://www.ebi.ac.uk/pdbe/api/pdb/entry")
+    validator_db_base_url: str = env.get(
+        "DOWNLOAD_VALIDATOR_DB_BASE_URL", "https://webchem.ncbr.muni.cz/Platform/ValidatorDb/Data"
+    )
+    ligand_ccd_base_url: str = env.get("DOWNLOAD_LIGAND_CCD_BASE_URL", "https://files.wwpdb.org/pub/pdb/data/monomers")
+    # requests per second to one endpoint, adapted during the run based on throttling responses
+    rate_limit_initial_per_s: float = float_from_env("DOWNLOAD_RATE_LIMIT_INITIAL_PER_S", 10.0)
+    rate_limit_min_per_s: float = float_from_env("DOWNLOAD_RATE_LIMIT_MIN_PER_S", 0.5)
+    rate_limit_max_per_s: float = float_from_env("DOWNLOAD_RATE_LIMIT_MAX_PER_S", 50.0)
+    retry_backoff_base_s: float = float_from_env("DOWNLOAD_RETRY_BACKOFF_BASE_S", 1.0)
+    retry_backoff_max_s: float = float_from_env("DOWNLOAD_RETRY_BACKOFF_MAX_S", 60.0)
+    # consecutive failures (connection errors, timeouts, 5xx) after which requests to the host fail immediately
+    circuit_breaker_failure_threshold: int = int_from_env("DOWNLOAD_CIRCUIT_BREAKER_FAILURE_THRESHOLD", 10)
+    circuit_breaker_half_open_after_s: float = float_from_env("DOWNLOAD_CIRCUIT_BREAKER_HALF_OPEN_AFTER_S", 120.0)
+
+    def validate(self) -> None:
+        """
+        Check values are within allowed limits.
+        :raises ValueError:
+        """
+        if self.max_parallel_sources < 1:
+            raise ValueError("DOWNLOAD_MAX_PARALLEL_SOURCES needs to be at least 1.")
+
+        if self.max_requests_in_flight_per_host < 1:
+            raise ValueError("DOWNLOAD_MAX_REQUESTS_IN_FLIGHT_PER_HOST needs to be at least 1.")
+
+        if self.max_unpacking_workers < 1:
+            raise ValueError("DOWNLOAD_MAX_UNPACKING_WORKERS needs to be at least 1.")
+
+        if not 1 <= self.rsync_shards <= 36:
+            raise ValueError("DOWNLOAD_RSYNC_SHARDS needs to be between 1 and 36.")
+
+        if self.max_ligand_cif_workers < 1:
+            raise ValueError("DOWNLOAD_MAX_LIGAND_CIF_WORKERS needs to be at least 1.")
+
+        if self.http_pool_size < 1:
+            raise ValueError("DOWNLOAD_HTTP_POOL_SIZE needs to be at least 1.")
+
+        if self.rest_batch_size < 1:
+            raise ValueError("DOWNLOAD_REST_BATCH_SIZE needs to be at least 1.")
+
+        if (
+            self.failed_ids_retry_base_interval_days < 1
+            or self.failed_ids_retry_max_interval_days < self.failed_ids_retry_base_interval_days
+        ):
+            raise ValueError(
+                "DOWNLOAD_FAILED_IDS_RETRY_BASE_INTERVAL_DAYS needs to be at least 1 and not bigger than "
+                "DOWNLOAD_FAILED_IDS_RETRY_MAX_INTERVAL_DAYS."
+            )
+
+        if self.failed_ids_max_retried_per_run < 0:
+            raise ValueError("DOWNLOAD_FAILED_IDS_MAX_RETRIED_PER_RUN cannot be negative.")
+
+        if not 0 < self.rate_limit_min_per_s <= self.rate_limit_initial_per_s <= self.rate_limit_max_per_s:
+            raise ValueError(
+                "Download rate limits need to satisfy 0 < DOWNLOAD_RATE_LIMIT_MIN_PER_S <= "
+                "DOWNLOAD_RATE_LIMIT_INITIAL_PER_S <= DOWNLOAD_RATE_LIMIT_MAX_PER_S."
+            )
+
+        if self.retry_backoff_base_s < 0 or self.retry_backoff_max_s < self.retry_backoff_base_s:
+            raise ValueError(
+                "DOWNLOAD_RETRY_BACKOFF_BASE_S cannot be negative or bigger than DOWNLOAD_RETRY_BACKOFF_MAX_S."
+            )
+
+        if self.circuit_breaker_failure_threshold < 1:
+            raise ValueError("DOWNLOAD_CIRCUIT_BREAKER_FAILURE_THRESHOLD needs to be at least 1.")
+
+        if self.http_pool_size < self.max_requests_in_flight_per_host:
+            logging.warning(
+                "DOWNLOAD_HTTP_POOL_SIZE is smaller than DOWNLOAD_MAX_REQUESTS_IN_FLIGHT_PER_HOST. Connections over "
+                "the pool size will be closed after each request instead of being reused."
+            )
 
 
 @dataclass(slots=True)
@@ -266,9 +419,17 @@ class Config:
     run_data_download_only: bool = bool_from_env("RUN_DATA_DOWNLOAD_ONLY", False)
     override_ids_to_download_filepath: Optional[str] = env.get("OVERRIDE_IDS_TO_DOWNLOAD_PATH")
     skip_data_download: bool = bool_from_env("SKIP_DATA_DOWNLOAD", False)
+    # mmcif and xml files are read directly from rsynced .gz files, so they are not unpacked during download
+    read_gzipped_sources: bool = bool_from_env("READ_GZIPPED_SOURCES", False)
     # data extraction
     run_data_extraction_only: bool = bool_from_env("RUN_DATA_EXTRACTION_ONLY", False)
     force_complete_data_extraction: bool = bool_from_env("FORCE_COMPLETE_DATA_EXTRACTION", False)
+    # in full run, structures are loaded by data extraction workers already during download, as soon as all their
+    # files are downloaded
+    pipelined_data_extraction: bool = bool_from_env("PIPELINED_DATA_EXTRACTION", False)
+    # protein data parsed from each source are cached, and the source is parsed again only if its files (or ligand
+    # stats it used) changed
+    use_extraction_cache: bool = bool_from_env("USE_EXTRACTION_CACHE", False)
     ids_to_remove_and_update_override_filepath: Optional[str] = env.get("IDS_TO_REMOVE_AND_UPDATE_OVERRIDE_PATH")
     # 7zip data
     run_zipping_files_only: bool = bool_from_env("RUN_ZIPPING_FILES_ONLY", False)
@@ -283,6 +444,7 @@ class Config:
     factor_hierarchy_settings: FactorHierarchyConfig = field(default_factory=FactorHierarchyConfig)
     filepaths: FilepathConfig = field(default_factory=FilepathConfig)
     timeouts: DownloadTimeoutConfig = field(default_factory=DownloadTimeoutConfig)
+    download: DownloadConfig = field(default_factory=DownloadConfig)
 
     def is_full_run(self) -> bool:
         return (
@@ -322,6 +484,7 @@ class Config:
         # transformation settings are valid
         self.factor_hierarchy_settings.validate()
         self.default_plot_settings.validate()
+        self.download.validate()
 
         # max process count is at least 1
         if self.max_process_count < 1:
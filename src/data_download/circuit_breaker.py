@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from enum import Enum
+from urllib.parse import urlsplit
+
+from src.exception import DataDownloadCircuitOpenError
+
+
+class CircuitState(Enum):
+    """
+    State of the circuit breaker.
+    """
+
+    CLOSED = "closed"  # requests pass through
+    OPEN = "open"  # requests fail immediately
+    HALF_OPEN = "half-open"  # one probing request is let through, others fail immediately
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one host. After given number of consecutive failures (connection errors, timeouts,
+    server errors) it opens, and all requests fail immediately without contacting the host. After given time
+    it lets one probing request through - if it succeeds, the circuit closes again. Safe to use from multiple
+    threads.
+    """
+
+    def __init__(self, host: str, failure_threshold: int, half_open_after_s: float):
+        self.host = host
+        self._failure_threshold = failure_threshold
+        self._half_open_after_s = half_open_after_s
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self.rejected_count = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """
+        Current state of the circuit.
+        """
+        return self._state
+
+    def before_request(self) -> None:
+        """
+        Check the request may be made.
+        :raises DataDownloadCircuitOpenError: If the circuit is open (or half-open with probe already in flight).
+        """
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return
+            if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self._half_open_after_s:
+                self._state = CircuitState.HALF_OPEN
+                logging.info("Circuit breaker for %s is half-open, probing the host.", self.host)
+                return
+            self.rejected_count += 1
+        raise DataDownloadCircuitOpenError(
+            f"Host {self.host} is considered unavailable (circuit breaker is open), request was not made."
+        )
+
+    def record_success(self) -> None:
+        """
+        Record that the host responded (with any status code that does not indicate server error).
+        """
+        with self._lock:
+            if self._state != CircuitState.CLOSED:
+                logging.warning("Host %s is available again, circuit breaker closed.", self.host)
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        """
+        Record that the request to host failed because of connection error, timeout or server error.
+        """
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self._consecutive_failures >= self._failure_threshold
+            ):
+                if self._state == CircuitState.CLOSED:
+                    logging.warning(
+                        "Host %s failed %s times in a row, circuit breaker opened. Requests to it will fail "
+                        "immediately for the next %s s.",
+                        self.host,
+                        self._consecutive_failures,
+                        self._half_open_after_s,
+                    )
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+_failure_threshold: int = 10
+_half_open_after_s: float = 60.0
+
+
+def configure_circuit_breakers(failure_threshold: int, half_open_after_s: float) -> None:
+    """
+    Set circuit breaker parameters for all hosts. Circuit breakers created so far are discarded.
+    :param failure_threshold: Number of consecutive failures after which the circuit opens.
+    :param half_open_after_s: Time after which the open circuit lets one probing request through.
+    """
+    global _failure_threshold, _half_open_after_s  # pylint: disable=global-statement
+    with _circuit_breakers_lock:
+        _failure_threshold = failure_threshold
+        _half_open_after_s = half_open_after_s
+        _circuit_breakers.clear()
+
+
+def get_circuit_breaker(address: str) -> CircuitBreaker:
+    """
+    Get circuit breaker for the host of given address.
+    :param address: Full address of the request.
+    :return: Circuit breaker shared by all requests to the same host.
+    """
+    host = urlsplit(address).netloc
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(host, _failure_threshold, _half_open_after_s)
+        return _circuit_breakers[host]
+
+
+def log_circuit_breaker_stats() -> None:
+    """
+    Log hosts for which some requests were not made because their circuit breaker was open.
+    """
+    with _circuit_breakers_lock:
+        circuit_breakers = list(_circuit_breakers.values())
+    for circuit_breaker in circuit_breakers:
+        if circuit_breaker.rejected_count > 0:
+            logging.warning(
+                "Host %s: %s requests were not made because the host was unavailable (circuit breaker %s at the "
+                "end). Their ids are stored to be retried next run.",
+                circuit_breaker.host,
+                circuit_breaker.rejected_count,
+                circuit_breaker.state.value,
+            )
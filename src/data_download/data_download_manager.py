@@ -1,13 +1,30 @@
 import logging
 import os
-from typing import Optional
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
 
 from src.config import Config
-from src.data_download.failing_ids_handler import get_failing_ids, update_failing_ids, FailedIdsSourceType
+from src.data_download.circuit_breaker import configure_circuit_breakers, log_circuit_breaker_stats
+from src.data_download.download_metrics import reset_download_metrics, save_download_metrics
+from src.data_download.failing_ids_handler import (
+    get_failing_ids, update_failing_ids, FailedIdsSourceType, RetrySchedule
+)
+from src.data_download.http_request_handler import (
+    configure_max_requests_in_flight_per_host, configure_retry_backoff
+)
+from src.data_download.http_session_handler import (
+    configure_http_session, close_http_session, log_connection_reuse_stats
+)
 from src.data_download.ids_to_download_loader import load_overriden_ids_to_download
 from src.data_download.ligand_ccd_handler import download_and_find_changed_ligand_cifs
+from src.data_download.rate_limiter import configure_rate_limiting, log_rate_limiter_stats, RateLimitSettings
 from src.data_download.rest_download import RestDataType, download_one_type_rest_files
+from src.data_download.rest_validator_store import (
+    RestValidatorStore, load_rest_validator_store, save_rest_validator_store
+)
 from src.data_download.rsync_handler import rsync_and_unzip, RsyncDataType
+from src.data_download.settled_structures_tracker import SettledStructuresTracker
 from src.exception import FileWritingError, ParsingError, DataDownloadError
 from src.generic_file_handlers.json_file_loader import load_json_file
 from src.generic_file_handlers.json_file_writer import write_json_file
@@ -17,6 +34,17 @@ from src.generic_file_handlers.simple_lock_handler import (
 from src.models.ids_to_update import IdsToUpdateAndRemove, ChangedIds
 from src.utils import ensure_folder_exists, delete_file_if_possible
 
+_REST_SOURCE_TYPES = [
+    (RestDataType.SUMMARY, FailedIdsSourceType.REST_SUMMARY),
+    (RestDataType.MOLECULES, FailedIdsSourceType.REST_MOLECULES),
+    (RestDataType.ASSEMBLY, FailedIdsSourceType.REST_ASSEMBLY),
+    (RestDataType.PUBLICATIONS, FailedIdsSourceType.REST_PUBLICATIONS),
+    (RestDataType.RELATED_PUBLICATIONS, FailedIdsSourceType.REST_RELATED_PUBLICATIONS),
+    (RestDataType.VALIDATOR_DB, FailedIdsSourceType.VALIDATOR_DB_REPORT),
+]
+_XML_VALIDATION_REPORTS_SOURCE = "xml_validation_reports"
+_LIGAND_CIFS_SOURCE = "ligand_cifs"
+
 
 class DownloadManager:
     """
@@ -38,9 +66,43 @@ class DownloadManager:
         ensure_folder_exists(config.filepaths.pdb_mmcifs, True)
         ensure_folder_exists(config.filepaths.gz_pdb_mmcifs, True)
         ensure_folder_exists(config.filepaths.ligand_cifs, True)
+        ensure_folder_exists(config.filepaths.ligand_ccd_cache, True)
         ensure_folder_exists(config.filepaths.xml_reports, True)
         ensure_folder_exists(config.filepaths.gz_xml_reports, True)
 
+    @staticmethod
+    def configure_http_layer(config: Config) -> None:
+        """
+        Configure shared http layer used by all downloads (session with connection pools, limit of requests
+        in flight, rate limiting, retry backoff and circuit breakers). Download metrics are reset.
+        :param config: App configuration.
+        """
+        reset_download_metrics()
+        configure_max_requests_in_flight_per_host(config.download.max_requests_in_flight_per_host)
+        configure_http_session(config.download.http_pool_size)
+        configure_rate_limiting(
+            RateLimitSettings(
+                initial_rate=config.download.rate_limit_initial_per_s,
+                min_rate=config.download.rate_limit_min_per_s,
+                max_rate=config.download.rate_limit_max_per_s,
+            )
+        )
+        configure_retry_backoff(config.download.retry_backoff_base_s, config.download.retry_backoff_max_s)
+        configure_circuit_breakers(
+            config.download.circuit_breaker_failure_threshold, config.download.circuit_breaker_half_open_after_s
+        )
+
+    @staticmethod
+    def log_http_stats_and_close() -> None:
+        """
+        Log statistics collected by the http layer (connection reuse, throttling, unavailable hosts) and close
+        the shared session.
+        """
+        log_connection_reuse_stats()
+        log_rate_limiter_stats()
+        log_circuit_breaker_stats()
+        close_http_session()
+
     @staticmethod
     def sync_pdbe_mmcif_via_rsync(config: Config) -> Optional[ChangedIds]:
         """
@@ -54,7 +116,10 @@ class DownloadManager:
                 RsyncDataType.ARCHIVE_MMCIF,
                 config.filepaths.gz_pdb_mmcifs,
                 config.filepaths.pdb_mmcifs,
-                config.filepaths.mmcif_rsync_log
+                config.filepaths.mmcif_rsync_log,
+                config.download.max_unpacking_workers,
+                unpack=not config.read_gzipped_sources,
+                rsync_shards=config.download.rsync_shards,
             )
             changed_ids = ChangedIds(
                 updated=rsync_log.get_successful_recieved_ids(),
@@ -69,15 +134,21 @@ class DownloadManager:
     @staticmethod
     def update_ligand_cifs(config: Config) -> ChangedIds:
         """
-        Update ligand cif files. The big ligand file is downloaded, cut into individual ligand cifs, and those
-        are saved if they are different from those already saved.
+        Update ligand cif files. The big ligand file is downloaded (only if it changed since last run), cut into
+        individual ligand cifs, and those are saved if they are different from those already saved.
         :param config: App configuration.
         :return: Recieved and deleted ligand ids.
         """
         logging.info("Starting updating of ligand (ccd) cif files.")
         try:
             changed_ids = download_and_find_changed_ligand_cifs(
-                config.filepaths.ligand_cifs, config.timeouts.ligand_cifs_timeout_s
+                config.filepaths.ligand_cifs,
+                config.filepaths.ligand_ccd_cache,
+                config.filepaths.ligand_ccd_state_json,
+                config.filepaths.ligand_cifs_manifest_json,
+                config.timeouts.ligand_cifs_timeouts_s,
+                config.download.max_ligand_cif_workers,
+                config.download.ligand_ccd_base_url,
             )
             logging.info("Updating of ligand (ccd) cif files finished successfully. Changed ids: %s", changed_ids)
             return changed_ids
@@ -97,94 +168,116 @@ class DownloadManager:
         rest_data_type: RestDataType,
         failed_ids_source_type: FailedIdsSourceType,
         resolved_failed_ids: list[str],
+        validator_store: Optional[RestValidatorStore] = None,
+        settled_tracker: Optional[SettledStructuresTracker] = None,
     ) -> None:
         """
         Download rest files for one type (summary, molecules, assembly, publications or related publications).
-        Downloads those for given ids + those with ids loaded from json holding ids that failed last time the app
-        was run. The failed ids json is then updated with ids that failed (and those previously there that
-        succeeded are removed).
+        Downloads those for given ids + those with ids loaded from json holding ids that failed previously and are
+        due to be retried (ids failing repeatedly are retried less and less often). The failed ids json is then
+        updated with ids that failed (and those previously there that succeeded are removed). Ids that were not
+        requested at all, because their host was unavailable, keep their retry schedule.
         :param config:
         :param ids_to_download:
         :param failed_ids_json:
         :param rest_data_type:
         :param failed_ids_source_type:
-        :param resolved_failed_ids:
+        :param resolved_failed_ids: List of ids where those that previously failed but now succeed (with changed
+        content) should be appended.
+        :param validator_store: Validators of previously downloaded files, used for conditional requests.
+        :param settled_tracker: If given, each id is reported to it as soon as its download finished.
         """
         if rest_data_type == RestDataType.VALIDATOR_DB:
             root_json_folder = config.filepaths.validator_db_results
+            base_url = config.download.validator_db_base_url
         else:
             root_json_folder = config.filepaths.rest_jsons
+            base_url = config.download.pdbe_rest_base_url
 
-        ids_to_retry = get_failing_ids(failed_ids_json, failed_ids_source_type)
-        failed_ids = download_one_type_rest_files(
-            set(ids_to_download + ids_to_retry),
+        retry_schedule = RetrySchedule(
+            base_interval_days=config.download.failed_ids_retry_base_interval_days,
+            max_interval_days=config.download.failed_ids_retry_max_interval_days,
+            max_retried_ids_per_run=config.download.failed_ids_max_retried_per_run,
+        )
+        ids_to_retry = get_failing_ids(
+            failed_ids_json, failed_ids_source_type, config.current_formatted_date, retry_schedule
+        )
+        attempted_ids = set(ids_to_download + ids_to_retry)
+        download_result = download_one_type_rest_files(
+            attempted_ids,
             rest_data_type,
             root_json_folder,
-            config.timeouts.rest_timeout_s,
+            config.timeouts.rest_timeouts_s,
+            config.download.max_requests_in_flight_per_host,
+            validator_store,
+            config.download.rest_batch_size,
+            base_url,
+            partial(settled_tracker.structure_source_finished, rest_data_type.value) if settled_tracker else None,
         )
 
         for previously_failed_id in ids_to_retry:
-            if previously_failed_id not in failed_ids:
+            if (
+                previously_failed_id not in download_result.failed_ids and
+                previously_failed_id not in download_result.unchanged_ids
+            ):
                 resolved_failed_ids.append(previously_failed_id)
 
-        update_failing_ids(failed_ids_json, failed_ids_source_type, failed_ids)
+        # ids not requested at all (their host was unavailable) keep their retry schedule
+        not_attempted_ids = set(download_result.not_attempted_ids)
+        update_failing_ids(
+            failed_ids_json,
+            failed_ids_source_type,
+            attempted_ids - not_attempted_ids,
+            [failed_id for failed_id in download_result.failed_ids if failed_id not in not_attempted_ids],
+            config.current_formatted_date,
+            retry_schedule,
+            not_attempted_ids,
+        )
 
     @staticmethod
     def download_rest_files(
-        config: Config, structure_ids: list[str], failed_ids_json: dict, resolved_failed_ids: list[str]
+        config: Config,
+        structure_ids: list[str],
+        failed_ids_json: dict,
+        resolved_failed_ids: list[str],
+        executor: Executor,
+        validator_store: Optional[RestValidatorStore] = None,
+        settled_tracker: Optional[SettledStructuresTracker] = None,
     ) -> None:
         """
-        Download rest files for all types (summary, molecules, assembly, publications and related publications).
-        Downloads those for given ids + those with ids loaded from json holding ids that failed last time the app
-        was run. The failed ids json is then updated with ids that failed (and those previously there that
-        succeeded are removed).
+        Download rest files for all types (summary, molecules, assembly, publications and related publications)
+        and validator db reports. Each type is downloaded as separate task on given executor, so the types are
+        downloaded concurrently (within the executor limits).
+        Downloads those for given ids + those with ids loaded from json holding ids that failed previously and are
+        due to be retried (ids failing repeatedly are retried less and less often). The failed ids json is then
+        updated with ids that failed (and those previously there that succeeded are removed). Ids that were not
+        requested at all, because their host was unavailable, keep their retry schedule.
         :param config:
         :param structure_ids:
         :param failed_ids_json:
         :param resolved_failed_ids: List of ids where those that previously failed but now succeed should be appended.
+        :param executor: Executor running the download tasks.
+        :param validator_store: Validators of previously downloaded files, used for conditional requests.
+        :param settled_tracker: If given, each id is reported to it as soon as download of its file finished.
         """
-        logging.info("Starting downloading rest files.")
-        DownloadManager.download_one_rest(
-            config,
-            structure_ids,
-            failed_ids_json,
-            RestDataType.SUMMARY,
-            FailedIdsSourceType.REST_SUMMARY,
-            resolved_failed_ids
-        )
-        DownloadManager.download_one_rest(
-            config,
-            structure_ids,
-            failed_ids_json,
-            RestDataType.MOLECULES,
-            FailedIdsSourceType.REST_MOLECULES,
-            resolved_failed_ids
-        )
-        DownloadManager.download_one_rest(
-            config,
-            structure_ids,
-            failed_ids_json,
-            RestDataType.ASSEMBLY,
-            FailedIdsSourceType.REST_ASSEMBLY,
-            resolved_failed_ids
-        )
-        DownloadManager.download_one_rest(
-            config,
-            structure_ids,
-            failed_ids_json,
-            RestDataType.PUBLICATIONS,
-            FailedIdsSourceType.REST_PUBLICATIONS,
-            resolved_failed_ids
-        )
-        DownloadManager.download_one_rest(
-            config,
-            structure_ids,
-            failed_ids_json,
-            RestDataType.RELATED_PUBLICATIONS,
-            FailedIdsSourceType.REST_RELATED_PUBLICATIONS,
-            resolved_failed_ids,
-        )
-        logging.info("Finished downloading rest files.")
+        logging.info("Starting downloading rest files and validator db reports.")
+        download_futures = [
+            executor.submit(
+                DownloadManager.download_one_rest,
+                config,
+                structure_ids,
+                failed_ids_json,
+                rest_data_type,
+                failed_ids_source_type,
+                resolved_failed_ids,
+                validator_store,
+                settled_tracker,
+            )
+            for rest_data_type, failed_ids_source_type in _REST_SOURCE_TYPES
+        ]
+        for download_future in download_futures:
+            download_future.result()
+        logging.info("Finished downloading rest files and validator db reports.")
 
     @staticmethod
     def rsync_xml_validation_files(config: Config) -> list[str]:
@@ -199,7 +292,10 @@ class DownloadManager:
                 RsyncDataType.XML_VALIDATION_REPORTS,
                 config.filepaths.gz_xml_reports,
                 config.filepaths.xml_reports,
-                config.filepaths.xml_rsync_log
+                config.filepaths.xml_rsync_log,
+                config.download.max_unpacking_workers,
+                unpack=not config.read_gzipped_sources,
+                rsync_shards=config.download.rsync_shards,
             )
             logging.info("Rsync of validation xml files finished successfully.")
             return rsync_log.get_successful_recieved_ids()
@@ -208,35 +304,26 @@ class DownloadManager:
             return []
 
     @staticmethod
-    def download_validator_db_reports(
-        config: Config, structure_ids: list[str], failed_ids_json: dict, resolved_failed_ids: list[str]
-    ) -> None:
-        """
-        Download validator db reports. Include failed ids from previous runs, and add newly failed ids to the
-        failed ids json.
-        :param config:
-        :param structure_ids:
-        :param failed_ids_json:
-        :param resolved_failed_ids:
-        """
-        logging.info("Starting downloading validator db reports.")
-        DownloadManager.download_one_rest(
-            config, structure_ids,
-            failed_ids_json,
-            RestDataType.VALIDATOR_DB,
-            FailedIdsSourceType.VALIDATOR_DB_REPORT,
-            resolved_failed_ids,
-        )
-        logging.info("Finished downloading validator db reports.")
-
-    @staticmethod
-    def download_non_mmcif_files(config: Config, structure_ids: list[str]) -> bool:
+    def download_non_mmcif_files(
+        config: Config,
+        structure_ids: list[str],
+        executor: Executor,
+        updated_xml_ids_future: Future,
+        validator_store: Optional[RestValidatorStore] = None,
+        settled_tracker: Optional[SettledStructuresTracker] = None,
+    ) -> bool:
         """
-        Download other files, based on which mmcif files were updated. This includes all rest files, vdb reports
-        and validation xmls.
+        Download other files, based on which mmcif files were updated. This includes all rest files and vdb
+        reports. Validation xmls do not depend on updated mmcifs, their rsync is already running and only its
+        result is awaited. Ids of structures with updated validation xmls (or previously failed files that are now
+        downloaded) are added to given structure ids.
         :param config:
         :param structure_ids:
-        :return:
+        :param executor: Executor running the download tasks.
+        :param updated_xml_ids_future: Future with list of structure ids with updated validation xmls.
+        :param validator_store: Validators of previously downloaded rest files, used for conditional requests.
+        :param settled_tracker: If given, each id is reported to it as soon as download of its rest file finished.
+        :return: True if failed ids json was saved successfully.
         """
         previous_failed_ids_json_ok = True
         try:
@@ -252,9 +339,16 @@ class DownloadManager:
 
         prev_failed_that_passed = []
 
-        DownloadManager.download_rest_files(config, structure_ids, failed_ids_json, prev_failed_that_passed)
-        DownloadManager.download_validator_db_reports(config, structure_ids, failed_ids_json, prev_failed_that_passed)
-        updated_xml_ids = DownloadManager.rsync_xml_validation_files(config)
+        DownloadManager.download_rest_files(
+            config,
+            list(structure_ids),
+            failed_ids_json,
+            prev_failed_that_passed,
+            executor,
+            validator_store,
+            settled_tracker,
+        )
+        updated_xml_ids = updated_xml_ids_future.result()
 
         for structure_id_list in [prev_failed_that_passed, updated_xml_ids]:
             for structure_id in structure_id_list:
@@ -284,11 +378,53 @@ class DownloadManager:
         return False
 
     @staticmethod
-    def delete_old_non_mmcif_files(config: Config, deleted_structures_ids: list[str]) -> None:
+    def start_tracking_settled_structures(
+        structure_ids: list[str],
+        updated_xml_ids_future: Future,
+        changed_ligand_ids_future: Future,
+        on_structure_settled: Callable[[str], None],
+        on_ligands_updated: Optional[Callable[[ChangedIds], None]] = None,
+    ) -> SettledStructuresTracker:
+        """
+        Start tracking which of the structures with updated mmcif files have all their other sources settled
+        (all rest files and vdb report downloaded or failed, validation xmls and ligand cifs synchronized).
+        Such structures are handed over via given callback while the download of the others still runs.
+        :param structure_ids: Ids of structures with updated mmcif files (their rsync already finished).
+        :param updated_xml_ids_future: Future of rsync of validation xmls.
+        :param changed_ligand_ids_future: Future of update of ligand cifs.
+        :param on_structure_settled: Called with id of each structure whose sources are all settled.
+        :param on_ligands_updated: If given, it is called with changed ligand ids once ligand cifs are updated,
+        before any structure is handed over.
+        :return: Tracker to report finished rest files to.
+        """
+        settled_tracker = SettledStructuresTracker(
+            structure_ids,
+            [rest_data_type.value for rest_data_type, _ in _REST_SOURCE_TYPES],
+            [_XML_VALIDATION_REPORTS_SOURCE, _LIGAND_CIFS_SOURCE],
+            on_structure_settled,
+        )
+
+        def ligand_cifs_updated(future: Future) -> None:
+            if on_ligands_updated is not None:
+                on_ligands_updated(future.result())
+            settled_tracker.source_finished(_LIGAND_CIFS_SOURCE)
+
+        # callbacks run right away if the futures are already done
+        updated_xml_ids_future.add_done_callback(
+            lambda _: settled_tracker.source_finished(_XML_VALIDATION_REPORTS_SOURCE)
+        )
+        changed_ligand_ids_future.add_done_callback(ligand_cifs_updated)
+        return settled_tracker
+
+    @staticmethod
+    def delete_old_non_mmcif_files(
+        config: Config, deleted_structures_ids: list[str], validator_store: Optional[RestValidatorStore] = None
+    ) -> None:
         """
         Removes files from other data sources (rest, vdb reports) for which the mmcif file has been deleted.
         :param config:
         :param deleted_structures_ids:
+        :param validator_store: If given, validators of the removed files are removed from it.
         """
         logging.info("Deleting files for ids that were removed from mmcifs.")
         for structure_id in deleted_structures_ids:
@@ -302,6 +438,8 @@ class DownloadManager:
             )
             # vdb file
             delete_file_if_possible(os.path.join(config.filepaths.validator_db_results, structure_id, "result.json"))
+            if validator_store is not None:
+                validator_store.remove_structure(structure_id)
         logging.info("Finished deleting files for ids that were removed from mmcifs.")
 
     @staticmethod
@@ -335,33 +473,74 @@ class DownloadManager:
             return False
 
 
-def run_data_download(config: Config) -> bool:
+def run_data_download(
+    config: Config,
+    on_structure_settled: Optional[Callable[[str], None]] = None,
+    on_ligands_updated: Optional[Callable[[ChangedIds], None]] = None,
+) -> bool:
     """
     Download new data and create files with changed pdb ids.
     :param config: Application configuration.
+    :param on_structure_settled: If given, ids of structures with updated mmcif files are handed over via this
+    callback as soon as all their other sources are settled, while the download still runs (see
+    DownloadManager.start_tracking_settled_structures). Structures updated for other reasons (e.g. updated
+    validation xml only) are not handed over, they are only in the saved changed ids.
+    :param on_ligands_updated: If given (together with on_structure_settled), it is called with changed ligand
+    ids as soon as ligand cifs are updated, before any structure is handed over.
     :return: True if action succeeded. False otherwise.
     """
     logging.info("PHASE DATA DOWNLOAD is starting")
     check_no_lock_present_preventing_download(config)
     DownloadManager.ensure_download_target_folders_exist(config)
+    DownloadManager.configure_http_layer(config)
 
+    changed_structure_ids = None
     if config.override_ids_to_download_filepath:
         changed_structure_ids = load_overriden_ids_to_download(config.override_ids_to_download_filepath)
-    else:
-        changed_structure_ids = DownloadManager.sync_pdbe_mmcif_via_rsync(config)
+        if changed_structure_ids is None:
+            return False
 
-    if changed_structure_ids is None:
-        return False
+    success = True
 
-    changed_ligand_ids = DownloadManager.update_ligand_cifs(config)
+    validator_store = None
+    if config.download.rest_conditional_requests:
+        validator_store = load_rest_validator_store(config.filepaths.download_rest_validators_json)
 
-    success = True
+    # sources that do not depend on each other are synchronized concurrently: mmcif rsync, validation xml rsync
+    # and ligand cifs start right away, rest files and vdb reports once it is known which structures changed
+    with ThreadPoolExecutor(max_workers=config.download.max_parallel_sources) as executor:
+        if changed_structure_ids is None:
+            changed_structure_ids_future = executor.submit(DownloadManager.sync_pdbe_mmcif_via_rsync, config)
+        updated_xml_ids_future = executor.submit(DownloadManager.rsync_xml_validation_files, config)
+        changed_ligand_ids_future = executor.submit(DownloadManager.update_ligand_cifs, config)
+        if changed_structure_ids is None:
+            changed_structure_ids = changed_structure_ids_future.result()
+
+        settled_tracker = None
+        if on_structure_settled is not None:
+            settled_tracker = DownloadManager.start_tracking_settled_structures(
+                list(changed_structure_ids.updated),
+                updated_xml_ids_future,
+                changed_ligand_ids_future,
+                on_structure_settled,
+                on_ligands_updated,
+            )
+        success &= DownloadManager.download_non_mmcif_files(
+            config, changed_structure_ids.updated, executor, updated_xml_ids_future, validator_store, settled_tracker
+        )
+        changed_ligand_ids = changed_ligand_ids_future.result()
+
+    if settled_tracker is not None:
+        settled_tracker.log_stats()
 
-    success &= DownloadManager.download_non_mmcif_files(config, changed_structure_ids.updated)
-    DownloadManager.delete_old_non_mmcif_files(config, changed_structure_ids.deleted)
+    DownloadManager.delete_old_non_mmcif_files(config, changed_structure_ids.deleted, validator_store)
+    if validator_store is not None:
+        save_rest_validator_store(validator_store, config.filepaths.download_rest_validators_json)
     success &= DownloadManager.save_changed_ids_into_json(config, changed_structure_ids, changed_ligand_ids)
 
     create_simple_lock_file(LockType.DATA_EXTRACTION, config.filepaths.logs_root_path)
 
+    DownloadManager.log_http_stats_and_close()
+    save_download_metrics(config.filepaths.download_metrics_json, config.filepaths.download_metrics_csv)
     logging.info("PHASE DATA DOWNLOAD finished")
     return success
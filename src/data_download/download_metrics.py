@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+import pandas as pd
+
+from src.data_download.gzip_unpacker import GunzipStats
+from src.exception import FileWritingError
+from src.generic_file_handlers.csv_handler import save_dataframe_to_csv
+from src.generic_file_handlers.json_file_writer import write_json_file
+
+# upper bounds of latency histogram buckets in milliseconds (the last bucket holds all slower requests)
+LATENCY_BUCKET_BOUNDS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+@dataclass(slots=True)
+class SourceMetrics:
+    """
+    Metrics of one download source - one http endpoint (e.g. one pdbe rest type) or rsync of one data type.
+    Times are in seconds, sizes in bytes.
+    """
+
+    request_count: int = 0
+    failed_request_count: int = 0
+    retry_count: int = 0
+    # responses that made the rate limiter slow down (429 or server error)
+    throttled_count: int = 0
+    timeout_count: int = 0
+    # time spent in requests that ended with timeout
+    timeout_blocked_s: float = 0.0
+    # time spent waiting for rate limiter, and sleeping between retries
+    rate_limit_wait_s: float = 0.0
+    retry_wait_s: float = 0.0
+    response_bytes: int = 0
+    latency_total_s: float = 0.0
+    latency_histogram: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKET_BOUNDS_MS) + 1))
+    # rsync transfer (including unpacking that overlaps with it)
+    transfer_wall_time_s: float = 0.0
+    recieved_file_count: int = 0
+    deleted_file_count: int = 0
+    # unpacking of recieved files
+    unpacked_file_count: int = 0
+    unpacking_failed_count: int = 0
+    compressed_bytes: int = 0
+    unpacked_bytes: int = 0
+    unpacking_worker_time_s: float = 0.0
+    unpacking_wall_time_s: float = 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        """
+        Return flat dictionary representation (for storing as json and csv row), with latency histogram buckets
+        and throughputs as separate items.
+        """
+        metrics_dict = {
+            "requestCount": self.request_count,
+            "failedRequestCount": self.failed_request_count,
+            "retryCount": self.retry_count,
+            "throttledCount": self.throttled_count,
+            "timeoutCount": self.timeout_count,
+            "timeoutBlockedS": round(self.timeout_blocked_s, 3),
+            "rateLimitWaitS": round(self.rate_limit_wait_s, 3),
+            "retryWaitS": round(self.retry_wait_s, 3),
+            "responseBytes": self.response_bytes,
+            "latencyMeanMs": round(self.latency_total_s * 1000 / self.request_count, 1) if self.request_count else 0.0,
+        }
+        for bucket_index, bucket_count in enumerate(self.latency_histogram):
+            metrics_dict[_get_latency_bucket_name(bucket_index)] = bucket_count
+        metrics_dict.update(
+            {
+                "transferWallTimeS": round(self.transfer_wall_time_s, 3),
+                "recievedFileCount": self.recieved_file_count,
+                "deletedFileCount": self.deleted_file_count,
+                "unpackedFileCount": self.unpacked_file_count,
+                "unpackingFailedCount": self.unpacking_failed_count,
+                "compressedBytes": self.compressed_bytes,
+                "unpackedBytes": self.unpacked_bytes,
+                "unpackingWallTimeS": round(self.unpacking_wall_time_s, 3),
+                "unpackingMBPerS": _get_mb_per_s(self.unpacked_bytes, self.unpacking_wall_time_s),
+                "unpackingMBPerSPerWorker": _get_mb_per_s(self.unpacked_bytes, self.unpacking_worker_time_s),
+            }
+        )
+        return metrics_dict
+
+
+_source_metrics: dict[str, SourceMetrics] = {}
+_source_metrics_lock = threading.Lock()
+
+
+def reset_download_metrics() -> None:
+    """
+    Discard all metrics collected so far (should be called before the download starts).
+    """
+    with _source_metrics_lock:
+        _source_metrics.clear()
+
+
+def record_request(
+    source: str,
+    latency_s: float,
+    status_code: Optional[int],
+    failed: bool,
+    response_bytes: int = 0,
+    timed_out: bool = False,
+    throttled: bool = False,
+) -> None:
+    """
+    Record one http request.
+    :param source: Source name (endpoint).
+    :param latency_s: Time from sending the request until the response (its headers for streamed responses).
+    :param status_code: Status code of the response, None if there was no response.
+    :param failed: True if the request failed (unexpected status code, connection error, timeout...).
+    :param response_bytes: Size of the response body, if it was already read.
+    :param timed_out: True if the request failed on timeout.
+    :param throttled: True if the response made the rate limiter slow down (429 or server error).
+    """
+    with _source_metrics_lock:
+        metrics = _get_source_metrics_unsafe(source)
+        metrics.request_count += 1
+        metrics.latency_total_s += latency_s
+        metrics.latency_histogram[_get_latency_bucket_index(latency_s)] += 1
+        metrics.response_bytes += response_bytes
+        if failed:
+            metrics.failed_request_count += 1
+        if throttled:
+            metrics.throttled_count += 1
+        if timed_out:
+            metrics.timeout_count += 1
+            metrics.timeout_blocked_s += latency_s
+
+
+def record_response_bytes(source: str, response_bytes: int) -> None:
+    """
+    Record size of streamed response body read after the request was recorded.
+    :param source: Source name (endpoint).
+    :param response_bytes:
+    """
+    with _source_metrics_lock:
+        _get_source_metrics_unsafe(source).response_bytes += response_bytes
+
+
+def record_rate_limit_wait(source: str, wait_s: float) -> None:
+    """
+    Record time a request waited for the rate limiter.
+    :param source: Source name (endpoint).
+    :param wait_s:
+    """
+    with _source_metrics_lock:
+        _get_source_metrics_unsafe(source).rate_limit_wait_s += wait_s
+
+
+def record_retry(source: str, wait_s: float) -> None:
+    """
+    Record retry of failed request.
+    :param source: Source name (endpoint).
+    :param wait_s: Time slept before the retry.
+    """
+    with _source_metrics_lock:
+        metrics = _get_source_metrics_unsafe(source)
+        metrics.retry_count += 1
+        metrics.retry_wait_s += wait_s
+
+
+def record_rsync(
+    source: str,
+    wall_time_s: float,
+    recieved_file_count: int,
+    deleted_file_count: int,
+    gunzip_stats: Optional[GunzipStats] = None,
+) -> None:
+    """
+    Record rsync of one data type and unpacking of the recieved files.
+    :param source: Source name (rsync data type).
+    :param wall_time_s: Time the rsync (with unpacking) took.
+    :param recieved_file_count:
+    :param deleted_file_count:
+    :param gunzip_stats: Aggregated results of unpacking, if files were unpacked.
+    """
+    with _source_metrics_lock:
+        metrics = _get_source_metrics_unsafe(source)
+        metrics.transfer_wall_time_s += wall_time_s
+        metrics.recieved_file_count += recieved_file_count
+        metrics.deleted_file_count += deleted_file_count
+        if gunzip_stats is not None:
+            metrics.unpacked_file_count += gunzip_stats.file_count
+            metrics.unpacking_failed_count += gunzip_stats.failed_count
+            metrics.compressed_bytes += gunzip_stats.compressed_size
+            metrics.unpacked_bytes += gunzip_stats.unpacked_size
+            metrics.unpacking_worker_time_s += gunzip_stats.duration_s
+            metrics.unpacking_wall_time_s += gunzip_stats.wall_time_s
+
+
+def get_download_metrics() -> dict[str, SourceMetrics]:
+    """
+    Get copy of metrics collected so far.
+    :return: Metrics by source name.
+    """
+    with _source_metrics_lock:
+        return {
+            source: replace(metrics, latency_histogram=list(metrics.latency_histogram))
+            for source, metrics in _source_metrics.items()
+        }
+
+
+def save_download_metrics(json_path: str, csv_path: str) -> None:
+    """
+    Save metrics of all sources as json (source name -> metrics) and csv (one row per source). Their folders
+    are created if they do not exist yet. Errors are only logged, as the metrics are not needed for further
+    processing.
+    :param json_path:
+    :param csv_path:
+    """
+    metrics_by_source = {source: metrics.as_dict() for source, metrics in sorted(get_download_metrics().items())}
+    try:
+        for folder_path in {os.path.dirname(json_path), os.path.dirname(csv_path)} - {""}:
+            os.makedirs(folder_path, exist_ok=True)
+        write_json_file(json_path, metrics_by_source)
+        save_dataframe_to_csv(
+            pd.DataFrame([{"source": source, **metrics} for source, metrics in metrics_by_source.items()]), csv_path
+        )
+        logging.info("Download metrics saved into %s and %s.", json_path, csv_path)
+    except (FileWritingError, OSError) as ex:
+        logging.warning("Failed to save download metrics: %s", ex)
+
+
+def _get_source_metrics_unsafe(source: str) -> SourceMetrics:
+    if source not in _source_metrics:
+        _source_metrics[source] = SourceMetrics()
+    return _source_metrics[source]
+
+
+def _get_latency_bucket_index(latency_s: float) -> int:
+    latency_ms = latency_s * 1000
+    for bucket_index, bucket_bound_ms in enumerate(LATENCY_BUCKET_BOUNDS_MS):
+        if latency_ms <= bucket_bound_ms:
+            return bucket_index
+    return len(LATENCY_BUCKET_BOUNDS_MS)
+
+
+def _get_latency_bucket_name(bucket_index: int) -> str:
+    if bucket_index < len(LATENCY_BUCKET_BOUNDS_MS):
+        return f"latencyUpTo{LATENCY_BUCKET_BOUNDS_MS[bucket_index]}Ms"
+    return f"latencyOver{LATENCY_BUCKET_BOUNDS_MS[-1]}Ms"
+
+
+def _get_mb_per_s(size_bytes: int, duration_s: float) -> float:
+    return round(size_bytes / 1_000_000 / duration_s, 2) if duration_s > 0 else 0.0
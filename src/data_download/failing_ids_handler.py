@@ -1,4 +1,10 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from enum import Enum
+from typing import Iterable, Optional
+
+_DATE_FORMAT = "%Y%m%d"
 
 
 class FailedIdsSourceType(Enum):
@@ -14,31 +20,124 @@ class FailedIdsSourceType(Enum):
     VALIDATOR_DB_REPORT = "ValidatorDbReport"
 
 
-def get_failing_ids(failed_ids_json: dict, data_type: FailedIdsSourceType) -> list[str]:
+@dataclass(slots=True)
+class RetrySchedule:
+    """
+    Settings of retrying ids that failed to download. Id that failed n times in a row is retried after
+    base interval * 2^(n-1) days (but at most after max interval).
+    """
+
+    base_interval_days: int = 1
+    max_interval_days: int = 32
+    # maximum number of failed ids of one source type retried in one run, 0 means no limit
+    max_retried_ids_per_run: int = 0
+
+
+def get_failing_ids(
+    failed_ids_json: dict, data_type: FailedIdsSourceType, current_date: str, retry_schedule: RetrySchedule
+) -> list[str]:
     """
-    Get list of failing ids from last time concerning given data type.
+    Get list of failing ids concerning given data type that should be retried this run (their next attempt date
+    is not in the future). If there are more of them than the schedule allows, those that failed fewer times
+    are retried first.
     :param failed_ids_json:
     :param data_type:
+    :param current_date: Date of the run, in format 20240101.
+    :param retry_schedule:
     :return: List of strings representing failed ids.
     """
-    return list(failed_ids_json.get(data_type.value, {}).keys())
+    failed_id_entries = _get_failed_id_entries(failed_ids_json, data_type)
+    ids_to_retry = sorted(
+        (
+            failed_id
+            for failed_id, failed_id_entry in failed_id_entries.items()
+            if failed_id_entry["nextAttemptDate"] is None or failed_id_entry["nextAttemptDate"] <= current_date
+        ),
+        key=lambda failed_id: (failed_id_entries[failed_id]["failedCount"], failed_id),
+    )
+    if 0 < retry_schedule.max_retried_ids_per_run < len(ids_to_retry):
+        logging.info(
+            "%s: %s failed ids are due to be retried, only %s of them (those that failed fewest times) are retried "
+            "this run.",
+            data_type.value,
+            len(ids_to_retry),
+            retry_schedule.max_retried_ids_per_run,
+        )
+        ids_to_retry = ids_to_retry[:retry_schedule.max_retried_ids_per_run]
+    logging.debug(
+        "%s: retrying %s failed ids, %s are postponed.",
+        data_type.value,
+        len(ids_to_retry),
+        len(failed_id_entries) - len(ids_to_retry),
+    )
+    return ids_to_retry
 
 
 def update_failing_ids(
-    failed_ids_json: dict, data_type: FailedIdsSourceType, failed_ids: list[str]
+    failed_ids_json: dict,
+    data_type: FailedIdsSourceType,
+    attempted_ids: Iterable[str],
+    failed_ids: list[str],
+    current_date: str,
+    retry_schedule: RetrySchedule,
+    not_attempted_ids: Iterable[str] = (),
 ) -> None:
     """
-    Update failing ids json for given data type and given failed ids. Entries with ids that are not present in failed
-    ids this time are removed from the json as well. Pass empty failed ids to remove all.
+    Update failing ids json for given data type and given failed ids. Entries with ids that were attempted and
+    did not fail this time are removed from the json. Entries with ids that were not attempted this time are kept
+    as they are. Failed ids get their failed count increased and their next attempt date postponed.
     :param failed_ids_json: Loaded json with failing ids from download json.
     :param data_type: Type of data to update.
+    :param attempted_ids: Ids whose download was attempted this time.
     :param failed_ids: List of ids that failed this time.
+    :param current_date: Date of the run, in format 20240101.
+    :param retry_schedule:
+    :param not_attempted_ids: Ids that were to be downloaded, but no request was made (e.g. their host was
+    considered unavailable). Their entries are kept as they are, those without entry are added to be retried
+    next run.
     """
-    updated_id_group = {}
+    failed_id_entries = _get_failed_id_entries(failed_ids_json, data_type)
+    attempted_ids = set(attempted_ids)
+    updated_id_group = {
+        failed_id: failed_id_entry
+        for failed_id, failed_id_entry in failed_id_entries.items()
+        if failed_id not in attempted_ids
+    }
 
     for failed_id in failed_ids:
-        failed_count = failed_ids_json.get(data_type.value, {}).get(failed_id, 0)
-        failed_count += 1
-        updated_id_group[failed_id] = failed_count
+        failed_count = failed_id_entries.get(failed_id, {}).get("failedCount", 0) + 1
+        updated_id_group[failed_id] = {
+            "failedCount": failed_count,
+            "nextAttemptDate": _get_next_attempt_date(current_date, failed_count, retry_schedule),
+        }
+    for not_attempted_id in not_attempted_ids:
+        updated_id_group.setdefault(
+            not_attempted_id, failed_id_entries.get(not_attempted_id, {"failedCount": 0, "nextAttemptDate": None})
+        )
 
     failed_ids_json[data_type.value] = updated_id_group
+
+
+def _get_failed_id_entries(failed_ids_json: dict, data_type: FailedIdsSourceType) -> dict[str, dict]:
+    # older version of the json held only the failed count, such ids are retried right away
+    return {
+        failed_id: _migrate_failed_id_entry(failed_id_entry)
+        for failed_id, failed_id_entry in failed_ids_json.get(data_type.value, {}).items()
+    }
+
+
+def _migrate_failed_id_entry(failed_id_entry: int | dict) -> dict[str, Optional[int | str]]:
+    if isinstance(failed_id_entry, dict):
+        return {
+            "failedCount": failed_id_entry.get("failedCount", 0),
+            "nextAttemptDate": failed_id_entry.get("nextAttemptDate"),
+        }
+    return {"failedCount": failed_id_entry, "nextAttemptDate": None}
+
+
+def _get_next_attempt_date(current_date: str, failed_count: int, retry_schedule: RetrySchedule) -> str:
+    interval_days = min(
+        retry_schedule.base_interval_days * 2 ** min(failed_count - 1, 32), retry_schedule.max_interval_days
+    )
+    next_attempt_date = datetime.strptime(current_date, _DATE_FORMAT) + timedelta(days=interval_days)
+    return next_attempt_date.strftime(_DATE_FORMAT)
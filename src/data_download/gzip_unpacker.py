@@ -0,0 +1,131 @@
+import gzip
+import logging
+import shutil
+import time
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Optional
+
+# faster drop-in replacements of gzip module are used if installed (python-isal, then zlib-ng)
+try:
+    from isal import igzip as _fast_gzip
+except ImportError:
+    try:
+        from zlib_ng import gzip_ng as _fast_gzip
+    except ImportError:
+        _fast_gzip = None
+
+_BUFFER_SIZE = 1024 * 1024
+
+
+@dataclass(slots=True)
+class GunzipResult:
+    """
+    Result of unpacking one file.
+    """
+
+    compressed_size: int = 0
+    unpacked_size: int = 0
+    duration_s: float = 0.0
+    error: Optional[str] = None
+    # wall clock time (comparable between worker processes) when the unpacking started
+    started_at: Optional[float] = None
+
+
+@dataclass(slots=True)
+class GunzipStats:
+    """
+    Aggregated results of unpacking multiple files.
+    """
+
+    file_count: int = 0
+    failed_count: int = 0
+    compressed_size: int = 0
+    unpacked_size: int = 0
+    duration_s: float = 0.0
+    # wall clock times when the first unpacking started and the last one finished
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def wall_time_s(self) -> float:
+        """
+        Time from the start of the first unpacking to the end of the last one.
+        """
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    def add(self, gunzip_result: GunzipResult) -> None:
+        """
+        Add result of one unpacked file.
+        :param gunzip_result:
+        """
+        self.file_count += 1
+        if gunzip_result.error is not None:
+            self.failed_count += 1
+        self.compressed_size += gunzip_result.compressed_size
+        self.unpacked_size += gunzip_result.unpacked_size
+        self.duration_s += gunzip_result.duration_s
+        if gunzip_result.started_at is not None:
+            finished_at = gunzip_result.started_at + gunzip_result.duration_s
+            if self.started_at is None or gunzip_result.started_at < self.started_at:
+                self.started_at = gunzip_result.started_at
+            if self.finished_at is None or finished_at > self.finished_at:
+                self.finished_at = finished_at
+
+    def log(self) -> None:
+        """
+        Log the statistics, including throughput in MB/s (of unpacked data).
+        """
+        if self.file_count == 0:
+            return
+        wall_time_s = self.wall_time_s
+        unpacked_mb = self.unpacked_size / 1_000_000
+        logging.info(
+            "Unpacked %s files (%s failed) using %s: %.1f MB from %.1f MB in %.1f s, %.1f MB/s overall, "
+            "%.1f MB/s per worker.",
+            self.file_count,
+            self.failed_count,
+            get_gzip_backend_name(),
+            unpacked_mb,
+            self.compressed_size / 1_000_000,
+            wall_time_s,
+            unpacked_mb / wall_time_s if wall_time_s > 0 else 0.0,
+            unpacked_mb / self.duration_s if self.duration_s > 0 else 0.0,
+        )
+
+
+def get_gzip_backend_name() -> str:
+    """
+    Get name of the module used for unpacking.
+    :return: Module name.
+    """
+    return _get_gzip_module().__name__
+
+
+def gunzip_file(gz_filepath: str, unpacked_filepath: str) -> GunzipResult:
+    """
+    Unpack gz file. Errors are returned in the result, not raised, as this runs in worker process.
+    :param gz_filepath:
+    :param unpacked_filepath:
+    :return: Result with sizes of the files and duration, or with error message if the unpacking failed.
+    """
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        with open(gz_filepath, "rb", buffering=_BUFFER_SIZE) as compressed_file:
+            with _get_gzip_module().open(compressed_file, "rb") as input_file:
+                with open(unpacked_filepath, "wb", buffering=_BUFFER_SIZE) as output_file:
+                    shutil.copyfileobj(input_file, output_file, _BUFFER_SIZE)
+                    unpacked_size = output_file.tell()
+            compressed_size = compressed_file.tell()
+    except (OSError, EOFError) as ex:
+        return GunzipResult(
+            duration_s=time.perf_counter() - start, error=f"Failed to unpack gz file: {ex}", started_at=started_at
+        )
+    return GunzipResult(compressed_size, unpacked_size, time.perf_counter() - start, started_at=started_at)
+
+
+def _get_gzip_module() -> ModuleType:
+    return _fast_gzip if _fast_gzip is not None else gzip
@@ -1,11 +1,59 @@
 import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional, Union
+from urllib.parse import urlsplit
 
 import requests
 
-from src.exception import DataDownloadError
+from src.data_download.circuit_breaker import get_circuit_breaker
+from src.data_download.download_metrics import (
+    record_request, record_rate_limit_wait, record_response_bytes, record_retry
+)
+from src.data_download.http_session_handler import get_http_session
+from src.data_download.rate_limiter import get_rate_limiter, get_endpoint_name
+from src.exception import DataDownloadError, DataDownloadHttpError, DataDownloadCircuitOpenError
 
+# timeout in seconds, either one value or tuple of connect and read timeouts
+Timeout = Union[float, tuple[float, float]]
 
-def get_response_json(address: str, get_timeout_s: int, retry_attempts: int = 0) -> dict:
+_host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+_max_requests_in_flight_per_host: int = 1
+_retry_backoff_base_s: float = 1.0
+_retry_backoff_max_s: float = 60.0
+# status codes after which it makes sense to try again (other 4xx mean the resource is not there)
+_RETRYABLE_STATUS_CODES = {408, 429}
+
+
+def configure_max_requests_in_flight_per_host(max_requests_in_flight: int) -> None:
+    """
+    Set how many requests can be in flight to one host at the same time (across all threads). Limits of already
+    contacted hosts are discarded, so this should be called before the download starts.
+    :param max_requests_in_flight: Maximum number of concurrent requests to one host.
+    """
+    global _max_requests_in_flight_per_host  # pylint: disable=global-statement
+    with _host_semaphores_lock:
+        _max_requests_in_flight_per_host = max_requests_in_flight
+        _host_semaphores.clear()
+
+
+def configure_retry_backoff(base_s: float, max_s: float) -> None:
+    """
+    Set the exponential backoff used between retries. Delay before n-th retry is random value (jitter) between
+    0 and min(max_s, base_s * 2^n).
+    :param base_s: Base of the delay in seconds.
+    :param max_s: Maximum delay in seconds.
+    """
+    global _retry_backoff_base_s, _retry_backoff_max_s  # pylint: disable=global-statement
+    _retry_backoff_base_s = base_s
+    _retry_backoff_max_s = max_s
+
+
+def get_response_json(address: str, get_timeout_s: Timeout, retry_attempts: int = 0) -> dict:
     """
     Make a request to given address, check status code and return json in response.
     :param address: Full endpoint address.
@@ -14,34 +62,214 @@ def get_response_json(address: str, get_timeout_s: int, retry_attempts: int = 0)
     :return: Response as json.
     :raises DataDownloadError: If the response isn't status code 200 or if the content isn't json.
     """
+    return get_response_with_retries(address, get_timeout_s, retry_attempts).json()
+
+
+def get_response_with_retries(
+    address: str,
+    get_timeout_s: Timeout,
+    retry_attempts: int = 0,
+    headers: Optional[dict[str, str]] = None,
+    stream: bool = False,
+    data: Optional[str] = None,
+) -> requests.Response:
+    """
+    Make a request to given address, check status code and return its response. Retry on failure, with
+    exponential backoff and jitter between attempts (or after time the server asked for in Retry-After).
+    :param address: Full endpoint address.
+    :param get_timeout_s: Timeout for GET request in seconds.
+    :param retry_attempts: Times to retry.
+    :param headers: Additional request headers. If they contain conditional headers (If-None-Match,
+    If-Modified-Since), response with status 304 Not Modified is returned as well.
+    :param stream: If True, the response body is not downloaded immediately, but can be iterated over. Only
+    the request itself is retried then, not the reading of the body.
+    :param data: If given, POST request with this body is made instead of GET.
+    :return: Response object.
+    :raises DataDownloadError: If the response isn't status code 200 (or 304 for conditional request) in
+    any of the attempts. Requests that failed with status code that does not indicate temporary problem
+    (e.g. 404) are not retried.
+    """
     attempt_number = 0
-    last_exception = None
 
-    while attempt_number <= retry_attempts:
+    while True:
         try:
-            return get_response(address, get_timeout_s).json()
+            return get_response(address, get_timeout_s, stream=stream, headers=headers, data=data)
         except DataDownloadError as ex:
             logging.info("Download attempt #%s failed. %s", attempt_number + 1, ex)
-            last_exception = ex
+            if attempt_number >= retry_attempts or not _is_retryable(ex):
+                raise
+            retry_delay_s = _get_retry_delay_s(attempt_number, ex)
+            record_retry(get_endpoint_name(address), retry_delay_s)
+            time.sleep(retry_delay_s)
         attempt_number += 1
 
-    raise last_exception
+
+def iter_response_content(response: requests.Response, address: str, chunk_size: int) -> Iterator[bytes]:
+    """
+    Iterate over body of streamed response, recording its size into download metrics of the endpoint.
+    :param response: Streamed response (see get_response).
+    :param address: Address the request was made to.
+    :param chunk_size: Size of the chunks in bytes.
+    :return: Iterator over the body chunks.
+    """
+    body_size = 0
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            body_size += len(chunk)
+            yield chunk
+    finally:
+        record_response_bytes(get_endpoint_name(address), body_size)
 
 
-def get_response(address: str, get_timeout_s: int) -> requests.Response:
+def get_response(
+    address: str,
+    get_timeout_s: Timeout,
+    stream: bool = False,
+    headers: Optional[dict[str, str]] = None,
+    data: Optional[str] = None,
+) -> requests.Response:
     """
-    Make a request to given address, check status code and return its response.
+    Make a request to given address, check status code and return its response. The request is made through
+    the shared http session (reusing pooled connections), the number of requests in flight to the same host
+    is limited (see configure_max_requests_in_flight_per_host) and the request rate to the endpoint is limited
+    by adaptive rate limiter (slowing down when the server responds with 429 or 5xx).
     :param address: Full endpoint address.
-    :param get_timeout_s: Timeout for GET request in seconds.
+    :param get_timeout_s: Timeout for GET request in seconds. Either one number, or tuple of connect and read
+    timeouts.
+    :param stream: If True, the response body is not downloaded immediately, but can be iterated over.
+    :param headers: Additional request headers. If they contain conditional headers (If-None-Match,
+    If-Modified-Since), response with status 304 Not Modified is returned as well.
+    :param data: If given, POST request with this body is made instead of GET.
     :return: Response object.
-    :raises DataDownloadError: If the response isn't status code 200 or other error.
+    :raises DataDownloadError: If the response isn't status code 200 (or 304 for conditional request) or other error.
+    Requests to hosts that failed repeatedly are not made at all, DataDownloadCircuitOpenError is raised instead
+    (see circuit_breaker).
     """
+    method = "GET" if data is None else "POST"
+    accepted_status_codes = [200]
+    if headers and ("If-None-Match" in headers or "If-Modified-Since" in headers):
+        accepted_status_codes.append(304)
+
+    circuit_breaker = get_circuit_breaker(address)
+    circuit_breaker.before_request()
+    rate_limiter = get_rate_limiter(address)
+    endpoint_name = get_endpoint_name(address)
+    rate_limiter_wait_start = time.perf_counter()
+    rate_limiter.acquire()
+    record_rate_limit_wait(endpoint_name, time.perf_counter() - rate_limiter_wait_start)
+    circuit_breaker_outcome_recorded = False
     try:
-        response = requests.get(address, timeout=get_timeout_s)
-        if response.status_code != 200:
-            raise DataDownloadError(
-                f"GET {address} failed with status code {response.status_code}, content '{response.content}'."
+        with _get_host_semaphore(address):
+            request_start = time.perf_counter()
+            try:
+                if data is None:
+                    response = get_http_session().get(address, timeout=get_timeout_s, stream=stream, headers=headers)
+                else:
+                    response = get_http_session().post(
+                        address, data=data, timeout=get_timeout_s, stream=stream, headers=headers
+                    )
+            except requests.exceptions.RequestException as ex:
+                record_request(
+                    endpoint_name,
+                    time.perf_counter() - request_start,
+                    None,
+                    failed=True,
+                    timed_out=isinstance(ex, requests.exceptions.Timeout),
+                )
+                raise
+        throttled = response.status_code == 429 or response.status_code >= 500
+        record_request(
+            endpoint_name,
+            time.perf_counter() - request_start,
+            response.status_code,
+            failed=response.status_code not in accepted_status_codes,
+            response_bytes=0 if stream else len(response.content),
+            throttled=throttled,
+        )
+        if response.status_code >= 500:
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.record_success()
+        circuit_breaker_outcome_recorded = True
+        if response.status_code not in accepted_status_codes:
+            retry_after_s = _parse_retry_after(response.headers.get("Retry-After"))
+            if throttled:
+                rate_limiter.record_throttling(retry_after_s)
+            raise DataDownloadHttpError(
+                f"{method} {address} failed with status code {response.status_code}, content '{response.content}'.",
+                response.status_code,
+                retry_after_s,
             )
+        rate_limiter.record_success()
         return response
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+        raise DataDownloadError(f"{method} {address} failed: {ex}") from ex
     except requests.exceptions.RequestException as ex:
-        raise DataDownloadError(f"GET {address} failed.") from ex
+        raise DataDownloadError(f"{method} {address} failed.") from ex
+    finally:
+        if not circuit_breaker_outcome_recorded:
+            # any other error (e.g. too many redirects) counts as failure too, so that half-open circuit whose
+            # probe request failed does not stay half-open (rejecting all requests) forever
+            circuit_breaker.record_failure()
+
+
+def _get_host_semaphore(address: str) -> threading.BoundedSemaphore:
+    """
+    Get semaphore limiting requests in flight for the host of given address. It is created on first use.
+    :param address: Full endpoint address.
+    :return: Semaphore shared by all requests to the same host.
+    """
+    host = urlsplit(address).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(_max_requests_in_flight_per_host)
+        return _host_semaphores[host]
+
+
+def _is_retryable(exception: DataDownloadError) -> bool:
+    """
+    Decide whether failed request should be retried.
+    :param exception: Exception the request failed with.
+    :return: True for connection issues, timeouts, throttling and server errors. False otherwise (including
+    requests not made because the host is considered unavailable).
+    """
+    if isinstance(exception, DataDownloadCircuitOpenError):
+        return False
+    if isinstance(exception, DataDownloadHttpError):
+        return exception.status_code in _RETRYABLE_STATUS_CODES or exception.status_code >= 500
+    return True
+
+
+def _get_retry_delay_s(attempt_number: int, exception: DataDownloadError) -> float:
+    """
+    Get delay before next attempt: exponential backoff with full jitter, but at least as long as the server
+    asked for in Retry-After header.
+    :param attempt_number: Number of the failed attempt (starting with 0).
+    :param exception: Exception the request failed with.
+    :return: Delay in seconds.
+    """
+    delay_s = random.uniform(0, min(_retry_backoff_max_s, _retry_backoff_base_s * 2 ** attempt_number))
+    if isinstance(exception, DataDownloadHttpError) and exception.retry_after_s:
+        delay_s = max(delay_s, exception.retry_after_s)
+    return delay_s
+
+
+def _parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    """
+    Parse value of Retry-After header, which is either number of seconds or http date.
+    :param retry_after: Header value.
+    :return: Number of seconds to wait, or None if header is not present or invalid.
+    """
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
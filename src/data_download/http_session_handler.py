@@ -0,0 +1,86 @@
+import logging
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_pool_size: int = 10
+# number of hosts whose connection pools are kept alive at once (ebi, validator db, wwpdb + reserve)
+_POOLED_HOST_COUNT = 10
+
+
+def configure_http_session(pool_size: int) -> None:
+    """
+    Set the size of the connection pool kept for each host. The currently shared session (if any) is closed,
+    and a new one with the given pool size is created on next use.
+    :param pool_size: Maximum number of keep-alive connections kept open for one host.
+    """
+    global _pool_size  # pylint: disable=global-statement
+    with _session_lock:
+        _pool_size = pool_size
+        _close_session_unsafe()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Get the shared http session. It keeps connection pool per host, so subsequent requests to the same host
+    reuse already established (keep-alive) connections instead of doing new TCP and TLS handshake.
+    The session is shared across threads.
+    :return: Shared session.
+    """
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            _session = _create_session(_pool_size)
+        return _session
+
+
+def close_http_session() -> None:
+    """
+    Close the shared session and all its pooled connections.
+    """
+    with _session_lock:
+        _close_session_unsafe()
+
+
+def log_connection_reuse_stats() -> None:
+    """
+    Log, for every host contacted via the shared session, how many requests were made and how many connections
+    had to be opened for them.
+    """
+    with _session_lock:
+        if _session is None:
+            return
+        # the same adapter is mounted for both http and https, so deduplicate them
+        pool_managers = list({id(adapter): adapter.poolmanager for adapter in _session.adapters.values()}.values())
+
+    for pool_manager in pool_managers:
+        for pool_key in pool_manager.pools.keys():
+            connection_pool = pool_manager.pools.get(pool_key)
+            if connection_pool is None or connection_pool.num_requests == 0:
+                continue
+            logging.info(
+                "Host %s: %s requests over %s connections (%s requests reused existing connection).",
+                connection_pool.host,
+                connection_pool.num_requests,
+                connection_pool.num_connections,
+                connection_pool.num_requests - connection_pool.num_connections,
+            )
+
+
+def _create_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=_POOLED_HOST_COUNT, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _close_session_unsafe() -> None:
+    global _session  # pylint: disable=global-statement
+    if _session is not None:
+        _session.close()
+        _session = None
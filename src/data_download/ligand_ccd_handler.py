@@ -1,132 +1,363 @@
+import hashlib
 import logging
 import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Generator
+from typing import Generator, Optional
 
-import requests
+from requests import RequestException
 
-from src.exception import DataDownloadError, FileWritingError
-from src.generic_file_handlers.plain_file_handler import write_file
+from src.data_download.http_request_handler import get_response, iter_response_content, Timeout
+from src.exception import DataDownloadError, FileWritingError, ParsingError
+from src.generic_file_handlers.json_file_loader import load_json_file
+from src.generic_file_handlers.json_file_writer import write_json_file
+from src.generic_file_handlers.plain_file_handler import write_binary_file, AtomicFileWriter
 from src.models.ids_to_update import ChangedIds
-from src.utils import find_matching_files, compare_file_and_string
+from src.utils import find_matching_files, file_hash
+
+# source files are processed in this order, ligand from the first one takes precedence
+_CCD_SOURCE_NAMES = ["components.cif", "aa-variants-v1.cif"]
+_DEFAULT_CCD_BASE_URL = "https://files.wwpdb.org/pub/pdb/data/monomers"
+_CCD_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+_CCD_SPLIT_CHUNK_SIZE = 4 * 1024 * 1024
+_LIGAND_CIF_HEADER = b"data_"
+_LIGAND_CIF_BOUNDARY = b"\n" + _LIGAND_CIF_HEADER
+# how many ligand cifs per worker may wait to be hashed and saved, before splitting waits for them
+_PENDING_LIGAND_CIFS_PER_WORKER = 16
 
 
 @dataclass
 class OneLigandCifContent:
     """
-    One ligand id and .cif content.
+    One ligand id and .cif content. The content is a view into a bigger chunk of the ccd source file.
     """
 
     ligand_id: str
-    content: str
+    content: memoryview
+
+
+@dataclass
+class CcdSourceState:
+    """
+    State of one downloaded ccd source file (e.g. components.cif). Etag and last modified are taken from
+    the response headers, downloaded hash identifies the file in local cache, processed hash identifies
+    the file that was last successfully split into ligand cifs.
+    """
 
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    downloaded_hash: Optional[str] = None
+    processed_hash: Optional[str] = None
 
-def download_and_find_changed_ligand_cifs(ligand_cifs_folder_path: str, download_timeout_s: int) -> ChangedIds:
+    def as_conditional_request_headers(self) -> dict[str, str]:
+        """
+        Get headers for conditional GET request, which makes the server respond with 304 Not Modified
+        if the file did not change.
+        :return: Dictionary with headers (empty if there is no etag or last modified).
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_dict(self) -> dict[str, Optional[str]]:
+        """
+        Return dictionary representation for storing as a json.
+        """
+        return {
+            "etag": self.etag,
+            "lastModified": self.last_modified,
+            "downloadedHash": self.downloaded_hash,
+            "processedHash": self.processed_hash,
+        }
+
+    @staticmethod
+    def from_dict(state_json: dict) -> "CcdSourceState":
+        """
+        Create instance from loaded json.
+        :param state_json:
+        """
+        return CcdSourceState(
+            etag=state_json.get("etag"),
+            last_modified=state_json.get("lastModified"),
+            downloaded_hash=state_json.get("downloadedHash"),
+            processed_hash=state_json.get("processedHash"),
+        )
+
+
+def download_and_find_changed_ligand_cifs(
+    ligand_cifs_folder_path: str,
+    ccd_cache_folder_path: str,
+    ccd_state_json_path: str,
+    ligand_cifs_manifest_json_path: str,
+    download_timeout_s: Timeout,
+    max_workers: int = 1,
+    ccd_base_url: str = _DEFAULT_CCD_BASE_URL,
+) -> ChangedIds:
     """
     Find changed ligand cif files. Delete or update the files for them, and return lists of those
     updated and deleted.
+
+    Ccd source files are downloaded into local cache with conditional requests. If none of them changed
+    since they were last successfully split into ligand cifs, nothing else is done and empty changed ids
+    are returned. If splitting fails (or any ligand cif fails to be saved), it is resumed from the cached files
+    next run, without downloading them again.
+
+    Downloaded ligand cifs are compared to the stored ones by their hashes kept in manifest json, so that
+    the stored files do not need to be read. If the manifest is missing or does not match the stored files,
+    hashes of the files missing in it are calculated from the files. Ligand cifs are hashed and saved by
+    a pool of worker threads, while the ccd source files are being split.
     :param ligand_cifs_folder_path:
-    :param download_timeout_s:
+    :param ccd_cache_folder_path: Folder where the downloaded ccd source files are kept.
+    :param ccd_state_json_path: Json with state of the downloaded and processed ccd source files.
+    :param ligand_cifs_manifest_json_path: Json with hashes of stored ligand cif files.
+    :param download_timeout_s: Timeout for the download (or tuple of connect and read timeout).
+    :param max_workers: Number of threads hashing and saving ligand cifs.
+    :param ccd_base_url: Base url from which the ccd source files are downloaded.
     :return: Changed ids.
+    :raises DataDownloadError: If any of the ccd source files cannot be downloaded or split.
     """
+    ccd_state = _load_ccd_state(ccd_state_json_path)
+    cached_filepaths = []
+    for source_name in _CCD_SOURCE_NAMES:
+        source_state = ccd_state.setdefault(source_name, CcdSourceState())
+        cached_filepath = os.path.join(ccd_cache_folder_path, source_name)
+        _download_ccd_source_into_cache(
+            f"{ccd_base_url}/{source_name}", cached_filepath, source_state, download_timeout_s
+        )
+        _save_ccd_state(ccd_state, ccd_state_json_path)
+        cached_filepaths.append(cached_filepath)
+
     ligand_ids_present = {
         ligand_file.replace(".cif", ""): False
         for ligand_file
         in find_matching_files(ligand_cifs_folder_path, ".cif")
     }
 
-    components_generator = _one_ligand_cif_from_request_generator(
-        "https://files.wwpdb.org/pub/pdb/data/monomers/components.cif", download_timeout_s
-    )
-    aa_variants_generator = _one_ligand_cif_from_request_generator(
-        "https://files.wwpdb.org/pub/pdb/data/monomers/aa-variants-v1.cif", download_timeout_s
-    )
+    if ligand_ids_present and all(
+        ccd_state[source_name].processed_hash == ccd_state[source_name].downloaded_hash
+        for source_name in _CCD_SOURCE_NAMES
+    ):
+        logging.info("Ligand ccd source files did not change since they were last processed, nothing to update.")
+        return ChangedIds()
 
     changed_ids = ChangedIds()
+    ligand_cif_hashes = _load_ligand_cifs_manifest(
+        ligand_cifs_manifest_json_path, ligand_cifs_folder_path, ligand_ids_present
+    )
+    failed_ligand_ids = []
+
+    try:
+        with ThreadPoolExecutor(max_workers) as executor:
+            pending_ligand_cifs: deque[tuple[str, Future]] = deque()
+            for cached_filepath in cached_filepaths:
+                for cif_content in _one_ligand_cif_from_file_generator(cached_filepath):
+                    if ligand_ids_present.get(cif_content.ligand_id):
+                        continue  # ligand was already processed from previous file source
+                    ligand_ids_present[cif_content.ligand_id] = True
+                    future = executor.submit(
+                        _save_ligand_cif_if_changed,
+                        cif_content,
+                        ligand_cif_hashes.get(cif_content.ligand_id),
+                        ligand_cifs_folder_path,
+                    )
+                    pending_ligand_cifs.append((cif_content.ligand_id, future))
+                    if len(pending_ligand_cifs) >= max_workers * _PENDING_LIGAND_CIFS_PER_WORKER:
+                        _process_saved_ligand_cif(
+                            *pending_ligand_cifs.popleft(), changed_ids, ligand_cif_hashes, failed_ligand_ids
+                        )
+            while pending_ligand_cifs:
+                _process_saved_ligand_cif(
+                    *pending_ligand_cifs.popleft(), changed_ids, ligand_cif_hashes, failed_ligand_ids
+                )
 
-    for generator in [components_generator, aa_variants_generator]:
-        for cif_content in generator:
-            _process_one_ligand_cif(cif_content, changed_ids, ligand_cifs_folder_path, ligand_ids_present)
+        for ligand_id, present_in_downloaded in ligand_ids_present.items():
+            if not present_in_downloaded:
+                changed_ids.deleted.append(ligand_id)
+                _delete_ligand_file(ligand_id, ligand_cifs_folder_path, ligand_cif_hashes)
+    finally:
+        _save_ligand_cifs_manifest(ligand_cif_hashes, ligand_cifs_manifest_json_path)
+
+    if failed_ligand_ids:
+        # ccd source files are not marked as processed, so that the failed ligands are saved again next run
+        # (the ligands saved successfully are then skipped based on their hashes in manifest)
+        logging.warning(
+            "%s ligand cifs failed to be saved (%s), they will be saved again next run.",
+            len(failed_ligand_ids),
+            ", ".join(failed_ligand_ids),
+        )
+        return changed_ids
 
-    for ligand_id, present_in_downloaded in ligand_ids_present.items():
-        if not present_in_downloaded:
-            changed_ids.deleted.append(ligand_id)
-            _delete_ligand_file(ligand_id, ligand_cifs_folder_path)
+    for source_name in _CCD_SOURCE_NAMES:
+        ccd_state[source_name].processed_hash = ccd_state[source_name].downloaded_hash
+    _save_ccd_state(ccd_state, ccd_state_json_path)
 
     return changed_ids
 
 
-def _process_one_ligand_cif(
-    cif_content: OneLigandCifContent,
+def _save_ligand_cif_if_changed(
+    cif_content: OneLigandCifContent, stored_content_hash: Optional[str], ligand_cifs_folder_path: str
+) -> Optional[str]:
+    content_hash = hashlib.sha256(cif_content.content).hexdigest()
+    if content_hash == stored_content_hash:
+        return None
+    _save_ligand_cif_into_file(cif_content, ligand_cifs_folder_path)
+    return content_hash
+
+
+def _process_saved_ligand_cif(
+    ligand_id: str,
+    future: Future,
     changed_ids: ChangedIds,
-    ligand_cifs_folder_path: str,
-    ligand_ids_present: dict[str, bool]
+    ligand_cif_hashes: dict[str, str],
+    failed_ligand_ids: list[str],
+) -> None:
+    try:
+        new_content_hash = future.result()
+    except FileWritingError as ex:
+        ligand_cif_hashes.pop(ligand_id, None)  # the file may be left half-written
+        failed_ligand_ids.append(ligand_id)
+        logging.error("Failed to save ligand %s. Reason: %s", ligand_id, ex)
+        return
+    if new_content_hash is not None:
+        ligand_cif_hashes[ligand_id] = new_content_hash
+        changed_ids.updated.append(ligand_id)
+
+
+def _download_ccd_source_into_cache(
+    address: str, cached_filepath: str, source_state: CcdSourceState, download_timeout_s: Timeout
 ) -> None:
+    headers = source_state.as_conditional_request_headers() if os.path.exists(cached_filepath) else {}
+    content_hash = hashlib.sha256()
+    try:
+        response = get_response(address, download_timeout_s, stream=True, headers=headers or None)
+        with response:
+            if response.status_code == 304:
+                logging.info("%s was not modified since last download, cached file is used.", address)
+                return
+            logging.info("Connection to %s established, downloading it into %s.", address, cached_filepath)
+            with AtomicFileWriter(cached_filepath) as file_writer:
+                for chunk in iter_response_content(response, address, _CCD_DOWNLOAD_CHUNK_SIZE):
+                    content_hash.update(chunk)
+                    file_writer.write(chunk)
+                file_writer.commit()
+    except (RequestException, FileWritingError) as ex:
+        raise DataDownloadError(f"Failed to download {address} into {cached_filepath}: {ex}") from ex
+
+    source_state.etag = response.headers.get("ETag")
+    source_state.last_modified = response.headers.get("Last-Modified")
+    source_state.downloaded_hash = content_hash.hexdigest()
+
+
+def _load_ccd_state(ccd_state_json_path: str) -> dict[str, CcdSourceState]:
     try:
-        if cif_content.ligand_id not in ligand_ids_present:
-            _save_ligand_cif_into_file(cif_content, ligand_cifs_folder_path)
-            changed_ids.updated.append(cif_content.ligand_id)
-        else:
-            if ligand_ids_present[cif_content.ligand_id]:
-                return  # ligand was already processed from previous file source
-            ligand_ids_present[cif_content.ligand_id] = True
-            if not _downloaded_and_stored_ligand_cifs_identical(cif_content, ligand_cifs_folder_path):
-                _save_ligand_cif_into_file(cif_content, ligand_cifs_folder_path)
-                changed_ids.updated.append(cif_content.ligand_id)
-    except (DataDownloadError, FileWritingError) as ex:
-        logging.error(
-            "Failed to determine if ligand %s needs to be updated and saved. Reason: %s",
-            cif_content.ligand_id,
-            ex
+        ccd_state_json = load_json_file(ccd_state_json_path, raise_on_file_not_found=False, default_if_not_found={})
+        return {
+            source_name: CcdSourceState.from_dict(source_state_json)
+            for source_name, source_state_json in ccd_state_json.items()
+        }
+    except (ParsingError, AttributeError) as ex:
+        logging.warning(
+            "Failed to load ligand ccd state from %s, ccd source files will be downloaded and processed again. %s",
+            ccd_state_json_path,
+            ex,
         )
+        return {}
 
 
-def _one_ligand_cif_from_request_generator(
-    address: str, download_timeout_s: int
-) -> Generator[OneLigandCifContent, None, None]:
-    response = requests.get(address, stream=True, timeout=download_timeout_s)
-    if response.status_code != 200:
-        raise DataDownloadError(f"Failed to download, request returned {response.status_code}. {response.content}")
+def _save_ccd_state(ccd_state: dict[str, CcdSourceState], ccd_state_json_path: str) -> None:
+    try:
+        write_json_file(
+            ccd_state_json_path,
+            {source_name: source_state.to_dict() for source_name, source_state in ccd_state.items()},
+        )
+    except FileWritingError as ex:
+        logging.warning(
+            "Failed to save ligand ccd state. Next run will download and process ccd source files again. %s", ex
+        )
+
 
-    response_lines = response.iter_lines()
-    # pylint: disable=stop-iteration-return
-    one_ligand_lines = [bytes.decode(next(response_lines), "utf8")]
-    logging.info("Connection to %s established, starting generating cif files.", address)
-    for line in response_lines:
-        line = bytes.decode(line, "utf8")
-        if "data_" in line:
-            yield _assemble_one_ligand_cif_content(one_ligand_lines)
-            one_ligand_lines = []
-        one_ligand_lines.append(line)
+def _one_ligand_cif_from_file_generator(filepath: str) -> Generator[OneLigandCifContent, None, None]:
+    with open(filepath, "rb") as ccd_file:
+        unfinished_chunk = b""
+        while chunk := ccd_file.read(_CCD_SPLIT_CHUNK_SIZE):
+            chunk = unfinished_chunk + chunk if unfinished_chunk else chunk
+            chunk_view = memoryview(chunk)
+            # boundary may be split between previous and this chunk, so the search overlaps the previous chunk
+            search_start = max(len(unfinished_chunk) - len(_LIGAND_CIF_BOUNDARY), 0)
+            ligand_start = 0
+            while (boundary := chunk.find(_LIGAND_CIF_BOUNDARY, search_start)) != -1:
+                yield _assemble_one_ligand_cif_content(chunk, chunk_view, ligand_start, boundary + 1)
+                ligand_start = boundary + 1
+                search_start = ligand_start
+            unfinished_chunk = chunk[ligand_start:]
 
-    yield _assemble_one_ligand_cif_content(one_ligand_lines)
+    if unfinished_chunk:
+        if not unfinished_chunk.endswith(b"\n"):
+            unfinished_chunk += b"\n"
+        yield _assemble_one_ligand_cif_content(unfinished_chunk, memoryview(unfinished_chunk), 0, len(unfinished_chunk))
 
 
-def _assemble_one_ligand_cif_content(content_lines: list[str]) -> OneLigandCifContent:
-    if len(content_lines[0]) < 6:
+def _assemble_one_ligand_cif_content(
+    chunk: bytes, chunk_view: memoryview, start: int, end: int
+) -> OneLigandCifContent:
+    header_end = chunk.find(b"\n", start, end)  # always found, each ligand cif ends with newline
+    ligand_id = chunk[start + len(_LIGAND_CIF_HEADER):header_end].rstrip(b"\r")
+    if not chunk.startswith(_LIGAND_CIF_HEADER, start) or not ligand_id:
         raise DataDownloadError(
             "Unexpected chunk in all ligand ccd file download. Cannot proceed without header in form data_XXX."
-            f"{content_lines}"
+            f"{bytes(chunk_view[start:min(end, start + 200)])}"
         )
-    ligand_name = content_lines[0][5:]
-    content_lines[-1] += os.linesep  # add newline at the end
     return OneLigandCifContent(
-        ligand_id=ligand_name,
-        content=os.linesep.join(content_lines)
+        ligand_id=ligand_id.decode("utf8"),
+        content=chunk_view[start:end],
     )
 
 
-def _save_ligand_cif_into_file(cif_content, ligand_cifs_folder_path):
-    filepath = os.path.join(ligand_cifs_folder_path, f"{cif_content.ligand_id}.cif")
-    write_file(filepath, cif_content.content)
+def _load_ligand_cifs_manifest(
+    manifest_json_path: str, ligand_cifs_folder_path: str, ligand_ids_present: dict[str, bool]
+) -> dict[str, str]:
+    try:
+        manifest = load_json_file(manifest_json_path, raise_on_file_not_found=False, default_if_not_found={})
+        if not isinstance(manifest, dict):
+            raise ParsingError(f"Expected json object, got {type(manifest).__name__}.")
+    except ParsingError as ex:
+        logging.warning("Failed to load ligand cifs manifest from %s, it will be rebuilt. %s", manifest_json_path, ex)
+        manifest = {}
+
+    ligand_cif_hashes = {
+        ligand_id: content_hash for ligand_id, content_hash in manifest.items() if ligand_id in ligand_ids_present
+    }
+    ligand_ids_not_in_manifest = [ligand_id for ligand_id in ligand_ids_present if ligand_id not in ligand_cif_hashes]
+    if ligand_ids_not_in_manifest or len(ligand_cif_hashes) != len(manifest):
+        logging.info(
+            "Ligand cifs manifest did not match stored files (%s files missing in it, %s entries without file), "
+            "rebuilding it.",
+            len(ligand_ids_not_in_manifest),
+            len(manifest) - len(ligand_cif_hashes),
+        )
+    for ligand_id in ligand_ids_not_in_manifest:
+        ligand_cif_hashes[ligand_id] = file_hash(os.path.join(ligand_cifs_folder_path, f"{ligand_id}.cif"))
+    return ligand_cif_hashes
+
+
+def _save_ligand_cifs_manifest(ligand_cif_hashes: dict[str, str], manifest_json_path: str) -> None:
+    try:
+        write_json_file(manifest_json_path, ligand_cif_hashes)
+    except FileWritingError as ex:
+        logging.warning("Failed to save ligand cifs manifest, it will be rebuilt next run. %s", ex)
 
 
-def _downloaded_and_stored_ligand_cifs_identical(cif_content, ligand_cifs_folder_path) -> bool:
+def _save_ligand_cif_into_file(cif_content: OneLigandCifContent, ligand_cifs_folder_path: str) -> None:
     filepath = os.path.join(ligand_cifs_folder_path, f"{cif_content.ligand_id}.cif")
-    return compare_file_and_string(filepath, cif_content.content)
+    write_binary_file(filepath, cif_content.content)
 
 
-def _delete_ligand_file(ligand_id, ligand_cifs_folder_path):
+def _delete_ligand_file(ligand_id: str, ligand_cifs_folder_path: str, ligand_cif_hashes: dict[str, str]) -> None:
     filepath = os.path.join(ligand_cifs_folder_path, f"{ligand_id}.cif")
     os.remove(filepath)
+    ligand_cif_hashes.pop(ligand_id, None)
     logging.info("Deleted file %s (because it was not in udpated ligands)", filepath)
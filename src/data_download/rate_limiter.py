@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+@dataclass(slots=True)
+class RateLimitSettings:
+    """
+    Settings of request rate for one endpoint (requests per second).
+    """
+
+    initial_rate: float = 10.0
+    min_rate: float = 0.5
+    max_rate: float = 50.0
+    # how much the rate grows after each successful request, and how much it shrinks after throttling
+    increase_per_success: float = 0.1
+    decrease_factor: float = 0.5
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket rate limiter, which adapts its rate based on the responses (additive increase on success,
+    multiplicative decrease on throttling). Safe to use from multiple threads.
+    """
+
+    def __init__(self, name: str, settings: RateLimitSettings):
+        self.name = name
+        self._settings = settings
+        self._rate = min(max(settings.initial_rate, settings.min_rate), settings.max_rate)
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.throttled_count = 0
+
+    @property
+    def rate(self) -> float:
+        """
+        Current rate in requests per second.
+        """
+        return self._rate
+
+    def acquire(self) -> None:
+        """
+        Block until the request can be made without exceeding the current rate.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self.request_count += 1
+                    return
+                wait_s = max(self._paused_until - now, (1.0 - self._tokens) / self._rate)
+            time.sleep(wait_s)
+
+    def record_success(self) -> None:
+        """
+        Record successful response, slowly increasing the rate.
+        """
+        with self._lock:
+            self._rate = min(self._settings.max_rate, self._rate + self._settings.increase_per_success)
+
+    def record_throttling(self, retry_after_s: Optional[float] = None) -> None:
+        """
+        Record that the server throttled the request (or is overloaded), decreasing the rate. If the server
+        said when to retry, no request is let through until then.
+        :param retry_after_s: Value of Retry-After header in seconds, if present.
+        """
+        with self._lock:
+            self.throttled_count += 1
+            self._rate = max(self._settings.min_rate, self._rate * self._settings.decrease_factor)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after_s:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after_s)
+
+    def _refill(self, now: float) -> None:
+        # bucket capacity equals one second worth of requests, so the burst is bounded by the rate itself
+        capacity = max(1.0, self._rate)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+
+_rate_limiters: dict[str, AdaptiveRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+_rate_limit_settings = RateLimitSettings()
+
+
+def configure_rate_limiting(settings: RateLimitSettings) -> None:
+    """
+    Set rate limit settings for all endpoints. Limiters created so far are discarded.
+    :param settings:
+    """
+    global _rate_limit_settings  # pylint: disable=global-statement
+    with _rate_limiters_lock:
+        _rate_limit_settings = settings
+        _rate_limiters.clear()
+
+
+def get_rate_limiter(address: str) -> AdaptiveRateLimiter:
+    """
+    Get rate limiter for the endpoint of given address. Endpoint is the host and the path without its last part
+    (e.g. www.ebi.ac.uk/pdbe/api/pdb/entry/summary), so each rest type has its own limiter.
+    :param address: Full address of the request.
+    :return: Rate limiter shared by all requests to the same endpoint.
+    """
+    endpoint = get_endpoint_name(address)
+    with _rate_limiters_lock:
+        if endpoint not in _rate_limiters:
+            _rate_limiters[endpoint] = AdaptiveRateLimiter(endpoint, _rate_limit_settings)
+        return _rate_limiters[endpoint]
+
+
+def get_endpoint_name(address: str) -> str:
+    """
+    Get endpoint name for given address, which is the host and the path without its last part.
+    :param address: Full address of the request.
+    :return: Endpoint name.
+    """
+    split_address = urlsplit(address)
+    return f"{split_address.netloc}{split_address.path.rsplit('/', 1)[0]}"
+
+
+def log_rate_limiter_stats() -> None:
+    """
+    Log request count, throttled count and final rate of every endpoint.
+    """
+    with _rate_limiters_lock:
+        rate_limiters = list(_rate_limiters.values())
+    for rate_limiter in rate_limiters:
+        logging.info(
+            "Endpoint %s: %s requests, %s throttled, final rate %.2f requests/s.",
+            rate_limiter.name,
+            rate_limiter.request_count,
+            rate_limiter.throttled_count,
+            rate_limiter.rate,
+        )
@@ -1,11 +1,26 @@
+import hashlib
+import json
 import logging
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any
+from typing import Any, Callable, Iterable, Optional
 
-from src.data_download.http_request_handler import get_response_json
-from src.exception import DataDownloadError, FileWritingError
-from src.generic_file_handlers.json_file_writer import write_json_file
+import requests
+
+from src.data_download.http_request_handler import get_response_with_retries, iter_response_content, Timeout
+from src.data_download.rest_validator_store import RestValidatorStore, RestFileValidators
+from src.exception import DataDownloadError, DataDownloadCircuitOpenError, FileWritingError
+from src.generic_file_handlers.plain_file_handler import AtomicFileWriter
+
+_REST_RESPONSE_CHUNK_SIZE = 64 * 1024
+# validator db report starts with its version, so it is enough to look at the start of the response
+_CONTENT_START_PROBE_SIZE = 4 * 1024
+_VDB_VERSION_PATTERN = re.compile(rb'\s*\{\s*"Version"\s*:\s*("[^"]*"|[^,}\s]+)')
+_DEFAULT_PDBE_REST_BASE_URL = "https://www.ebi.ac.uk/pdbe/api/pdb/entry"
+_DEFAULT_VALIDATOR_DB_BASE_URL = "https://webchem.ncbr.muni.cz/Platform/ValidatorDb/Data"
 
 
 class RestDataType(Enum):
@@ -22,123 +37,453 @@ class RestDataType(Enum):
     VALIDATOR_DB = "validatorDB"
 
 
+class RestFileDownloadOutcome(Enum):
+    """
+    Outcome of download of one rest file.
+    """
+
+    UPDATED = 0
+    UNCHANGED = 1
+    FAILED = 2
+    # no request was made, because the host is considered unavailable
+    NOT_ATTEMPTED = 3
+
+
+@dataclass(slots=True)
+class RestDownloadResult:
+    """
+    Ids that failed to download, and ids for which the downloaded content was the same as already stored one.
+    """
+
+    failed_ids: list[str] = field(default_factory=list)
+    unchanged_ids: list[str] = field(default_factory=list)
+    # failed ids for which no request was made at all (see circuit_breaker)
+    not_attempted_ids: list[str] = field(default_factory=list)
+
+
 def download_one_type_rest_files(
-    ids_to_download: set[str], rest_type: RestDataType, output_folder_path: str, single_request_timeout_s: int
-) -> list[str]:
+    ids_to_download: set[str],
+    rest_type: RestDataType,
+    output_folder_path: str,
+    single_request_timeout_s: Timeout,
+    max_parallel_requests: int = 1,
+    validator_store: Optional[RestValidatorStore] = None,
+    batch_size: int = 1,
+    base_url: Optional[str] = None,
+    on_id_finished: Optional[Callable[[str], None]] = None,
+) -> RestDownloadResult:
     """
     Download rest files for given rest type and given list of ids. Store them as jsons in given folder.
+    Downloads run in a thread pool, so that up to max_parallel_requests requests are waiting for the response
+    at the same time. If validator store is given, conditional requests are made for already stored files, and
+    files whose content did not change are not rewritten.
+    For pdbe rest types, if batch size is bigger than 1, the files are downloaded in batches (one POST request
+    for multiple ids), and then split into one file per id. Ids whose batch failed, or which were missing in
+    the batch response, are downloaded one by one afterwards (so that the failures are tracked per id).
     :param ids_to_download:
     :param rest_type:
     :param output_folder_path: Path where to store all the rest files (no matter then type).
-    :param single_request_timeout_s:
-    :return: List of failed ids.
+    :param single_request_timeout_s: Timeout of one request (or tuple of connect and read timeout).
+    :param max_parallel_requests: Number of worker threads downloading the files.
+    :param validator_store: Validators of previously downloaded files. Updated with validators of new files.
+    :param batch_size: Maximum number of ids downloaded in one request (not used for validator db).
+    :param base_url: Base url of pdbe rest api or validator db (depending on rest type). If not given, the
+    public one is used.
+    :param on_id_finished: If given, it is called with each id as soon as its download finished (successfully
+    or not), from the thread collecting the results.
+    :return: Failed ids (and which of them were not requested at all) and ids whose content did not change.
     """
+    if base_url is None:
+        base_url = (
+            _DEFAULT_VALIDATOR_DB_BASE_URL if rest_type == RestDataType.VALIDATOR_DB else _DEFAULT_PDBE_REST_BASE_URL
+        )
     logging.info(
         "Starting download for %s rest files. Will attempt to download %s files.",
         rest_type.value,
         len(ids_to_download)
     )
-    failed_ids = []
-
-    for structure_id in ids_to_download:
-        try:
-            rest_json = _download_one_type_rest_file(structure_id, rest_type, single_request_timeout_s)
-            if rest_type == RestDataType.VALIDATOR_DB:
-                _check_vdb_data_downloaded(rest_json)
-            _save_rest_json(rest_json, output_folder_path, rest_type, structure_id)
-        except (DataDownloadError, FileWritingError) as ex:
-            logging.info("Failed to download %s rest json for %s. Reason: %s.", rest_type.value, structure_id, ex)
-            failed_ids.append(structure_id)
-        except Exception as ex:  # pylint: disable=broad-exception-caught
-            logging.error(
-                "Unexpected error: %s. Failed to download %s rest json for %s.", ex, rest_type.value, structure_id
+    result = RestDownloadResult()
+    download_outcomes: dict[str, RestFileDownloadOutcome] = {}
+    ids_to_download_one_by_one = list(ids_to_download)
+
+    with ThreadPoolExecutor(max_workers=max_parallel_requests) as executor:
+        if batch_size > 1 and rest_type != RestDataType.VALIDATOR_DB:
+            ids_to_download_one_by_one = []
+            batch_outcomes = executor.map(
+                lambda batch_ids: _download_and_save_rest_batch(
+                    batch_ids, rest_type, output_folder_path, single_request_timeout_s, validator_store, base_url
+                ),
+                _split_into_batches(sorted(ids_to_download), batch_size),
             )
-            failed_ids.append(structure_id)
+            for outcomes_of_batch, ids_missing_in_batch in batch_outcomes:
+                download_outcomes.update(outcomes_of_batch)
+                ids_to_download_one_by_one.extend(ids_missing_in_batch)
+                if on_id_finished is not None:
+                    for structure_id in outcomes_of_batch:
+                        on_id_finished(structure_id)
+
+        one_by_one_outcomes = executor.map(
+            lambda structure_id: _download_and_save_one_rest_file(
+                structure_id, rest_type, output_folder_path, single_request_timeout_s, validator_store, base_url
+            ),
+            ids_to_download_one_by_one,
+        )
+        for structure_id, outcome in zip(ids_to_download_one_by_one, one_by_one_outcomes):
+            download_outcomes[structure_id] = outcome
+            if on_id_finished is not None:
+                on_id_finished(structure_id)
+
+    for structure_id, outcome in download_outcomes.items():
+        if outcome in (RestFileDownloadOutcome.FAILED, RestFileDownloadOutcome.NOT_ATTEMPTED):
+            result.failed_ids.append(structure_id)
+        if outcome == RestFileDownloadOutcome.NOT_ATTEMPTED:
+            result.not_attempted_ids.append(structure_id)
+        elif outcome == RestFileDownloadOutcome.UNCHANGED:
+            result.unchanged_ids.append(structure_id)
 
-    if len(failed_ids) > 0:
-        successful_count = len(ids_to_download) - len(failed_ids)
+    if len(result.failed_ids) > 0:
+        successful_count = len(ids_to_download) - len(result.failed_ids)
         logging.info(
-            "Finished %s rest download. Successful: %s. Failed: %s.", rest_type.value, successful_count, len(failed_ids)
+            "Finished %s rest download. Successful: %s (unchanged: %s). Failed: %s (not requested, as the host is "
+            "unavailable: %s).",
+            rest_type.value,
+            successful_count,
+            len(result.unchanged_ids),
+            len(result.failed_ids),
+            len(result.not_attempted_ids),
         )
     else:
-        logging.info("Successfully finished %s rest download for all ids.", rest_type.value)
+        logging.info(
+            "Successfully finished %s rest download for all ids (unchanged: %s).",
+            rest_type.value,
+            len(result.unchanged_ids),
+        )
 
-    return failed_ids
+    return result
 
 
-def _download_one_type_rest_file(structure_id: str, rest_type: RestDataType, single_request_timeout_s: int) -> Any:
+def _download_and_save_one_rest_file(
+    structure_id: str,
+    rest_type: RestDataType,
+    output_folder_path: str,
+    single_request_timeout_s: Timeout,
+    validator_store: Optional[RestValidatorStore],
+    base_url: str,
+) -> RestFileDownloadOutcome:
     """
-    Download one file from rest api for given rest type. The address is assembled based on the rest type.
+    Download one rest file and save it, unless its content is the same as the content of already stored file.
+    The response body is streamed into a temporary file as it is (without decoding and encoding the json again),
+    which replaces the stored file only if the download succeeded and the content changed.
+    Errors are logged, not raised, as this runs in worker thread.
     :param structure_id:
     :param rest_type:
+    :param output_folder_path:
     :param single_request_timeout_s:
-    :return:
+    :param validator_store:
+    :param base_url: Base url of pdbe rest api or validator db.
+    :return: Outcome of the download.
     """
-    address = _get_rest_data_address(structure_id, rest_type)
-    logging.debug("Downloading %s rest json for id %s from %s", rest_type.value, structure_id, address)
-    return get_response_json(address, get_timeout_s=single_request_timeout_s, retry_attempts=2)
+    try:
+        filepath = _get_rest_filepath(output_folder_path, rest_type, structure_id)
+        stored_validators = None
+        if validator_store is not None and os.path.exists(filepath):
+            stored_validators = validator_store.get(rest_type.value, structure_id)
+
+        response = _download_one_type_rest_file(
+            structure_id, rest_type, single_request_timeout_s, base_url, stored_validators
+        )
+        with response:
+            if response.status_code == 304:
+                logging.debug("%s rest json for %s not modified.", rest_type.value, structure_id)
+                return RestFileDownloadOutcome.UNCHANGED
+
+            content_hash, content_changed = _save_rest_content(
+                iter_response_content(
+                    response, _get_rest_data_address(base_url, structure_id, rest_type), _REST_RESPONSE_CHUNK_SIZE
+                ),
+                filepath,
+                rest_type,
+                stored_validators.content_hash if stored_validators else None,
+            )
+            new_validators = RestFileValidators.from_response(response, content_hash)
+
+        if validator_store is not None:
+            validator_store.update(rest_type.value, structure_id, new_validators)
+        if not content_changed:
+            logging.debug("%s rest json for %s has the same content as stored one.", rest_type.value, structure_id)
+            return RestFileDownloadOutcome.UNCHANGED
+        return RestFileDownloadOutcome.UPDATED
+    except DataDownloadCircuitOpenError as ex:
+        logging.info("Did not download %s rest json for %s. Reason: %s.", rest_type.value, structure_id, ex)
+        return RestFileDownloadOutcome.NOT_ATTEMPTED
+    except (DataDownloadError, FileWritingError, requests.exceptions.RequestException) as ex:
+        logging.info("Failed to download %s rest json for %s. Reason: %s.", rest_type.value, structure_id, ex)
+    except OSError as ex:
+        logging.info("Failed to save %s rest json for %s. Reason: %s.", rest_type.value, structure_id, ex)
+    except Exception as ex:  # pylint: disable=broad-exception-caught
+        logging.error(
+            "Unexpected error: %s. Failed to download %s rest json for %s.", ex, rest_type.value, structure_id
+        )
+    return RestFileDownloadOutcome.FAILED
 
 
-def _check_vdb_data_downloaded(rest_json: dict) -> None:
+def _download_and_save_rest_batch(
+    batch_ids: list[str],
+    rest_type: RestDataType,
+    output_folder_path: str,
+    single_request_timeout_s: Timeout,
+    validator_store: Optional[RestValidatorStore],
+    base_url: str,
+) -> tuple[dict[str, RestFileDownloadOutcome], list[str]]:
     """
-    Check if the response contains actual validator db report. If it is empty, raise DataDownloadError.
-    :param rest_json:
-    :raises DataDownloadError: If the response has no version, which happens when there is no report ready yet.
+    Download rest files of multiple structures in one request, and save them one file per structure (with the
+    same json as if they were downloaded one by one). Errors are logged, not raised, as this runs in worker
+    thread.
+    :param batch_ids:
+    :param rest_type: Rest type other than validator db.
+    :param output_folder_path:
+    :param single_request_timeout_s:
+    :param validator_store:
+    :param base_url: Base url of pdbe rest api.
+    :return: Outcome for each id in the batch response, and ids that need to be downloaded one by one (all of
+    them if the batch failed, otherwise those missing in the response).
     """
-    if rest_json.get("Version") in [None, "n/a"]:
-        raise DataDownloadError("Validator DB has no data for this structure.")
+    address = _get_rest_batch_address(base_url, rest_type)
+    logging.debug("Downloading %s rest jsons for %s ids from %s", rest_type.value, len(batch_ids), address)
+    try:
+        batch_json = get_response_with_retries(
+            address, get_timeout_s=single_request_timeout_s, retry_attempts=2, data=",".join(batch_ids)
+        ).json()
+        if not isinstance(batch_json, dict):
+            raise ValueError(f"Expected json object, got {type(batch_json).__name__}.")
+    except (DataDownloadError, ValueError) as ex:
+        logging.info(
+            "Failed to download %s rest jsons for batch of %s ids, they will be downloaded one by one. Reason: %s",
+            rest_type.value,
+            len(batch_ids),
+            ex,
+        )
+        return {}, batch_ids
 
+    outcomes = {}
+    ids_missing_in_batch = []
+    for structure_id in batch_ids:
+        if structure_id not in batch_json:
+            ids_missing_in_batch.append(structure_id)
+            continue
+        outcomes[structure_id] = _save_rest_batch_item(
+            structure_id, batch_json[structure_id], rest_type, output_folder_path, validator_store
+        )
+    return outcomes, ids_missing_in_batch
 
-def _save_rest_json(rest_json: Any, output_folder_path: str, rest_type: RestDataType, structure_id: str) -> None:
+
+def _save_rest_batch_item(
+    structure_id: str,
+    structure_json: Any,
+    rest_type: RestDataType,
+    output_folder_path: str,
+    validator_store: Optional[RestValidatorStore],
+) -> RestFileDownloadOutcome:
     """
-    Save given rest response into file. The location depends on the rest type given.
-    :param rest_json:
-    :param output_folder_path:
-    :param rest_type:
+    Save part of batch response that belongs to one structure, in the same form as the response for that
+    one structure would have (json object with structure id as the only key).
     :param structure_id:
+    :param structure_json: Value for the structure id from batch response.
+    :param rest_type:
+    :param output_folder_path:
+    :param validator_store:
+    :return: Outcome of the save.
     """
-    if rest_type == RestDataType.VALIDATOR_DB:
-        _save_validator_db_json(rest_json, output_folder_path, structure_id)
-    else:
-        _save_pdbe_rest_json(rest_json, output_folder_path, rest_type, structure_id)
+    filepath = _get_rest_filepath(output_folder_path, rest_type, structure_id)
+    stored_validators = None
+    if validator_store is not None and os.path.exists(filepath):
+        stored_validators = validator_store.get(rest_type.value, structure_id)
+    content = json.dumps({structure_id: structure_json}, separators=(",", ":"), ensure_ascii=False).encode("utf8")
+
+    try:
+        content_hash, content_changed = _save_rest_content(
+            [content], filepath, rest_type, stored_validators.content_hash if stored_validators else None
+        )
+    except (DataDownloadError, FileWritingError, OSError) as ex:
+        logging.info("Failed to save %s rest json for %s. Reason: %s.", rest_type.value, structure_id, ex)
+        return RestFileDownloadOutcome.FAILED
+
+    if not content_changed:
+        # stored validators (e.g. etag from previous single request) still describe the same content
+        return RestFileDownloadOutcome.UNCHANGED
+    if validator_store is not None:
+        # batch response has no etag or last modified of single files
+        validator_store.update(rest_type.value, structure_id, RestFileValidators(content_hash=content_hash))
+    return RestFileDownloadOutcome.UPDATED
 
 
-def _save_validator_db_json(rest_json: Any, output_folder_path: str, structure_id: str) -> None:
+def _split_into_batches(ids: list[str], batch_size: int) -> list[list[str]]:
     """
-    Save given validator db response into a file.
-    :param rest_json:
-    :param output_folder_path:
+    Split ids into batches of given size (the last one may be smaller).
+    :param ids:
+    :param batch_size:
+    :return: List of batches.
+    """
+    return [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+
+
+def _download_one_type_rest_file(
+    structure_id: str,
+    rest_type: RestDataType,
+    single_request_timeout_s: Timeout,
+    base_url: str,
+    stored_validators: Optional[RestFileValidators] = None,
+) -> requests.Response:
+    """
+    Download one file from rest api for given rest type. The address is assembled based on the rest type.
     :param structure_id:
+    :param rest_type:
+    :param single_request_timeout_s:
+    :param base_url: Base url of pdbe rest api or validator db.
+    :param stored_validators: If given, the request is conditional, and may return response with status 304.
+    :return: Response with status 200, or 304 for conditional request if the file was not modified. Its body
+    is not read yet (streamed response), so it needs to be closed after use.
     """
-    directory_path = os.path.join(output_folder_path, structure_id)
-    filepath = os.path.join(directory_path, "result.json")
+    address = _get_rest_data_address(base_url, structure_id, rest_type)
+    headers = stored_validators.as_conditional_request_headers() if stored_validators else None
+    logging.debug("Downloading %s rest json for id %s from %s", rest_type.value, structure_id, address)
+    return get_response_with_retries(
+        address, get_timeout_s=single_request_timeout_s, retry_attempts=2, headers=headers, stream=True
+    )
 
-    if not os.path.exists(directory_path):
+
+def _save_rest_content(
+    content_chunks: Iterable[bytes],
+    filepath: str,
+    rest_type: RestDataType,
+    stored_content_hash: Optional[str],
+) -> tuple[str, bool]:
+    """
+    Write the content (e.g. streamed response body) into given file. The file is replaced only after the whole
+    content is written and checked, and only if it differs from the stored one (based on stored content hash).
+    If only the hashes differ, the json of both files is compared, as the same json downloaded alone and as part
+    of batch response is stored formatted differently - the stored file is then kept.
+    :param content_chunks: Content of the file, in chunks.
+    :param filepath:
+    :param rest_type:
+    :param stored_content_hash: Hash of the stored file content, if there is one.
+    :return: Hash of the content, and whether the content changed (and was saved).
+    :raises DataDownloadError: If the body cannot be downloaded or does not look like valid rest json.
+    :raises FileWritingError: If the file cannot be written.
+    """
+    directory_path = os.path.dirname(filepath)
+    directory_created = not os.path.exists(directory_path)
+    if directory_created:  # validator db results have folder per structure
         os.mkdir(directory_path)
 
-    write_json_file(filepath, rest_json)
+    try:
+        with AtomicFileWriter(filepath) as file_writer:
+            content_hash = _write_rest_content_into_file(content_chunks, file_writer, rest_type)
+            if content_hash == stored_content_hash:
+                return content_hash, False
+            if stored_content_hash is not None and _has_the_same_json_as_stored_file(file_writer):
+                return stored_content_hash, False
+            file_writer.commit()
+            return content_hash, True
+    finally:
+        if directory_created and not os.path.exists(filepath):
+            os.rmdir(directory_path)
+
+
+def _write_rest_content_into_file(
+    content_chunks: Iterable[bytes], file_writer: AtomicFileWriter, rest_type: RestDataType
+) -> str:
+    """
+    Write content into file chunk by chunk, calculating its hash on the way. The start of the content
+    is checked (see _check_rest_content_start) as soon as enough of it is written.
+    :param content_chunks: Content of the file, in chunks.
+    :param file_writer:
+    :param rest_type:
+    :return: Hash of the whole body.
+    :raises DataDownloadError: If the body does not look like valid rest json.
+    """
+    hasher = hashlib.sha256()
+    content_start = b""
+    content_start_checked = False
+
+    for chunk in content_chunks:
+        hasher.update(chunk)
+        file_writer.write(chunk)
+        if not content_start_checked:
+            content_start += chunk
+            if len(content_start) >= _CONTENT_START_PROBE_SIZE:
+                _check_rest_content_start(content_start, rest_type)
+                content_start_checked = True
+
+    if not content_start_checked:
+        _check_rest_content_start(content_start, rest_type)
+    return hasher.hexdigest()
+
+
+def _has_the_same_json_as_stored_file(file_writer: AtomicFileWriter) -> bool:
+    """
+    Check whether the written content has the same json as the stored file (that is replaced by it), even though
+    their content differs.
+    :param file_writer:
+    :return: True if both contents are the same json, False otherwise (also if any of them is not valid json).
+    :raises FileWritingError: If the written content cannot be read back.
+    """
+    try:
+        with open(file_writer.filepath, "rb") as stored_file:
+            stored_json = json.loads(stored_file.read())
+        return json.loads(file_writer.read_written_content()) == stored_json
+    except (OSError, ValueError):
+        return False
+
+
+def _check_rest_content_start(content_start: bytes, rest_type: RestDataType) -> None:
+    """
+    Check that the start of the response body looks like json object. For validator db, check also that
+    the response contains actual report - its version is the first item of the json, and it is missing
+    or empty if there is no report ready yet. The check does not decode the json.
+    :param content_start: First bytes of the response body.
+    :param rest_type:
+    :raises DataDownloadError: If the content is not json object, or validator db has no data.
+    """
+    if not content_start.lstrip().startswith(b"{"):
+        raise DataDownloadError(f"Response is not a json object, it starts with {content_start[:50]!r}.")
+    if rest_type == RestDataType.VALIDATOR_DB:
+        version_match = _VDB_VERSION_PATTERN.match(content_start)
+        if version_match is None or version_match.group(1) in (b"null", b'"n/a"'):
+            raise DataDownloadError("Validator DB has no data for this structure.")
 
 
-def _save_pdbe_rest_json(rest_json: Any, output_folder_path: str, rest_type: RestDataType, structure_id: str) -> None:
+def _get_rest_filepath(output_folder_path: str, rest_type: RestDataType, structure_id: str) -> str:
     """
-    Save rest json into file, for rest_type that corresponds with pdbe data source
-    (assembly, summary, molecules, (related) publications).
-    :param rest_json:
+    Get path of the file in which the rest json of given type and structure is stored.
     :param output_folder_path:
     :param rest_type:
     :param structure_id:
+    :return: Path of the file.
     """
-    filepath = os.path.join(output_folder_path, rest_type.value, f"{structure_id}.json")
-    write_json_file(filepath, rest_json)
+    if rest_type == RestDataType.VALIDATOR_DB:
+        return os.path.join(output_folder_path, structure_id, "result.json")
+    return os.path.join(output_folder_path, rest_type.value, f"{structure_id}.json")
 
 
-def _get_rest_data_address(structure_id: str, rest_data_type: RestDataType) -> str:
+def _get_rest_data_address(base_url: str, structure_id: str, rest_data_type: RestDataType) -> str:
     """
     Assemble address for given structure id, respecting the different rest data type given.
+    :param base_url: Base url of pdbe rest api or validator db.
     :param structure_id:
     :param rest_data_type:
     :return: Address of data as string.
     """
     if rest_data_type == RestDataType.VALIDATOR_DB:
-        return f"https://webchem.ncbr.muni.cz/Platform/ValidatorDb/Data/{structure_id}?source=ByStructure"
-    return f"https://www.ebi.ac.uk/pdbe/api/pdb/entry/{rest_data_type.value}/{structure_id}"
+        return f"{base_url}/{structure_id}?source=ByStructure"
+    return f"{base_url}/{rest_data_type.value}/{structure_id}"
+
+
+def _get_rest_batch_address(base_url: str, rest_data_type: RestDataType) -> str:
+    """
+    Assemble address for batch request (POST with comma separated structure ids) of given pdbe rest data type.
+    :param base_url: Base url of pdbe rest api.
+    :param rest_data_type: Rest data type other than validator db.
+    :return: Address of data as string.
+    """
+    return f"{base_url}/{rest_data_type.value}/"
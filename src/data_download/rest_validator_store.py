@@ -0,0 +1,158 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+from src.exception import ParsingError, FileWritingError
+from src.generic_file_handlers.json_file_loader import load_json_file
+from src.generic_file_handlers.json_file_writer import write_json_file
+
+
+@dataclass(slots=True)
+class RestFileValidators:
+    """
+    Information identifying the version of one downloaded rest file. Etag and last modified are taken from
+    the response headers (if the server sent them), content hash is calculated from the response body.
+    """
+
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+    def as_conditional_request_headers(self) -> dict[str, str]:
+        """
+        Get headers for conditional GET request, which makes the server respond with 304 Not Modified
+        if the content did not change.
+        :return: Dictionary with headers (empty if there is no etag or last modified).
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_dict(self) -> dict[str, Optional[str]]:
+        """
+        Return dictionary representation for storing as a json.
+        """
+        return {
+            "etag": self.etag,
+            "lastModified": self.last_modified,
+            "contentHash": self.content_hash,
+        }
+
+    @staticmethod
+    def from_dict(validators_json: dict) -> "RestFileValidators":
+        """
+        Create instance from loaded json.
+        :param validators_json:
+        """
+        return RestFileValidators(
+            etag=validators_json.get("etag"),
+            last_modified=validators_json.get("lastModified"),
+            content_hash=validators_json.get("contentHash"),
+        )
+
+    @staticmethod
+    def from_response(response: requests.Response, content_hash: str) -> "RestFileValidators":
+        """
+        Create instance from response headers and given hash of its content.
+        :param response:
+        :param content_hash:
+        """
+        return RestFileValidators(
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            content_hash=content_hash,
+        )
+
+
+class RestValidatorStore:
+    """
+    Holds validators of downloaded rest files, per rest type and structure id. Safe to use from multiple threads.
+    """
+
+    def __init__(self, validators_json: Optional[dict] = None):
+        self._validators: dict[str, dict[str, RestFileValidators]] = {
+            rest_type_name: {
+                structure_id: RestFileValidators.from_dict(file_validators)
+                for structure_id, file_validators in validators_of_type.items()
+            }
+            for rest_type_name, validators_of_type in (validators_json or {}).items()
+        }
+        self._lock = threading.Lock()
+
+    def get(self, rest_type_name: str, structure_id: str) -> Optional[RestFileValidators]:
+        """
+        Get stored validators of given file.
+        :param rest_type_name: Name of the rest type (e.g. summary).
+        :param structure_id:
+        :return: Validators, or None if none are stored.
+        """
+        with self._lock:
+            return self._validators.get(rest_type_name, {}).get(structure_id)
+
+    def update(self, rest_type_name: str, structure_id: str, file_validators: RestFileValidators) -> None:
+        """
+        Store validators for given file.
+        :param rest_type_name: Name of the rest type (e.g. summary).
+        :param structure_id:
+        :param file_validators:
+        """
+        with self._lock:
+            self._validators.setdefault(rest_type_name, {})[structure_id] = file_validators
+
+    def remove_structure(self, structure_id: str) -> None:
+        """
+        Remove validators of all rest types for given structure.
+        :param structure_id:
+        """
+        with self._lock:
+            for validators_of_type in self._validators.values():
+                validators_of_type.pop(structure_id, None)
+
+    def to_dict(self) -> dict:
+        """
+        Return dictionary representation for storing as a json.
+        """
+        with self._lock:
+            return {
+                rest_type_name: {
+                    structure_id: file_validators.to_dict()
+                    for structure_id, file_validators in validators_of_type.items()
+                }
+                for rest_type_name, validators_of_type in self._validators.items()
+            }
+
+
+def load_rest_validator_store(filepath: str) -> RestValidatorStore:
+    """
+    Load rest validator store from json. If it does not exist or cannot be loaded, empty store is returned
+    (which only means that all files are downloaded and saved again).
+    :param filepath:
+    :return: Loaded store.
+    """
+    try:
+        return RestValidatorStore(load_json_file(filepath, raise_on_file_not_found=False, default_if_not_found={}))
+    except (ParsingError, AttributeError) as ex:
+        logging.warning(
+            "Failed to load rest validators from %s, all rest files will be downloaded unconditionally. %s",
+            filepath,
+            ex,
+        )
+        return RestValidatorStore()
+
+
+def save_rest_validator_store(validator_store: RestValidatorStore, filepath: str) -> None:
+    """
+    Save rest validator store into json. Failure is only logged, as the store serves only as cache.
+    :param validator_store:
+    :param filepath:
+    """
+    try:
+        write_json_file(filepath, validator_store.to_dict())
+    except FileWritingError as ex:
+        logging.warning("Failed to save rest validators. Next run will download all rest files again. %s", ex)
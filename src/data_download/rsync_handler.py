@@ -1,14 +1,27 @@
-import gzip
 import logging
+import multiprocessing
 import os
+import queue
 import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Iterator, Optional
 
-from src.exception import DataDownloadError, ParsingError
-from src.generic_file_handlers.plain_file_handler import load_file
+from src.data_download.download_metrics import record_rsync
+from src.data_download.gzip_unpacker import gunzip_file, GunzipResult, GunzipStats
+from src.exception import DataDownloadError
+
+# second character of the top level item name decides the shard of the file (see _get_shard_filters) - that is
+# the second character of pdb id for mmcifs, and the third one for validation reports (in "divided" hash directory)
+_SHARD_CHARACTERS = "0123456789abcdefghijklmnopqrstuvwxyz"
+MAX_RSYNC_SHARDS = len(_SHARD_CHARACTERS)
+_RSYNC_FAILED = object()
+# unpacking processes are not forked, as forking while other threads run (reading rsync output) may deadlock
+_UNPACKING_PROCESS_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
 
 
 @dataclass(slots=True)
@@ -66,58 +79,123 @@ class RsyncDataType(Enum):
 
 
 def rsync_and_unzip(
-    rsync_data_type: RsyncDataType, gzip_folder: str, unpacked_folder: str, log_location: str
+    rsync_data_type: RsyncDataType,
+    gzip_folder: str,
+    unpacked_folder: str,
+    log_location: str,
+    max_unpacking_workers: int = 1,
+    unpack: bool = True,
+    rsync_shards: int = 1,
 ) -> RsyncLog:
     """
-    Assembles rsync command based on rsync data type. Runs the command. Parses the rsync log to get recieved
-    and deleted files entries. Unzips the gz from the files for recieved files, removes the removed from unzipped.
+    Assembles rsync command based on rsync data type. Runs the command, and parses its output (saved into the
+    log) as it comes, to get recieved and deleted files entries. Recieved files are unzipped by a pool of processes
+    while rsync is still running, so the unpacking overlaps with the transfer. Once rsync finishes, the removed
+    files are removed from unzipped. If unpacking is turned off, only rsync is run and its log parsed (the unzipped
+    folder is not touched at all).
+    If more rsync shards are requested, the files are split between multiple rsync processes running at the same
+    time, by the "divided" hash directory of the pdb id (second and third character of the id), so that each of
+    them builds shorter file list. Each one deletes only the files from its own part, so the result is the same as
+    if one rsync was run. Their logs are merged into one.
     :param rsync_data_type: Type of data to rsync. Rsync command is assembled based on it, and logs are parsed
     differently for each type (based on file extensions associated with the type).
     :param gzip_folder: Path to folder where .gz versions are stored. This is the rsync target.
     :param unpacked_folder: Folder where unpacked files are stored.
     :param log_location: Path of the log to be created and used.
+    :param max_unpacking_workers: Number of worker processes unpacking the recieved files.
+    :param unpack: If False, recieved files are not unpacked and removed files are not removed from unzipped.
+    :param rsync_shards: Number of rsync processes the files are split between (at most MAX_RSYNC_SHARDS).
     :return: Parsed rsync log.
+    :raises DataDownloadError: If any of the rsync processes fails (after all of them finished).
     """
-    rsync_command = _assemble_rsync_command(rsync_data_type, gzip_folder)
-    logging.info("Running rsync command: '%s'", " ".join(rsync_command))
-    _run_rsync_command(rsync_command, log_location)
-    logging.info("Rsync of gzip files done. Next: parsing log.")
+    rsync_commands = [
+        _assemble_rsync_command(rsync_data_type, gzip_folder, *_get_shard_filters(shard_index, rsync_shards))
+        for shard_index in range(rsync_shards)
+    ]
+    filename_suffix = _get_filename_suffix(rsync_data_type)
+    metrics_source = f"rsync_{rsync_data_type.name.lower()}"
+    rsync_log = RsyncLog()
+    rsync_start = time.perf_counter()
 
-    try:
-        rsync_raw_log = load_file(log_location)
-    except ParsingError as ex:
-        logging.critical(
-            "Failed to open rsync log %s. The changes to the files mentioned inside are not "
-            "processed. You need to see the log for recieved files, and either delete those gip files and"
-            "run the data download again unchanged, or unzip them yourself and then run the data download again"
-            "with the changed ids passed as OVERRIDE_IDS_TO_DOWNLOAD_PATH.",
-            log_location
+    if not unpack:
+        logging.info(
+            "Running rsync commands: %s. Recieved files are not unzipped.", _format_commands(rsync_commands)
         )
-        raise DataDownloadError(f"Failed to open rsync log {log_location}. {ex}") from ex
-
-    if rsync_data_type == RsyncDataType.ARCHIVE_MMCIF:
-        rsync_log = _parse_rsync_log_for_mmcif(rsync_raw_log)
-    elif rsync_data_type == RsyncDataType.XML_VALIDATION_REPORTS:
-        rsync_log = _parse_rsync_log_for_xml_validation(rsync_raw_log)
-    else:
-        raise DataDownloadError(f"Unsupported rsync type {rsync_data_type}.")
-
-    logging.info("Parsing rsync log finished. Next: unzipping new data.")
-    _gunzip_updated_files(rsync_log.recieved, gzip_folder, unpacked_folder)
-    logging.info("Unzipping new data finished. Next: deleting unzipped files not present in .gz files anymore.")
+        for _, line in _run_rsync_commands(rsync_commands, log_location):
+            if line is None:
+                continue
+            operation, log_item = _parse_rsync_log_line(line, filename_suffix)
+            if operation == "recv":
+                rsync_log.recieved.append(log_item)
+            elif operation == "del":
+                rsync_log.deleted.append(log_item)
+        logging.info("Rsync of gzip files finished.")
+        record_rsync(
+            metrics_source, time.perf_counter() - rsync_start, len(rsync_log.recieved), len(rsync_log.deleted)
+        )
+        return rsync_log
+
+    logging.info(
+        "Running rsync commands: %s. Recieved files are unzipped as they come.", _format_commands(rsync_commands)
+    )
+    gunzip_stats = GunzipStats()
+    with ProcessPoolExecutor(
+        max_workers=max_unpacking_workers, mp_context=multiprocessing.get_context(_UNPACKING_PROCESS_START_METHOD)
+    ) as executor:
+        unpackings: dict[str, tuple[RsyncLogItem, Future]] = {}
+        # rsync reports the file before it is transferred, so it is unpacked only once next file is reported
+        # by the same rsync (files are recieved one after another) or that rsync finishes
+        items_in_transfer: dict[int, RsyncLogItem] = {}
+        try:
+            for shard_index, line in _run_rsync_commands(rsync_commands, log_location):
+                if line is None:
+                    operation, log_item = "finished", None
+                else:
+                    operation, log_item = _parse_rsync_log_line(line, filename_suffix)
+                    if log_item is None:
+                        continue
+                if operation in ["recv", "finished"] and shard_index in items_in_transfer:
+                    _submit_gunzip(
+                        executor,
+                        unpackings,
+                        items_in_transfer.pop(shard_index),
+                        gzip_folder,
+                        unpacked_folder,
+                        gunzip_stats,
+                    )
+                if operation == "recv":
+                    items_in_transfer[shard_index] = log_item
+                    rsync_log.recieved.append(log_item)
+                elif operation == "del":
+                    rsync_log.deleted.append(log_item)
+        finally:
+            for item, unpacking_future in unpackings.values():
+                _process_gunzip_result(item, unpacking_future.result(), gunzip_stats)
+    gunzip_stats.log()
+    record_rsync(
+        metrics_source, time.perf_counter() - rsync_start, len(rsync_log.recieved), len(rsync_log.deleted), gunzip_stats
+    )
+
+    logging.info(
+        "Rsync of gzip files and unzipping of new data finished. Next: deleting unzipped files not present in .gz "
+        "files anymore."
+    )
     _delete_removed_files(rsync_log.deleted, unpacked_folder)
 
     logging.info("Finished deleting old unzipped files.")
     return rsync_log
 
 
-def _assemble_rsync_command(rsync_data_type: RsyncDataType, target_folder_path: str) -> list[str]:
+def _assemble_rsync_command(
+    rsync_data_type: RsyncDataType, target_folder_path: str, *shard_filters: str
+) -> list[str]:
     command = [
         "rsync",
         "-rLtz",
         "--delete",
         '--out-format="%o %f"',
         "--port=33444",
+        *shard_filters,  # need to be before other filters, first matching filter rule applies
     ]
 
     if rsync_data_type == RsyncDataType.ARCHIVE_MMCIF:
@@ -144,99 +222,211 @@ def _assemble_rsync_command(rsync_data_type: RsyncDataType, target_folder_path:
     return command
 
 
-def _run_rsync_command(rsync_command: list[str], log_location: str) -> None:
+def _get_shard_filters(shard_index: int, shard_count: int) -> list[str]:
+    """
+    Get rsync filter rules that limit rsync to one shard. Shard is determined by the second character of the name
+    of the top level item in the synced folder (structure file for mmcifs, "divided" hash directory for validation
+    reports). The first shard takes also all items that do not fit in any shard, so the shards together cover
+    everything. Items not in the shard are excluded, which also protects them from being deleted by the shard.
+    :param shard_index:
+    :param shard_count:
+    :return: Filter rules as rsync arguments (empty if there is only one shard).
+    """
+    if shard_count == 1:
+        return []
+    if shard_index == 0:
+        other_shards_characters = "".join(
+            character for index, character in enumerate(_SHARD_CHARACTERS) if index % shard_count != 0
+        )
+        return [f"--exclude=/?[{other_shards_characters}]*"]
+    return [f"--include=/?[{_SHARD_CHARACTERS[shard_index::shard_count]}]*", "--exclude=/*"]
+
+
+def _format_commands(commands: list[list[str]]) -> str:
+    return ", ".join(f"'{' '.join(command)}'" for command in commands)
+
+
+def _get_filename_suffix(rsync_data_type: RsyncDataType) -> str:
+    """
+    Get suffix of the files of given rsync type that are processed (other files in rsync log are ignored).
+    Structure id is the filename without this suffix.
+    :param rsync_data_type:
+    :return: Filename suffix.
+    """
+    if rsync_data_type == RsyncDataType.ARCHIVE_MMCIF:
+        return ".cif.gz"
+    if rsync_data_type == RsyncDataType.XML_VALIDATION_REPORTS:
+        return "_validation.xml.gz"
+    raise DataDownloadError(f"Unsupported rsync type {rsync_data_type}.")
+
+
+def _run_rsync_command(rsync_command: list[str], log_location: str) -> Iterator[str]:
+    """
+    Run rsync command, and yield lines of its output as they come. Each line is also written into the log.
+    :param rsync_command:
+    :param log_location:
+    :return: Iterator over output lines (without line endings).
+    :raises DataDownloadError: If rsync fails (after all its output was yielded).
+    """
     try:
-        with open(log_location, "w", encoding="utf8") as f:
-            subprocess.run(rsync_command, check=True, stdout=f)
-    except subprocess.CalledProcessError as ex:
+        with open(log_location, "w", encoding="utf8", buffering=1) as log_file:
+            with subprocess.Popen(rsync_command, stdout=subprocess.PIPE, encoding="utf8") as rsync_process:
+                for line in rsync_process.stdout:
+                    log_file.write(line)
+                    yield line.rstrip("\n")
+            if rsync_process.returncode != 0:
+                raise subprocess.CalledProcessError(rsync_process.returncode, rsync_command)
+    except (subprocess.CalledProcessError, OSError) as ex:
         logging.error("Called subproccess error:\n%s\n", ex)
         logging.critical(
             "Failed to finish rsync command. See newest rsync log to see files that were already synced "
-            "(file %s). The changes to the files mentioned inside are not "
-            "processed. You need to see the log for recieved files, and either delete those gip files and"
-            "run the data download again unchanged, or unzip them yourself and then run the data download again"
+            "(file %s). The files recieved before the failure were unzipped, but they are not processed "
+            "further. You need to see the log for recieved files, and either delete those gip files and "
+            "run the data download again unchanged, or run the data download again "
             "with the changed ids passed as OVERRIDE_IDS_TO_DOWNLOAD_PATH.",
             log_location
         )
         raise DataDownloadError(f"Rsync failed: {ex}") from ex
 
 
-def _parse_rsync_log_for_xml_validation(rsync_raw_log: str) -> RsyncLog:
-    rsync_log = _parse_rsync_log(rsync_raw_log, "_validation.xml.gz")
-
-    for rsync_item_list in [rsync_log.recieved, rsync_log.deleted]:
-        for rsync_item in rsync_item_list:
-            rsync_item.structure_id = rsync_item.filename.replace("_validation.xml.gz", "")
-
-    return rsync_log
-
-
-def _parse_rsync_log_for_mmcif(rsync_raw_log: str) -> RsyncLog:
-    rsync_log = _parse_rsync_log(rsync_raw_log, ".cif.gz")
-
-    for rsync_item_list in [rsync_log.recieved, rsync_log.deleted]:
-        for rsync_item in rsync_item_list:
-            rsync_item.structure_id = rsync_item.filename.replace(".cif.gz", "")
-
-    return rsync_log
-
-
-def _parse_rsync_log(text_to_parse: str, only_lines_with_string: str) -> RsyncLog:
+def _run_rsync_commands(rsync_commands: list[list[str]], log_location: str) -> Iterator[tuple[int, Optional[str]]]:
     """
-    Load rsync log produced with formatting "%o %f" as list of recieved files and deleted files. Take only lines
-    containing passed string.
-    :param text_to_parse:
-    :param only_lines_with_string:
-    :return: RsyncLog instance.
+    Run rsync commands at the same time, and yield lines of their output as they come. For more commands, each
+    writes its own log, and they are merged into one log in the end.
+    :param rsync_commands:
+    :param log_location:
+    :return: Iterator over index of the command and its output line (without line ending). After the last line
+    of each command that succeeded, None is yielded instead of the line.
+    :raises DataDownloadError: If any of the rsyncs fails (after all of them finished and all output was yielded).
     """
-    rsync_log = RsyncLog()
-
-    for line in text_to_parse.split(os.linesep):
-        if only_lines_with_string not in line:
-            continue
-
-        split_line = line.replace('"', "").split(" ")
-        if len(split_line) != 2:
-            logging.error("Log line '%s' failed to process! This info will be lost, unless processed manually.", line)
-
-        operation, filepath = split_line
-        filename = filepath.split(os.path.sep)[-1]
-        log_item = RsyncLogItem(relative_path=filepath, filename=filename)
-
-        if operation in ["del", "del."]:
-            rsync_log.deleted.append(log_item)
-        elif operation == "recv":
-            rsync_log.recieved.append(log_item)
-        else:
-            logging.error(
-                "Unexpected operation '%s' in line '%s'. If this line is valid, the info is lost! Manual action needed",
-                operation,
-                line
-            )
+    if len(rsync_commands) == 1:
+        for line in _run_rsync_command(rsync_commands[0], log_location):
+            yield 0, line
+        yield 0, None
+        return
 
-    return rsync_log
+    shard_log_locations = [f"{log_location}.shard{index}" for index in range(len(rsync_commands))]
+    output_lines: queue.Queue = queue.Queue()
+    failures: list[DataDownloadError] = []
 
-
-def _gunzip_updated_files(recieved_items: list[RsyncLogItem], gzip_folder: str, unpacked_folder: str) -> None:
-    for item in recieved_items:
-        source_path = os.path.join(gzip_folder, item.relative_path)
-        destination_path = os.path.join(unpacked_folder, item.filename.replace(".gz", ""))
+    def run_one_rsync(index: int) -> None:
         try:
-            _gunzip_one_file(source_path, destination_path)
+            for line in _run_rsync_command(rsync_commands[index], shard_log_locations[index]):
+                output_lines.put((index, line))
+            output_lines.put((index, None))
         except DataDownloadError as ex:
-            item.unpacking_failure = True
-            logging.critical(
-                "Structure %s rsynced, but failed to unzip. Manual action needed. %s", item.relative_path, ex
-            )
-
-
-def _gunzip_one_file(gz_filepath: str, unpacked_filepath: str) -> None:
+            failures.append(ex)
+            output_lines.put((index, _RSYNC_FAILED))
+        except Exception:  # pylint: disable=broad-exception-caught
+            output_lines.put((index, _RSYNC_FAILED))
+            raise
+
+    threads = [threading.Thread(target=run_one_rsync, args=(index,)) for index in range(len(rsync_commands))]
+    for thread in threads:
+        thread.start()
+    try:
+        running_count = len(threads)
+        while running_count > 0:
+            index, line = output_lines.get()
+            if line is None or line is _RSYNC_FAILED:
+                running_count -= 1
+            if line is not _RSYNC_FAILED:
+                yield index, line
+    finally:
+        for thread in threads:
+            thread.join()
+        _merge_shard_logs(shard_log_locations, log_location)
+
+    if failures:
+        raise DataDownloadError(f"{len(failures)} of {len(rsync_commands)} rsyncs failed: {failures}")
+
+
+def _merge_shard_logs(shard_log_locations: list[str], log_location: str) -> None:
     try:
-        with gzip.open(gz_filepath, "rb") as input_file:
-            with open(unpacked_filepath, "wb") as output_file:
-                shutil.copyfileobj(input_file, output_file)
+        with open(log_location, "wb") as log_file:
+            for shard_log_location in shard_log_locations:
+                if os.path.exists(shard_log_location):
+                    with open(shard_log_location, "rb") as shard_log_file:
+                        shutil.copyfileobj(shard_log_file, log_file)
+                    os.remove(shard_log_location)
     except OSError as ex:
-        raise DataDownloadError(f"Failed to unpack gz file: {ex}") from ex
+        logging.error(
+            "Failed to merge rsync logs into %s, logs of each rsync are kept in %s. %s",
+            log_location,
+            ", ".join(shard_log_locations),
+            ex,
+        )
+
+
+def _parse_rsync_log_line(line: str, filename_suffix: str) -> tuple[Optional[str], Optional[RsyncLogItem]]:
+    """
+    Parse one line of rsync log produced with formatting "%o %f". Only lines containing files with given suffix
+    are parsed.
+    :param line:
+    :param filename_suffix: Suffix of files to parse. Structure id is the filename without it.
+    :return: Operation ("recv" or "del") and log item. Nones if the line is not relevant or is invalid.
+    """
+    if filename_suffix not in line:
+        return None, None
+
+    split_line = line.replace('"', "").split(" ")
+    if len(split_line) != 2:
+        logging.error("Log line '%s' failed to process! This info will be lost, unless processed manually.", line)
+        return None, None
+
+    operation, filepath = split_line
+    filename = filepath.split(os.path.sep)[-1]
+    log_item = RsyncLogItem(
+        relative_path=filepath, filename=filename, structure_id=filename.replace(filename_suffix, "")
+    )
+
+    if operation in ["del", "del."]:
+        return "del", log_item
+    if operation == "recv":
+        return "recv", log_item
+    logging.error(
+        "Unexpected operation '%s' in line '%s'. If this line is valid, the info is lost! Manual action needed",
+        operation,
+        line
+    )
+    return None, None
+
+
+def _submit_gunzip(
+    executor: Executor,
+    unpackings: dict[str, tuple[RsyncLogItem, Future]],
+    item: RsyncLogItem,
+    gzip_folder: str,
+    unpacked_folder: str,
+    gunzip_stats: GunzipStats,
+) -> None:
+    """
+    Submit unpacking of recieved file to the executor. If the same file is already being unpacked (it was
+    recieved twice), wait for it first, so that they do not write the same file at once.
+    :param executor:
+    :param unpackings: Items and futures of submitted unpackings by relative path, updated with the new one.
+    :param item:
+    :param gzip_folder:
+    :param unpacked_folder:
+    :param gunzip_stats: Updated with result of the previous unpacking of the same file, if there was one.
+    """
+    if item.relative_path in unpackings:
+        previous_item, previous_unpacking_future = unpackings[item.relative_path]
+        _process_gunzip_result(previous_item, previous_unpacking_future.result(), gunzip_stats)
+    source_path = os.path.join(gzip_folder, item.relative_path)
+    destination_path = os.path.join(unpacked_folder, item.filename.replace(".gz", ""))
+    unpackings[item.relative_path] = (item, executor.submit(gunzip_file, source_path, destination_path))
+
+
+def _process_gunzip_result(item: RsyncLogItem, gunzip_result: GunzipResult, gunzip_stats: GunzipStats) -> None:
+    gunzip_stats.add(gunzip_result)
+    if gunzip_result.error is not None:
+        item.unpacking_failure = True
+        logging.critical(
+            "Structure %s rsynced, but failed to unzip. Manual action needed. %s",
+            item.relative_path,
+            gunzip_result.error,
+        )
 
 
 def _delete_removed_files(deleted_items: list[RsyncLogItem], unpacked_folder: str) -> None:
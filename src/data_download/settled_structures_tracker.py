@@ -0,0 +1,76 @@
+import logging
+import threading
+from typing import Callable, Iterable
+
+
+class SettledStructuresTracker:
+    """
+    Tracks which sources of which structures finished downloading. Once all sources of a structure are settled
+    (their download finished, successfully or not), the structure id is handed over via given callback, so that
+    it can be processed further while the download of other structures still runs. Sources are either per
+    structure (e.g. rest files, reported for each structure separately), or global (e.g. rsync of validation
+    xmls, reported once for all structures). Reports for structures that are not tracked are ignored. The callback
+    is called from the thread that reported the last source (outside of the lock, so it may block, e.g. on
+    a bounded queue). Safe to use from multiple threads.
+    """
+
+    def __init__(
+        self,
+        structure_ids: Iterable[str],
+        per_structure_sources: Iterable[str],
+        global_sources: Iterable[str],
+        on_structure_settled: Callable[[str], None],
+    ):
+        per_structure_sources = frozenset(per_structure_sources)
+        self._pending_sources = {structure_id: set(per_structure_sources) for structure_id in structure_ids}
+        self._pending_global_sources = set(global_sources)
+        self._on_structure_settled = on_structure_settled
+        self._settled_count = 0
+        self._lock = threading.Lock()
+
+    def structure_source_finished(self, source: str, structure_id: str) -> None:
+        """
+        Report that download from given source finished for given structure.
+        :param source: Name of per structure source.
+        :param structure_id:
+        """
+        with self._lock:
+            pending_sources = self._pending_sources.get(structure_id)
+            if pending_sources is None:
+                return
+            pending_sources.discard(source)
+            if pending_sources or self._pending_global_sources:
+                return
+            del self._pending_sources[structure_id]
+            self._settled_count += 1
+        self._on_structure_settled(structure_id)
+
+    def source_finished(self, source: str) -> None:
+        """
+        Report that download from given global source finished (for all structures).
+        :param source: Name of global source.
+        """
+        with self._lock:
+            self._pending_global_sources.discard(source)
+            if self._pending_global_sources:
+                return
+            settled_ids = [
+                structure_id for structure_id, pending_sources in self._pending_sources.items() if not pending_sources
+            ]
+            for structure_id in settled_ids:
+                del self._pending_sources[structure_id]
+            self._settled_count += len(settled_ids)
+        for structure_id in settled_ids:
+            self._on_structure_settled(structure_id)
+
+    def log_stats(self) -> None:
+        """
+        Log how many structures were handed over, and how many were not (because some of their sources
+        never reported finishing).
+        """
+        with self._lock:
+            logging.info(
+                "%s structures were handed over as settled during download, %s were not.",
+                self._settled_count,
+                len(self._pending_sources),
+            )
@@ -1,5 +1,7 @@
+import csv
 import logging
 import os
+import tempfile
 from os import path
 from typing import Optional
 
@@ -8,9 +10,61 @@ import pandas as pd
 from src.config import Config
 from src.generic_file_handlers.csv_handler import load_csv_as_dataframe
 from src.models import CSV_INVALID_VALUE_STRING
+from src.models.names_csv_output_attributes import CRUNCHED_CSV_FACTOR_ORDER
 from src.utils import find_matching_files
 
 
+class CrunchedRowsSink:
+    """
+    Collects crunched csv rows of structures as they are loaded. Rows are buffered and written in chunks into
+    temporary csv file (in given folder, as system temporary folder may be held in memory), so that only one chunk
+    of them is held in memory while the structures are loaded. Use as context manager (the temporary file is
+    deleted on exit).
+    """
+
+    def __init__(self, temporary_files_folder: str, chunk_size: int = 1000):
+        # pylint: disable=consider-using-with
+        self._file = tempfile.TemporaryFile(
+            mode="w+", encoding="utf8", newline="", dir=temporary_files_folder, suffix="_crunched_rows.csv"
+        )
+        self._writer = csv.writer(self._file, delimiter=";")
+        self._writer.writerow(CRUNCHED_CSV_FACTOR_ORDER)
+        self._chunk_size = chunk_size
+        self._buffered_rows: list[tuple[str, ...]] = []
+        self.row_count = 0
+
+    def __enter__(self) -> "CrunchedRowsSink":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._file.close()
+
+    def add(self, csv_values: tuple[str, ...]) -> None:
+        """
+        Add one row.
+        :param csv_values: Values of the row, in the order of CRUNCHED_CSV_FACTOR_ORDER.
+        """
+        self._buffered_rows.append(csv_values)
+        self.row_count += 1
+        if len(self._buffered_rows) >= self._chunk_size:
+            self._flush()
+
+    def load_as_dataframe(self) -> pd.DataFrame:
+        """
+        Load all the rows added so far.
+        :return: Dataframe with CRUNCHED_CSV_FACTOR_ORDER columns, values are strings as they were added.
+        """
+        self._flush()
+        self._file.seek(0)
+        df = pd.read_csv(self._file, sep=";", dtype=str, keep_default_na=False)
+        self._file.seek(0, os.SEEK_END)
+        return df
+
+    def _flush(self) -> None:
+        self._writer.writerows(self._buffered_rows)
+        self._buffered_rows.clear()
+
+
 def try_to_load_previous_crunched_df(config: Config) -> Optional[pd.DataFrame]:
     """
     Attempt to load previous crunched df based on path specified in config. If unsuccessful, return None.
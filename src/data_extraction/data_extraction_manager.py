@@ -1,17 +1,21 @@
 import logging
 import os.path
+from dataclasses import dataclass, field
+from itertools import chain
 from multiprocessing import Pool
 from os import path
-from typing import Optional
+from typing import Any, Callable, Optional
 
 import pandas as pd
 
 from src.config import Config
 from src.data_extraction.crunched_data_csv_handler import (
+    CrunchedRowsSink,
     create_csv_crunched_data,
     create_xlsx_crunched_data,
     try_to_load_previous_crunched_df, delete_old_crunched_csv,
 )
+from src.data_extraction.extraction_cache import ExtractionCache
 from src.data_extraction.inferred_protein_data_calculator import calculate_inferred_protein_data
 from src.data_extraction.ligand_occurance_handler import (
     update_ligand_occurrence_in_structures,
@@ -30,17 +34,36 @@ from src.generic_file_handlers.json_file_loader import load_json_file
 from src.generic_file_handlers.json_file_writer import write_json_file
 from src.models import LigandInfo, FactorType
 from src.models.ids_to_update import IdsToUpdateAndRemove
-from src.models.names_csv_output_attributes import CRUNCHED_CSV_FACTOR_ORDER
 from src.models.protein_data import (
     ProteinDataFromRest,
     ProteinDataFromPDBx,
     ProteinDataFromXML,
     ProteinDataFromVDB,
     ProteinDataComplete,
+    ProteinDataRow,
 )
 from src.generic_file_handlers.simple_lock_handler import release_simple_lock_file, LockType
 
 
+@dataclass(slots=True)
+class PrefetchedProteinData:
+    """
+    Protein data loaded already during download (see ProteinDataPrefetcher), and ligand stats they were loaded with.
+    """
+
+    # ligand stats already updated with ligands changed during download, None if the download did not get that far
+    ligand_stats: Optional[dict[str, LigandInfo]] = None
+    protein_data: dict[str, ProteinDataRow] = field(default_factory=dict)
+
+
+# config and ligand stats of protein data loading worker process, set once per process (so that tasks carry
+# only pdb ids instead of pickling the config and all the ligand stats into each of them)
+_worker_config: Optional[Config] = None
+_worker_ligand_stats: Optional[dict[str, LigandInfo]] = None
+# upper limit of how many structures are sent to worker process as one task
+_MAX_LOADING_CHUNK_SIZE = 16
+
+
 class DataExtractionManager:
     """
     Class with static methods only aggregating file loading and parsing operations into logical groups
@@ -100,7 +123,10 @@ class DataExtractionManager:
 
     @staticmethod
     def load_and_parse_rest(
-        pdb_id: str, ligand_info: dict[str, LigandInfo], config: Config
+        pdb_id: str,
+        ligand_info: dict[str, LigandInfo],
+        config: Config,
+        extraction_cache: Optional[ExtractionCache] = None,
     ) -> Optional[ProteinDataFromRest]:
         """
         Attempts to find needed rest files with given pdb_id (in location given by config). Then it loads their
@@ -108,63 +134,103 @@ class DataExtractionManager:
         :param pdb_id: PDB ID of protein to process.
         :param ligand_info: Dictionary containing ligand information.
         :param config: App configuration.
+        :param extraction_cache: (optional) Cache of already parsed protein data.
         :return: Instance of ProteinDataFromRest laoded with protein data, or None in case of serious error.
         """
         summary_json_path = path.join(config.filepaths.rest_jsons, "summary", f"{pdb_id}.json")
         assembly_json_path = path.join(config.filepaths.rest_jsons, "assembly", f"{pdb_id}.json")
         molecules_json_path = path.join(config.filepaths.rest_jsons, "molecules", f"{pdb_id}.json")
-        try:
-            protein_summary_json = load_json_file(summary_json_path)
-            protein_assembly_json = load_json_file(assembly_json_path)
-            protein_molecules_json = load_json_file(molecules_json_path)
-        except ParsingError as ex:
-            logging.error("[%s] Loading rest json files failed: %s", pdb_id, ex)
-            return None
 
-        return parse_rest(pdb_id, protein_summary_json, protein_assembly_json, protein_molecules_json, ligand_info)
+        def load_and_parse(ligand_info_to_use: dict[str, LigandInfo]) -> Optional[ProteinDataFromRest]:
+            try:
+                protein_summary_json = load_json_file(summary_json_path)
+                protein_assembly_json = load_json_file(assembly_json_path)
+                protein_molecules_json = load_json_file(molecules_json_path)
+            except ParsingError as ex:
+                logging.error("[%s] Loading rest json files failed: %s", pdb_id, ex)
+                return None
+            return parse_rest(
+                pdb_id, protein_summary_json, protein_assembly_json, protein_molecules_json, ligand_info_to_use
+            )
+
+        return _load_or_parse(
+            extraction_cache,
+            "rest",
+            pdb_id,
+            [summary_json_path, assembly_json_path, molecules_json_path],
+            load_and_parse,
+            ligand_info,
+        )
 
     @staticmethod
-    def load_and_parse_pdbx(pdb_id: str, config: Config) -> Optional[ProteinDataFromPDBx]:
+    def load_and_parse_pdbx(
+        pdb_id: str, config: Config, extraction_cache: Optional[ExtractionCache] = None
+    ) -> Optional[ProteinDataFromPDBx]:
         """
         Assembles path of mmcif file from pdb id and config, attempts to load it and process it into protein
         data instance.
         :param pdb_id: PDB ID of protein to process.
         :param config: App configuration.
+        :param extraction_cache: (optional) Cache of already parsed protein data.
         :return: Instance of ProteinDataFromPDBx loaded with protein data, or None in case of a serious error.
         """
-        filepath = path.join(config.filepaths.pdb_mmcifs, f"{pdb_id}.cif")
-        return parse_pdbx(pdb_id, filepath)
+        if config.read_gzipped_sources:
+            filepath = path.join(config.filepaths.gz_pdb_mmcifs, f"{pdb_id}.cif.gz")
+        else:
+            filepath = path.join(config.filepaths.pdb_mmcifs, f"{pdb_id}.cif")
+        return _load_or_parse(extraction_cache, "pdbx", pdb_id, [filepath], lambda _: parse_pdbx(pdb_id, filepath))
 
     @staticmethod
     def load_and_parse_xml_validation_report(
-        pdb_id: str, ligand_info: dict[str, LigandInfo], config: Config
+        pdb_id: str,
+        ligand_info: dict[str, LigandInfo],
+        config: Config,
+        extraction_cache: Optional[ExtractionCache] = None,
     ) -> Optional[ProteinDataFromXML]:
         """
         Attempts to load xml validation report file and extract relevant infromation from it.
         :param pdb_id: Id of the protein.
         :param ligand_info: Dictionary containing ligand information.
         :param config: App configuration containing paths where to look for the file.
+        :param extraction_cache: (optional) Cache of already parsed protein data.
         :return: Protein information in case of success, None in case of critical issue.
         """
-        filepath = path.join(config.filepaths.xml_reports, f"{pdb_id}_validation.xml")
-        return parse_xml_validation_report(pdb_id, filepath, ligand_info)
+        if config.read_gzipped_sources:
+            # gzipped reports keep the folder structure of the rsync source, e.g. de/1dey/1dey_validation.xml.gz
+            filepath = path.join(config.filepaths.gz_xml_reports, pdb_id[1:3], pdb_id, f"{pdb_id}_validation.xml.gz")
+        else:
+            filepath = path.join(config.filepaths.xml_reports, f"{pdb_id}_validation.xml")
+        return _load_or_parse(
+            extraction_cache,
+            "xml",
+            pdb_id,
+            [filepath],
+            lambda ligand_info_to_use: parse_xml_validation_report(pdb_id, filepath, ligand_info_to_use),
+            ligand_info,
+        )
 
     @staticmethod
-    def load_and_parse_validator_db_result(pdb_id: str, config: Config) -> Optional[ProteinDataFromVDB]:
+    def load_and_parse_validator_db_result(
+        pdb_id: str, config: Config, extraction_cache: Optional[ExtractionCache] = None
+    ) -> Optional[ProteinDataFromVDB]:
         """
         Attempts to find validator db result.json, load it and extract relevant protein information from it.
         :param pdb_id: Id of the protein.
         :param config: App configuration containing paths where to look for the file.
+        :param extraction_cache: (optional) Cache of already parsed protein data.
         :return: Protein information in case of success, None in case of critical issue.
         """
         filepath = path.join(config.filepaths.validator_db_results, pdb_id, "result.json")
-        try:
-            result_json = load_json_file(filepath)
-        except ParsingError as ex:
-            logging.info("[%s] Loading VDB result.json file failed: %s", pdb_id, ex)
-            return None
 
-        return parse_validator_db_result(pdb_id, result_json)
+        def load_and_parse(_) -> Optional[ProteinDataFromVDB]:
+            try:
+                result_json = load_json_file(filepath)
+            except ParsingError as ex:
+                logging.info("[%s] Loading VDB result.json file failed: %s", pdb_id, ex)
+                return None
+            return parse_validator_db_result(pdb_id, result_json)
+
+        return _load_or_parse(extraction_cache, "vdb", pdb_id, [filepath], load_and_parse)
 
     @staticmethod
     def load_all_protein_data(
@@ -180,10 +246,13 @@ class DataExtractionManager:
         protein_data = ProteinDataComplete(pdb_id=pdb_id)
         if ligand_stats is None:
             ligand_stats = DataExtractionManager.load_and_parse_ligand_stats(config)
-        protein_data.pdbx = DataExtractionManager.load_and_parse_pdbx(pdb_id, config)
-        protein_data.vdb = DataExtractionManager.load_and_parse_validator_db_result(pdb_id, config)
-        protein_data.xml = DataExtractionManager.load_and_parse_xml_validation_report(pdb_id, ligand_stats, config)
-        protein_data.rest = DataExtractionManager.load_and_parse_rest(pdb_id, ligand_stats, config)
+        extraction_cache = ExtractionCache(config.filepaths.extraction_cache) if config.use_extraction_cache else None
+        protein_data.pdbx = DataExtractionManager.load_and_parse_pdbx(pdb_id, config, extraction_cache)
+        protein_data.vdb = DataExtractionManager.load_and_parse_validator_db_result(pdb_id, config, extraction_cache)
+        protein_data.xml = DataExtractionManager.load_and_parse_xml_validation_report(
+            pdb_id, ligand_stats, config, extraction_cache
+        )
+        protein_data.rest = DataExtractionManager.load_and_parse_rest(pdb_id, ligand_stats, config, extraction_cache)
         calculate_inferred_protein_data(protein_data)
         logging.debug("[%s] All protein data loaded", pdb_id)
         return protein_data
@@ -202,11 +271,11 @@ class DataExtractionManager:
         update_structures_to_update_based_on_ligand_occurence(ids_to_update_and_remove, ligand_occurrence_json)
 
     @staticmethod
-    def update_ligand_occurrence_json(protein_data_list: list[ProteinDataComplete], config: Config) -> bool:
+    def update_ligand_occurrence_json(ligand_types_by_structure: dict[str, list[str]], config: Config) -> bool:
         """
-        For every protein data, make sure the ligand occurrence json has the structure's id noted down exactly for
-        the ligand names present in the data structure.
-        :param protein_data_list:
+        For every structure, make sure the ligand occurrence json has the structure's id noted down exactly for
+        the ligand names present in the structure.
+        :param ligand_types_by_structure: Ligand names present in the structure, by structure id.
         :param config:
         :return: True if successful.
         """
@@ -216,7 +285,7 @@ class DataExtractionManager:
                 ligand_occurrence_json = {}  # start fresh for this run mode
             else:
                 ligand_occurrence_json = load_json_file(config.filepaths.ligand_occurrence_json)
-            update_ligand_occurrence_in_structures(protein_data_list, ligand_occurrence_json)
+            update_ligand_occurrence_in_structures(ligand_types_by_structure, ligand_occurrence_json)
             write_json_file(config.filepaths.ligand_occurrence_json, ligand_occurrence_json)
             logging.info("Updating of ligand occurrence json file finished successfully.")
             return True
@@ -246,11 +315,11 @@ class DataExtractionManager:
 
     @staticmethod
     def store_protein_data_into_crunched_csv(
-        protein_data_list: list[ProteinDataComplete], structure_ids_to_remove: list[str], config: Config
+        rows_sink: CrunchedRowsSink, structure_ids_to_remove: list[str], config: Config
     ) -> bool:
         """
-        Takes list of protein data and updates crunched csv from it.
-        :param protein_data_list: List of collected ProteinDataComplete.
+        Takes crunched csv rows of collected protein data and updates crunched csv from them.
+        :param rows_sink: Sink with crunched csv rows of collected protein data.
         :param structure_ids_to_remove: List of ids of structures that are no longer desired in the crunched csv
         but may have been in the last version that gets updated.
         :param config: App config.
@@ -259,11 +328,8 @@ class DataExtractionManager:
         original_df = try_to_load_previous_crunched_df(config)
         if original_df is not None and len(structure_ids_to_remove) > 0:
             original_df = original_df[~original_df[FactorType.PDB_ID.value].isin(structure_ids_to_remove)]
-        # prepare data
-        protein_data_df_list = [pd.DataFrame([protein_data.as_dict_for_csv()]) for protein_data in protein_data_list]
-        # adding empty dataframe with desired column order on the start will ensure this order is in output csv
-        protein_data_df_list.insert(0, pd.DataFrame(columns=CRUNCHED_CSV_FACTOR_ORDER))
-        protein_data_df = pd.concat(protein_data_df_list, ignore_index=True)
+        # prepare data (the rows are in the desired column order already)
+        protein_data_df = rows_sink.load_as_dataframe()
         # if original df was loaded, combine it with protein data df and overwrite duplicates with new values
         if original_df is not None:
             protein_data_df = pd.concat([original_df, protein_data_df]).drop_duplicates(
@@ -276,11 +342,49 @@ class DataExtractionManager:
         return True
 
 
-def run_data_extraction(config: Config) -> bool:
+def init_protein_data_loading_worker(config: Config, ligand_stats: Optional[dict[str, LigandInfo]]) -> None:
+    """
+    Initialize worker process of pool loading protein data (to be used as pool initializer). With fork start
+    method, the ligand stats are inherited by the process and are not pickled at all.
+    :param config: App config.
+    :param ligand_stats: Already loaded ligand stats. If None, the worker loads them itself before loading
+    the first structure.
+    """
+    global _worker_config, _worker_ligand_stats  # pylint: disable=global-statement
+    _worker_config = config
+    _worker_ligand_stats = ligand_stats
+
+
+def load_protein_data_in_worker(pdb_id: str) -> ProteinDataComplete:
+    """
+    Extract all protein data from all the sources, with config and ligand stats the worker process was
+    initialized with (see init_protein_data_loading_worker).
+    :param pdb_id: Protein id.
+    :return: Collected protein data.
+    """
+    global _worker_ligand_stats  # pylint: disable=global-statement
+    if _worker_ligand_stats is None:
+        _worker_ligand_stats = DataExtractionManager.load_and_parse_ligand_stats(_worker_config)
+    return DataExtractionManager.load_all_protein_data(pdb_id, _worker_config, _worker_ligand_stats)
+
+
+def load_protein_data_row_in_worker(pdb_id: str) -> ProteinDataRow:
+    """
+    Extract all protein data from all the sources (see load_protein_data_in_worker), and return them in compact
+    form of crunched csv row, so that only that is sent back from worker process.
+    :param pdb_id: Protein id.
+    :return: Collected protein data as row.
+    """
+    return ProteinDataRow.from_protein_data(load_protein_data_in_worker(pdb_id))
+
+
+def run_data_extraction(config: Config, prefetched_protein_data: Optional[PrefetchedProteinData] = None) -> bool:
     """
     Do data extraction for pdb id set (defined by data download phase or config values). Creates crunched csv
     (in 3 versions) and updates ligand occurence across structures.
     :param config: Application configuration.
+    :param prefetched_protein_data: Protein data already loaded during download. They are used instead of loading
+    the same structures again, and their ligand stats (already updated) are used instead of updating them again.
     :return: True if action succeeded. False otherwise.
     """
     logging.info("PHASE DATA EXTRACTION is starting")
@@ -292,32 +396,63 @@ def run_data_extraction(config: Config) -> bool:
     except (ParsingError, ValueError) as ex:
         logging.error(ex)
         return False
-    # update ligand stats if needed, then load it
-    if ids_to_update_and_remove.ligands_to_update or ids_to_update_and_remove.ligands_to_delete:
-        DataExtractionManager.update_ligand_stats(config, ids_to_update_and_remove)
-    ligand_stats = DataExtractionManager.load_and_parse_ligand_stats(config)
+    if prefetched_protein_data is not None and prefetched_protein_data.ligand_stats is not None:
+        # ligand stats were already updated (based on the same changed ligands) and loaded during download
+        ligand_stats = prefetched_protein_data.ligand_stats
+        reused_protein_data = prefetched_protein_data.protein_data
+    else:
+        # update ligand stats if needed, then load it
+        if ids_to_update_and_remove.ligands_to_update or ids_to_update_and_remove.ligands_to_delete:
+            DataExtractionManager.update_ligand_stats(config, ids_to_update_and_remove)
+        ligand_stats = DataExtractionManager.load_and_parse_ligand_stats(config)
+        reused_protein_data = {}
 
     logging.info("Starting data extraction parsing of the protein data itself.")
-    with Pool(config.max_process_count) as p:
-        collected_data = p.starmap(
-            DataExtractionManager.load_all_protein_data,
-            [(pdb_id, config, ligand_stats) for pdb_id in ids_to_update_and_remove.structures_to_update],
+    ids_to_load = [
+        pdb_id for pdb_id in ids_to_update_and_remove.structures_to_update if pdb_id not in reused_protein_data
+    ]
+    reused_rows = [
+        reused_protein_data[pdb_id]
+        for pdb_id in ids_to_update_and_remove.structures_to_update
+        if pdb_id in reused_protein_data
+    ]
+    with CrunchedRowsSink(config.filepaths.output_root_path) as rows_sink:
+        # rows are streamed into the sink as the structures are loaded (in any order), so that the protein data
+        # of all structures are never held in memory at once
+        ligand_types_by_structure = {}
+        failed_pdb_ids = []
+        with Pool(
+            config.max_process_count, initializer=init_protein_data_loading_worker, initargs=(config, ligand_stats)
+        ) as p:
+            loaded_rows = p.imap_unordered(
+                load_protein_data_row_in_worker, ids_to_load, chunksize=_get_loading_chunk_size(ids_to_load, config)
+            )
+            for protein_data_row in chain(reused_rows, loaded_rows):
+                if protein_data_row.successful:
+                    rows_sink.add(protein_data_row.csv_values)
+                    ligand_types_by_structure[protein_data_row.pdb_id] = protein_data_row.ligand_types_present
+                else:
+                    failed_pdb_ids.append(protein_data_row.pdb_id)
+        logging.info(
+            "Finished data extraction prasing of the protein data itself (%s structures were loaded already during "
+            "download).",
+            len(reused_rows),
         )
-    logging.info("Finished data extraction prasing of the protein data itself.")
+        overall_success = _log_failed_structures(failed_pdb_ids, len(ids_to_load) + len(reused_rows))
 
-    successful_protein_data, overall_success = _filter_and_log_failed_protein_data(collected_data)
-
-    if len(successful_protein_data) > 0:
-        overall_success &= DataExtractionManager.update_ligand_occurrence_json(
-            successful_protein_data, config
+        if rows_sink.row_count > 0:
+            overall_success &= DataExtractionManager.update_ligand_occurrence_json(ligand_types_by_structure, config)
+        if len(ids_to_update_and_remove.structures_to_delete) > 0:
+            overall_success &= DataExtractionManager.remove_structures_from_ligand_occurrence_json(
+                ids_to_update_and_remove.structures_to_delete, config
+            )
+        overall_success &= DataExtractionManager.store_protein_data_into_crunched_csv(
+            rows_sink, ids_to_update_and_remove.structures_to_delete, config
         )
-    if len(ids_to_update_and_remove.structures_to_delete) > 0:
-        overall_success &= DataExtractionManager.remove_structures_from_ligand_occurrence_json(
-            ids_to_update_and_remove.structures_to_delete, config
+    if config.use_extraction_cache:
+        ExtractionCache(config.filepaths.extraction_cache).remove_structures(
+            ids_to_update_and_remove.structures_to_delete
         )
-    overall_success &= DataExtractionManager.store_protein_data_into_crunched_csv(
-        successful_protein_data, ids_to_update_and_remove.structures_to_delete, config
-    )
 
     delete_old_crunched_csv(config.filepaths.output_root_path, config.current_formatted_date)
     logging.info("PHASE DATA EXTRACTION %s.", "finished successfully" if overall_success else "failed")
@@ -328,31 +463,54 @@ def run_data_extraction(config: Config) -> bool:
     return overall_success
 
 
-def _filter_and_log_failed_protein_data(
-    protein_data_list: list[ProteinDataComplete]
-) -> tuple[list[ProteinDataComplete], bool]:
+def _load_or_parse(
+    extraction_cache: Optional[ExtractionCache],
+    source: str,
+    pdb_id: str,
+    input_filepaths: list[str],
+    parse: Callable[[Optional[dict[str, LigandInfo]]], Any],
+    ligand_stats: Optional[dict[str, LigandInfo]] = None,
+) -> Any:
     """
-    Get back only the data considered successfull and bool whether all succeeded, log those that are considered failed.
-    :param protein_data_list:
-    :return: Tuple consisting of filtered protein data list and bool that is True if all protein data were considered
-    successfull.
+    Parse protein data from one source, using extraction cache if it is given.
+    :param extraction_cache: Cache of already parsed protein data, or None if it is not used.
+    :param source: Source name.
+    :param pdb_id:
+    :param input_filepaths: All files the protein data are parsed from.
+    :param parse: Function parsing the protein data (given the ligand stats).
+    :param ligand_stats: Ligand stats, if the source parser uses them.
+    :return: Parsed protein data, None in case of critical issue.
     """
-    failed_pdb_ids = []
-    successfull_data_list = []
+    if extraction_cache is None:
+        return parse(ligand_stats)
+    return extraction_cache.load_or_parse(source, pdb_id, input_filepaths, parse, ligand_stats)
+
+
+def _get_loading_chunk_size(ids_to_load: list[str], config: Config) -> int:
+    """
+    Get how many structures to send to worker process as one task - big enough to lower the overhead of sending
+    tasks and results, small enough to keep all the processes busy until the end (and keep the results that
+    wait for the main process small).
+    :param ids_to_load:
+    :param config:
+    :return: Chunk size.
+    """
+    return max(1, min(_MAX_LOADING_CHUNK_SIZE, len(ids_to_load) // (config.max_process_count * 4)))
 
-    for protein_data in protein_data_list:
-        if protein_data.successful:
-            successfull_data_list.append(protein_data)
-        else:
-            failed_pdb_ids.append(protein_data.pdb_id)
 
+def _log_failed_structures(failed_pdb_ids: list[str], structure_count: int) -> bool:
+    """
+    Log structures whose protein data are considered failed.
+    :param failed_pdb_ids:
+    :param structure_count: Count of all structures whose protein data were collected.
+    :return: True if all protein data were considered successfull.
+    """
     if len(failed_pdb_ids) > 0:
         logging.error(
             "%s out of %s pdb ids failed to extract and update. If any succeeded, they are still updated. "
             "The failed ids: %s",
             len(failed_pdb_ids),
-            len(protein_data_list),
+            structure_count,
             ", ".join(failed_pdb_ids)
         )
-
-    return successfull_data_list, len(failed_pdb_ids) == 0
+    return len(failed_pdb_ids) == 0
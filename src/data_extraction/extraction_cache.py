@@ -0,0 +1,229 @@
+import logging
+import os
+import pickle
+import tempfile
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from os import path
+from typing import Any, Callable, Iterator, Optional
+
+from src.models import LigandInfo
+from src.utils import file_hash
+
+# version of each source parser, it needs to be raised whenever the parser starts to produce different protein
+# data from the same files, so that the results cached by previous version are not used
+PARSER_VERSIONS = {
+    "pdbx": 1,
+    "xml": 1,
+    "rest": 1,
+    "vdb": 1,
+}
+
+
+@dataclass(slots=True)
+class FileFingerprint:
+    """
+    Identification of file content. Size and modification time are compared first, the hash of the content only
+    when the modification time differs (e.g. if the same file was downloaded again).
+    """
+
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+@dataclass(slots=True)
+class ExtractionCacheEntry:
+    """
+    Protein data parsed from one source of one structure, with everything they were parsed from.
+    """
+
+    parser_version: int
+    input_fingerprints: dict[str, FileFingerprint]
+    # ligand stats the parser looked up (None for ligands that were not present in them)
+    used_ligand_infos: dict[str, Optional[LigandInfo]] = field(default_factory=dict)
+    protein_data: Any = None
+
+
+class LigandStatsAccessRecorder(Mapping):
+    """
+    Read only view of ligand stats, that records which ligands were looked up in them (and what the lookup
+    returned). It is passed to the parsers instead of ligand stats, so that the cached result can be used later
+    only if the ligand stats it was based on did not change.
+    """
+
+    def __init__(self, ligand_stats: dict[str, LigandInfo]):
+        self._ligand_stats = ligand_stats
+        self.used_ligand_infos: dict[str, Optional[LigandInfo]] = {}
+
+    def __getitem__(self, ligand_id: str) -> LigandInfo:
+        ligand_info = self._ligand_stats.get(ligand_id)
+        self.used_ligand_infos[ligand_id] = ligand_info
+        if ligand_info is None:
+            raise KeyError(ligand_id)
+        return ligand_info
+
+    def __iter__(self) -> Iterator[str]:
+        # the whole ligand stats are used
+        self.used_ligand_infos.update(self._ligand_stats)
+        return iter(self._ligand_stats)
+
+    def __len__(self) -> int:
+        return len(self._ligand_stats)
+
+
+class ExtractionCache:
+    """
+    Persistent cache of protein data parsed from each source of each structure (one pickle file per source and
+    structure). Cached protein data are used instead of parsing the source files again if the files did not change,
+    the same version of parser was used and all ligand stats the parser looked up are the same. Safe to use
+    from multiple processes, as long as each structure is processed by one process at a time.
+    """
+
+    def __init__(self, cache_folder: str):
+        self._cache_folder = cache_folder
+
+    def load_or_parse(
+        self,
+        source: str,
+        pdb_id: str,
+        input_filepaths: list[str],
+        parse: Callable[[Optional[Mapping]], Any],
+        ligand_stats: Optional[dict[str, LigandInfo]] = None,
+    ) -> Any:
+        """
+        Get protein data of given structure from given source from cache, or parse them and store them
+        into cache (if the parsing succeeded).
+        :param source: Source name (one of PARSER_VERSIONS keys).
+        :param pdb_id: Id of the structure.
+        :param input_filepaths: All files the protein data are parsed from.
+        :param parse: Function parsing the protein data, it is given the ligand stats (wrapped so that their usage
+        is recorded) and returns None if the parsing failed.
+        :param ligand_stats: Ligand stats, if the parser uses them.
+        :return: Protein data (cached or parsed), None if the parsing failed.
+        """
+        entry_path = self._get_entry_path(source, pdb_id)
+        entry = self._load_entry(entry_path, pdb_id)
+        input_fingerprints = {}
+        if entry is not None and self._is_entry_valid(entry, source, input_filepaths, ligand_stats, input_fingerprints):
+            logging.debug("[%s] Protein data from %s loaded from extraction cache.", pdb_id, source)
+            if input_fingerprints != entry.input_fingerprints:
+                # some files were modified without changing their content, their new fingerprints are stored
+                # so that their content does not need to be hashed next time
+                entry.input_fingerprints = input_fingerprints
+                self._store_entry(entry_path, entry, pdb_id)
+            return entry.protein_data
+
+        # fingerprints are taken before parsing, so that files modified during parsing are parsed again next time
+        for filepath in input_filepaths:
+            if filepath not in input_fingerprints:
+                input_fingerprints[filepath] = _get_file_fingerprint(filepath)
+        recorded_ligand_stats = LigandStatsAccessRecorder(ligand_stats) if ligand_stats is not None else None
+        protein_data = parse(recorded_ligand_stats)
+        if protein_data is not None and None not in input_fingerprints.values():
+            self._store_entry(
+                entry_path,
+                ExtractionCacheEntry(
+                    parser_version=PARSER_VERSIONS[source],
+                    input_fingerprints=input_fingerprints,
+                    used_ligand_infos=(
+                        recorded_ligand_stats.used_ligand_infos if recorded_ligand_stats is not None else {}
+                    ),
+                    protein_data=protein_data,
+                ),
+                pdb_id,
+            )
+        return protein_data
+
+    def remove_structures(self, pdb_ids: list[str]) -> None:
+        """
+        Remove cached protein data of given structures from all sources.
+        :param pdb_ids:
+        """
+        for pdb_id in pdb_ids:
+            for source in PARSER_VERSIONS:
+                try:
+                    os.remove(self._get_entry_path(source, pdb_id))
+                except FileNotFoundError:
+                    pass
+                except OSError as ex:
+                    logging.warning(
+                        "[%s] Failed to remove %s protein data from extraction cache: %s", pdb_id, source, ex
+                    )
+
+    def _get_entry_path(self, source: str, pdb_id: str) -> str:
+        # structures are split into subfolders by middle characters of their ids (the same way as in pdb archive)
+        return path.join(self._cache_folder, source, pdb_id[1:3], f"{pdb_id}.pickle")
+
+    @staticmethod
+    def _is_entry_valid(
+        entry: ExtractionCacheEntry,
+        source: str,
+        input_filepaths: list[str],
+        ligand_stats: Optional[dict[str, LigandInfo]],
+        input_fingerprints: dict[str, Optional[FileFingerprint]],
+    ) -> bool:
+        """
+        Check whether the cached entry can be used. Fingerprints of input files computed during the check are
+        collected into input_fingerprints.
+        """
+        if entry.parser_version != PARSER_VERSIONS[source] or set(entry.input_fingerprints) != set(input_filepaths):
+            return False
+        for ligand_id, ligand_info in entry.used_ligand_infos.items():
+            if ligand_stats is None or ligand_stats.get(ligand_id) != ligand_info:
+                return False
+        for filepath in input_filepaths:
+            cached_fingerprint = entry.input_fingerprints[filepath]
+            try:
+                file_stat = os.stat(filepath)
+            except OSError:
+                return False
+            if file_stat.st_size != cached_fingerprint.size:
+                return False
+            if file_stat.st_mtime_ns == cached_fingerprint.mtime_ns:
+                input_fingerprints[filepath] = cached_fingerprint
+                continue
+            fingerprint = _get_file_fingerprint(filepath)
+            input_fingerprints[filepath] = fingerprint
+            if fingerprint is None or fingerprint.sha256 != cached_fingerprint.sha256:
+                return False
+        return True
+
+    @staticmethod
+    def _load_entry(entry_path: str, pdb_id: str) -> Optional[ExtractionCacheEntry]:
+        try:
+            with open(entry_path, "rb") as entry_file:
+                entry = pickle.load(entry_file)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            # corrupted entry or entry of no longer existing classes, it is just parsed again
+            logging.debug("[%s] Failed to load entry %s from extraction cache: %s", pdb_id, entry_path, ex)
+            return None
+        return entry if isinstance(entry, ExtractionCacheEntry) else None
+
+    @staticmethod
+    def _store_entry(entry_path: str, entry: ExtractionCacheEntry, pdb_id: str) -> None:
+        # written into temporary file first and then replaced, so that incomplete entry is never read
+        temporary_path = None
+        try:
+            entry_folder = path.dirname(entry_path)
+            os.makedirs(entry_folder, exist_ok=True)
+            with tempfile.NamedTemporaryFile("wb", dir=entry_folder, suffix=".tmp", delete=False) as entry_file:
+                temporary_path = entry_file.name
+                pickle.dump(entry, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, entry_path)
+        except (OSError, pickle.PicklingError) as ex:
+            logging.warning("[%s] Failed to store entry %s into extraction cache: %s", pdb_id, entry_path, ex)
+            if temporary_path is not None and path.exists(temporary_path):
+                os.remove(temporary_path)
+
+
+def _get_file_fingerprint(filepath: str) -> Optional[FileFingerprint]:
+    try:
+        # stat is taken before hashing, so that file modified meanwhile does not get the stat of its new content
+        file_stat = os.stat(filepath)
+        sha256 = file_hash(filepath)
+    except OSError:
+        return None
+    return FileFingerprint(size=file_stat.st_size, mtime_ns=file_stat.st_mtime_ns, sha256=sha256)
@@ -1,5 +1,4 @@
 from src.models.ids_to_update import IdsToUpdateAndRemove
-from src.models.protein_data import ProteinDataComplete
 
 
 def update_structures_to_update_based_on_ligand_occurence(
@@ -25,17 +24,17 @@ def update_structures_to_update_based_on_ligand_occurence(
 
 
 def update_ligand_occurrence_in_structures(
-    protein_data_list: list[ProteinDataComplete], ligand_occurrence_json: dict[str, list[str]]
+    ligand_types_by_structure: dict[str, list[str]], ligand_occurrence_json: dict[str, list[str]]
 ) -> None:
     """
     Add structure's ligands to the json structure.
-    :param protein_data_list: List of complete protein data instances.
+    :param ligand_types_by_structure: Ligand names present in the structure, by structure id.
     :param ligand_occurrence_json:
     :return:
     """
-    for protein_data in protein_data_list:
-        if protein_data.pdbx and len(protein_data.pdbx.ligand_types_present) > 0:
-            ligand_occurrence_json[protein_data.pdb_id] = list(protein_data.pdbx.ligand_types_present)
+    for structure_id, ligand_types_present in ligand_types_by_structure.items():
+        if len(ligand_types_present) > 0:
+            ligand_occurrence_json[structure_id] = ligand_types_present
 
 
 def remove_structure_from_ligand_occurrence(
@@ -0,0 +1,318 @@
+import gzip
+import mmap
+import os
+import re
+from typing import IO, Iterable, Iterator, Optional
+
+# uncompressed files at least this big are memory mapped instead of read through buffered file
+MMCIF_MEMORY_MAP_MIN_SIZE = 4 * 1024 * 1024
+_QUOTE_CHARACTERS = "'\""
+_WHITESPACE_CHARACTERS = " \t"
+# line without any of these is split into the same tokens by str.split() as by the full mmcif tokenizer
+# (no quotes, comments, item names or loop_ keywords, and no whitespace other than space and tab)
+_LINE_NEEDS_FULL_TOKENIZING = re.compile(rb"[\"'#_\x0b\x0c\x1c-\x1f\x80-\xff]")
+# line of skipped loop without any of these has the same number of tokens in bytes.split() as in the full mmcif
+# tokenizer (quotes and comments matter only at the start of token), and none of its tokens can end the loop
+# (token starting with underscore or loop_ keyword)
+_SKIPPED_LINE_NEEDS_FULL_TOKENIZING = re.compile(rb"[\x0b\x0c]|(?:^|[ \t])(?:[\"'#_]|[Ll][Oo][Oo][Pp]_)")
+
+
+class _MmcifItemCollector:
+    """
+    Processes tokens of mmcif file the same way as Biopython's MMCIF2Dict does, but stores only wanted items.
+    """
+
+    def __init__(self, item_names: Iterable[str], group_item_name: Optional[str] = None):
+        self.items: dict[str, list[str]] = {}
+        self.rows_skipped = False
+        self._wanted_item_names = set(item_names)
+        self._group_item_name = group_item_name
+        self._header_seen = False
+        self._key: Optional[str] = None
+        self._loop_flag = False
+        self._loop_keys: list[str] = []
+        # list the values of each loop column are appended to (None if the column is not wanted)
+        self._loop_columns: list[Optional[list[str]]] = []
+        self._wanted_loop_columns: list[tuple[int, list[str]]] = []
+        # column of the group item in current loop (None if there is none, or the first group already ended),
+        # and its value in the first row
+        self._group_column_index: Optional[int] = None
+        self._group_value: Optional[str] = None
+        self._i = 0
+        self._n = 0
+
+    @property
+    def in_loop_values(self) -> bool:
+        """
+        True if loop values are being read (the loop header is complete).
+        """
+        return self._loop_flag and self._i > 0
+
+    @property
+    def rest_of_loop_unwanted(self) -> bool:
+        """
+        True if the rest of current loop is not wanted (none of its columns is wanted, or the first group
+        of its rows ended), so its values only need to be counted.
+        """
+        return not self._wanted_loop_columns
+
+    def process_tokens(self, tokens: Iterable[str]) -> None:
+        """
+        Process tokens in the order they appear in the file.
+        :param tokens:
+        :raises ValueError: If the file does not start with data_ directive, or loop has no items.
+        """
+        for token in tokens:
+            self._process_token(token)
+
+    def process_loop_row(self, row_tokens: list[str]) -> bool:
+        """
+        Process whole row of loop values at once, if it is possible to do so without looking at each token
+        (the row is complete, and none of the tokens is a keyword or item name).
+        :param row_tokens: Tokens of one line, none of them is loop_ or starts with underscore.
+        :return: True if the row was processed, False if it needs to be processed token by token.
+        """
+        if not self.in_loop_values or len(row_tokens) != self._n or self._i % self._n != 0:
+            return False
+        if self._group_column_index is not None:
+            group_value = row_tokens[self._group_column_index]
+            if self._group_value is None:
+                self._group_value = group_value
+            elif group_value != self._group_value:
+                self._end_group()
+        for column_index, column_values in self._wanted_loop_columns:
+            column_values.append(row_tokens[column_index])
+        self._i += self._n
+        return True
+
+    def skip_loop_values(self, value_count: int) -> None:
+        """
+        Count values of unwanted loop without processing them (they must not contain loop_ keyword or
+        any value starting with underscore, as those may end the loop).
+        :param value_count:
+        """
+        self._i += value_count
+
+    def _process_token(self, token: str) -> None:
+        if not self._header_seen:
+            self._header_seen = True
+            if not token[0:5].startswith("data_"):
+                raise ValueError("The input mmCIF file must begin with a 'data_' directive.")
+            return
+        if token.lower() == "loop_":
+            self._loop_flag = True
+            self._loop_keys = []
+            self._loop_columns = []
+            self._wanted_loop_columns = []
+            self._group_column_index = None
+            self._group_value = None
+            self._i = 0
+            self._n = 0
+            return
+        if self._loop_flag:
+            # item name in the first column ends the loop (or is another item of the loop header)
+            if token.startswith("_") and (self._n == 0 or self._i % self._n == 0):
+                if self._i > 0:
+                    self._loop_flag = False
+                else:
+                    self._add_loop_key(token)
+                    return
+            else:
+                if self._n == 0:
+                    raise ValueError("Loop without any items.")
+                if self._i % self._n == self._group_column_index:
+                    if self._group_value is None:
+                        self._group_value = token
+                    elif token != self._group_value:
+                        self._end_group()
+                column_values = self._loop_columns[self._i % self._n]
+                if column_values is not None:
+                    column_values.append(token)
+                self._i += 1
+                return
+        if self._key is None:
+            self._key = token
+        else:
+            if self._key in self._wanted_item_names:
+                self.items[self._key] = [token]
+            self._key = None
+
+    def _end_group(self) -> None:
+        # values of the unfinished row that were already stored are removed, so that all columns have the same length;
+        # values of the rest of the loop are then only counted, so that the end of the loop is found
+        complete_row_count = self._i // self._n
+        for _, column_values in self._wanted_loop_columns:
+            del column_values[complete_row_count:]
+        self._loop_columns = [None] * self._n
+        self._wanted_loop_columns = []
+        self._group_column_index = None
+        self.rows_skipped = True
+
+    def _add_loop_key(self, key: str) -> None:
+        if key == self._group_item_name:
+            self._group_column_index = self._n
+        column_values = None
+        if key in self._wanted_item_names:
+            column_values = []
+            self.items[key] = column_values
+            # values of repeated item go into the newest list, as the values are appended by item name
+            self._loop_columns = [
+                column_values if loop_key == key else loop_column
+                for loop_key, loop_column in zip(self._loop_keys, self._loop_columns)
+            ]
+        self._loop_keys.append(key)
+        self._loop_columns.append(column_values)
+        self._wanted_loop_columns = [
+            (column_index, loop_column)
+            for column_index, loop_column in enumerate(self._loop_columns)
+            if loop_column is not None
+        ]
+        self._n += 1
+
+
+def read_mmcif_items(filepath: str, item_names: Iterable[str]) -> dict[str, list[str]]:
+    """
+    Read given items (e.g. _atom_site.id) from mmcif file. The result is the same as the result of Biopython's
+    MMCIF2Dict for those items (all values of the item as list of strings, items missing in the file are missing
+    in the result). It is faster, as loops with none of the wanted items (e.g. anisotropic displacements or
+    sequence schemes) are skipped line by line, only counting their values (so that the loop ends at the same
+    place as in MMCIF2Dict, even if some unquoted values start with underscore), only the wanted columns are
+    stored, and lines without quotes are split in one go. Uncompressed files at least MMCIF_MEMORY_MAP_MIN_SIZE
+    big are memory mapped.
+    :param filepath: Path to mmcif file (gzipped if it has .gz extension).
+    :param item_names: Full names of the items to read.
+    :return: Values of the items present in the file, by item name.
+    :raises OSError: If the file cannot be read (or EOFError for truncated gzip file).
+    :raises ValueError: If the file is not valid mmcif (in the parts that are not skipped).
+    """
+    items, _ = read_mmcif_items_of_first_group(filepath, item_names, None)
+    return items
+
+
+def read_mmcif_items_of_first_group(
+    filepath: str, item_names: Iterable[str], group_item_name: Optional[str]
+) -> tuple[dict[str, list[str]], bool]:
+    """
+    Read given items from mmcif file the same way as read_mmcif_items, but the rows of the loop with given group
+    item are read only while the group item has the same value as in the first row (e.g. only the first model
+    with _atom_site.pdbx_PDB_model_num). Values in the rest of such loop are only counted.
+    :param filepath: Path to mmcif file (gzipped if it has .gz extension).
+    :param item_names: Full names of the items to read.
+    :param group_item_name: Full name of the group item (None to read all rows).
+    :return: Values of the items present in the file by item name, and True if any rows were skipped
+    because they belong to other groups.
+    :raises OSError: If the file cannot be read (or EOFError for truncated gzip file).
+    :raises ValueError: If the file is not valid mmcif (in the parts that are not skipped).
+    """
+    collector = _MmcifItemCollector(item_names, group_item_name)
+    if filepath.endswith(".gz"):
+        with gzip.open(filepath, "rb") as mmcif_file:
+            _read_mmcif_items_from_lines(mmcif_file, collector)
+    else:
+        with open(filepath, "rb") as mmcif_file:
+            if os.fstat(mmcif_file.fileno()).st_size < MMCIF_MEMORY_MAP_MIN_SIZE:
+                _read_mmcif_items_from_lines(mmcif_file, collector)
+            else:
+                with mmap.mmap(mmcif_file.fileno(), 0, access=mmap.ACCESS_READ) as mmcif_map:
+                    _read_mmcif_items_from_lines(iter(mmcif_map.readline, b""), collector)
+    return collector.items, collector.rows_skipped
+
+
+def _read_mmcif_items_from_lines(lines: IO[bytes] | Iterator[bytes], collector: _MmcifItemCollector) -> None:
+    """
+    Read items from lines of mmcif file (see read_mmcif_items) into given collector.
+    :param lines: Lines of the file, as bytes.
+    :param collector: Collector of the wanted items.
+    :raises ValueError: If the file is not valid mmcif (in the parts that are not skipped).
+    """
+    lines = iter(lines)
+    empty = True
+    skipping_loop = False
+
+    for raw_line in lines:
+        empty = False
+        if raw_line.startswith(b"#"):
+            continue
+        if raw_line.startswith(b";"):
+            text_field, raw_line = _read_text_field(raw_line, lines, decode=not skipping_loop)
+            if skipping_loop:
+                collector.skip_loop_values(1)
+            else:
+                collector.process_tokens([text_field])
+        if skipping_loop:
+            if _SKIPPED_LINE_NEEDS_FULL_TOKENIZING.search(raw_line) is None:
+                collector.skip_loop_values(len(raw_line.split()))
+                continue
+            tokens = list(_split_line(raw_line.decode("utf8").strip()))
+            if not any(token.startswith("_") or token.lower() == "loop_" for token in tokens):
+                collector.skip_loop_values(len(tokens))
+                continue
+            # some token may end the loop, depending on its position in the row
+            collector.process_tokens(tokens)
+        elif _LINE_NEEDS_FULL_TOKENIZING.search(raw_line) is None:
+            tokens = raw_line.decode("ascii").split()
+            if not collector.process_loop_row(tokens):
+                collector.process_tokens(tokens)
+        else:
+            collector.process_tokens(_split_line(raw_line.decode("utf8").strip()))
+        # the rest of the loop is not interesting, its values are only counted until the loop ends
+        skipping_loop = collector.in_loop_values and collector.rest_of_loop_unwanted
+
+    if empty:
+        raise ValueError("Empty file.")
+
+
+def _read_text_field(first_line: bytes, lines: Iterator[bytes], decode: bool) -> tuple[Optional[str], bytes]:
+    """
+    Read text field (value spanning multiple lines, delimited by lines starting with semicolon).
+    :param first_line: Line starting the text field.
+    :param lines: Iterator over the following lines.
+    :param decode: If False, the lines are only skipped and None is returned as the text field.
+    :return: The text field, and the rest of the line that closed it.
+    :raises ValueError: If the text field is not closed, or its closing semicolon is not followed by whitespace.
+    """
+    text_lines = [first_line[1:].decode("utf8").rstrip()] if decode else None
+    for raw_line in lines:
+        if raw_line.startswith(b";"):
+            line_rest = raw_line[1:].rstrip()
+            if line_rest and line_rest[:1] not in (b" ", b"\t"):
+                raise ValueError("Missing whitespace")
+            return "\n".join(text_lines) if decode else None, line_rest
+        if decode:
+            text_lines.append(raw_line.decode("utf8").rstrip())
+    raise ValueError("Missing closing semicolon")
+
+
+def _split_line(line: str) -> Iterator[str]:
+    """
+    Split line into tokens, respecting quotes and comments (the same way as Biopython's MMCIF2Dict).
+    :param line: Line stripped of whitespace.
+    :return: Tokens of the line.
+    :raises ValueError: If the line ends with quote open.
+    """
+    in_token = False
+    quote_open_char = None
+    start_i = 0
+    for i, c in enumerate(line):
+        if c in _WHITESPACE_CHARACTERS:
+            if in_token and not quote_open_char:
+                in_token = False
+                yield line[start_i:i]
+        elif c in _QUOTE_CHARACTERS:
+            if not quote_open_char and not in_token:
+                quote_open_char = c
+                in_token = True
+                start_i = i + 1
+            elif c == quote_open_char and (i + 1 == len(line) or line[i + 1] in _WHITESPACE_CHARACTERS):
+                quote_open_char = None
+                in_token = False
+                yield line[start_i:i]
+        elif c == "#" and not in_token:
+            return
+        elif not in_token:
+            in_token = True
+            start_i = i
+    if in_token:
+        yield line[start_i:]
+    if quote_open_char:
+        raise ValueError("Line ended with quote open: " + line)
@@ -55,6 +55,9 @@ def _load_ids_to_update_and_remove_from_json(json_filepath: str) -> IdsToUpdateA
 
 
 def _get_all_structure_ids_from_present_pdbx_files(config: Config) -> list[str]:
+    if config.read_gzipped_sources:
+        pdbx_filenames = find_matching_files(config.filepaths.gz_pdb_mmcifs, ".cif.gz")
+        return [pdbx_filename.replace(".cif.gz", "") for pdbx_filename in pdbx_filenames]
     pdbx_filenames = find_matching_files(config.filepaths.pdb_mmcifs, ".cif")
     return [pdbx_filename.replace(".cif", "") for pdbx_filename in pdbx_filenames]
 
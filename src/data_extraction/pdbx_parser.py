@@ -1,67 +1,73 @@
 import logging
 import math
-from dataclasses import dataclass, field
-from typing import Optional, Generator
+from dataclasses import dataclass, fields
+from typing import Optional
 
+import numpy as np
 from Bio.PDB.MMCIF2Dict import MMCIF2Dict
 
 from src.models.protein_data import ProteinDataFromPDBx
 from src.models import Diagnostics
 from src.exception import PDBxParsingError
+from src.data_extraction.mmcif_reader import read_mmcif_items_of_first_group
+from src.generic_file_handlers.plain_file_handler import open_possibly_gzipped_file
 from src.utils import to_float, to_int
 from src.constants import METAL_ELEMENT_NAMES
 
-
-@dataclass(slots=True)
-class AtomSiteItem:
-    """
-    Holding relevant information from _atom_site for further processing.
-    """
-
-    atom_id: str
-    is_hetatm: bool
-    element_symbol: str
-    residue_name_label: str
-    residue_name_auth: str
-    residue_id_auth: str
-    residue_chain_id: str
-    model_number: str
-    occupancy: float
+# mmcif items used during parsing (others are not read from the file at all)
+_MMCIF_ITEMS_TO_READ = [
+    "_entry.id",
+    "_atom_site.id",
+    "_atom_site.group_PDB",
+    "_atom_site.type_symbol",
+    "_atom_site.label_comp_id",
+    "_atom_site.auth_seq_id",
+    "_atom_site.auth_comp_id",
+    "_atom_site.auth_asym_id",
+    "_atom_site.pdbx_PDB_model_num",
+    "_atom_site.occupancy",
+    "_entity.id",
+    "_entity.type",
+    "_entity.pdbx_number_of_molecules",
+    "_entity.formula_weight",
+    "_entity_poly_seq.entity_id",
+    "_exptl.method",
+    "_refine.ls_d_res_high",
+    "_reflns.d_resolution_high",
+    "_em_3d_reconstruction.resolution",
+]
 
 
 @dataclass(slots=True)
-class LigandIdentifier:
+class AtomSiteColumns:
     """
-    Unique combination of atom_site values to identify ligand for the purposes of PDBx parsing.
+    Relevant items from _atom_site as arrays (one value per atom), so that they can be processed as whole arrays.
     """
 
-    residue_id_auth: str
-    residue_name_auth: str
-    residue_chain_id: str
+    atom_ids: np.ndarray
+    is_hetatm: np.ndarray
+    element_symbols: np.ndarray
+    residue_names_label: np.ndarray
+    residue_ids_auth: np.ndarray
+    residue_names_auth: np.ndarray
+    residue_chain_ids: np.ndarray
+    model_numbers: np.ndarray
+    occupancies: np.ndarray
 
-    def __hash__(self):
+    def select(self, mask: np.ndarray) -> "AtomSiteColumns":
         """
-        Redefine hash for the purposes of using the instance as dictionary key.
-        :return: Hash of the dataclass instance.
+        Select only some atoms.
+        :param mask: Boolean array, True for atoms to select.
+        :return: New instance with selected atoms only.
         """
-        return hash((self.residue_id_auth, self.residue_name_auth, self.residue_chain_id))
-
-
-@dataclass(slots=True)
-class EncounteredLigand:
-    """
-    Ligand found during PDBx parsing, collects information about its atoms that is then processed.
-    """
-
-    id: LigandIdentifier
-    atoms: list[AtomSiteItem] = field(default_factory=list)
+        return AtomSiteColumns(*(getattr(self, field_.name)[mask] for field_ in fields(self)))
 
 
 def parse_pdbx(pdb_id: str, filepath: str) -> Optional[ProteinDataFromPDBx]:
     """
     Extracts and calculates protein information from mmcif (PDBx) file.
     :param pdb_id: PDB ID to extract.
-    :param filepath: Path to the mmcif file.
+    :param filepath: Path to the mmcif file (may be gzipped, with .gz extension).
     :return: Collected protein data.
     """
     logging.debug("[%s] PDBx parsing started. Will extract mmcif file from: %s", pdb_id, filepath)
@@ -90,12 +96,12 @@ def _parse_pdbx_unsafe(pdb_id: str, filepath: str) -> tuple[ProteinDataFromPDBx,
     diagnostics = Diagnostics()
 
     try:
-        mmcif_dict = MMCIF2Dict(filepath)
-    except OSError as ex:
+        mmcif_dict, other_models_skipped = _load_mmcif_items(pdb_id, filepath)
+    except (OSError, EOFError) as ex:
         raise PDBxParsingError(f"Failed to load PDBx file: {ex}") from ex
 
     _check_pdb_id_from_mmcif(mmcif_dict, pdb_id)
-    _extract_atom_and_ligand_counts(mmcif_dict, protein_data)
+    _extract_atom_and_ligand_counts(mmcif_dict, protein_data, other_models_skipped)
     _extract_straightforward_data(mmcif_dict, protein_data)
     _extract_data_resolution(mmcif_dict, protein_data)
     _extract_weight_data(mmcif_dict, protein_data, diagnostics)
@@ -104,7 +110,25 @@ def _parse_pdbx_unsafe(pdb_id: str, filepath: str) -> tuple[ProteinDataFromPDBx,
     return protein_data, diagnostics
 
 
-def _check_pdb_id_from_mmcif(mmcif_dict: MMCIF2Dict, expected_pdb_id: str) -> None:
+def _load_mmcif_items(pdb_id: str, filepath: str) -> tuple[dict[str, list[str]], bool]:
+    """
+    Load mmcif items needed for parsing. Fast reader of only the needed items is used, which reads _atom_site
+    only for the first structure model. If it fails to read the file, the whole file is loaded by Biopython's
+    MMCIF2Dict (which either reads it, or raises the error the same way as before).
+    :param pdb_id: PDB ID (for logging).
+    :param filepath: Path to the mmcif file (may be gzipped, with .gz extension).
+    :return: Loaded mmcif items (values by item name), and True if atoms of other models were not read.
+    :raises OSError: If the file cannot be read (or EOFError for truncated gzip file).
+    """
+    try:
+        return read_mmcif_items_of_first_group(filepath, _MMCIF_ITEMS_TO_READ, "_atom_site.pdbx_PDB_model_num")
+    except ValueError as ex:
+        logging.debug("[%s] Fast mmcif reading failed (%s), whole file is loaded instead.", pdb_id, ex)
+    with open_possibly_gzipped_file(filepath) as mmcif_file:
+        return MMCIF2Dict(mmcif_file), False
+
+
+def _check_pdb_id_from_mmcif(mmcif_dict: dict[str, list[str]], expected_pdb_id: str) -> None:
     """
     Checks whether the PDB ID inside mmcif file matches the expected PDB ID the program is currently processing.
     :param mmcif_dict: Holds information from mmcif file.
@@ -119,137 +143,193 @@ def _check_pdb_id_from_mmcif(mmcif_dict: MMCIF2Dict, expected_pdb_id: str) -> No
         )
 
 
-def _extract_atom_and_ligand_counts(mmcif_dict: MMCIF2Dict, data: ProteinDataFromPDBx) -> None:
+def _extract_atom_and_ligand_counts(
+    mmcif_dict: dict[str, list[str]], data: ProteinDataFromPDBx, other_models_skipped: bool = False
+) -> None:
     """
     Extracts and stores protein data about atom/hetatm counts and ligand counts.
     :param mmcif_dict: Holds data extracted from mmcif file.
     :param data: Protein data instance in which the collected information is stored.
+    :param other_models_skipped: True if atoms of other than the first model were not loaded from the file.
     """
-    encountered_ligands = _extract_atom_counts(mmcif_dict, data)
-    _calculate_ligand_counts(encountered_ligands, data)
+    atom_site = _load_atom_site_columns(mmcif_dict)
+    atom_site = _select_first_model_atoms(atom_site, data.pdb_id, other_models_skipped)
+    atom_site = _select_unique_atoms(atom_site, data.pdb_id)
+    data.atom_count_without_hetatms += int(np.count_nonzero(~atom_site.is_hetatm))
+    _calculate_ligand_counts(atom_site.select(atom_site.is_hetatm), data)
 
 
-def _extract_atom_counts(mmcif_dict: MMCIF2Dict, data: ProteinDataFromPDBx) -> list[EncounteredLigand]:
+def _load_atom_site_columns(mmcif_dict: dict[str, list[str]]) -> AtomSiteColumns:
     """
-    Extract atom (and hetatm) counts from mmcif and collect information about unique ligands encountered.
-    :param mmcif_dict: Holds data extracted from mmcif file.
-    :param data: Protein data instance in which the collected information is stored.
-    :return: List of unique encountered ligands with atoms they have inside.
-    """
-    encountered_ligands = {}
-    # in the case of multiple structure models in _atom_site, count with only the first one
-    try:
-        only_relevant_model_number = mmcif_dict["_atom_site.pdbx_PDB_model_num"][0]
-    except (IndexError, KeyError) as ex:
-        raise PDBxParsingError("Required item _atom_site.pdbx_PDB_model_num not found in mmcif file or empty.") from ex
-
-    unrelevant_model_number_present = False
-    processed_unsure_atoms = {}
-
-    for atom_item in _atomsite_item_generator(mmcif_dict):
-        if atom_item.model_number != only_relevant_model_number:
-            unrelevant_model_number_present = True
-            continue
-
-        if atom_item.occupancy != 1.0:  # atom could be present twice with different positions
-            if atom_item.atom_id in processed_unsure_atoms:  # atom with this id was already processed
-                processed_unsure_atoms[atom_item.atom_id].append(atom_item.occupancy)
-                continue
-
-            processed_unsure_atoms[atom_item.atom_id] = [atom_item.occupancy]
-
-        if atom_item.is_hetatm:  # is HETATM
-            ligand_identifier = LigandIdentifier(
-                residue_id_auth=atom_item.residue_id_auth,
-                residue_name_auth=atom_item.residue_name_auth,
-                residue_chain_id=atom_item.residue_chain_id,
-            )
-            if ligand_identifier in encountered_ligands:
-                encountered_ligands[ligand_identifier].atoms.append(atom_item)
-            else:
-                encountered_ligands[ligand_identifier] = EncounteredLigand(id=ligand_identifier, atoms=[atom_item])
-        else:  # is ATOM
-            data.atom_count_without_hetatms += 1
-
-    if unrelevant_model_number_present:
-        logging.info(
-            "[%s] Multiple model numbers present in mmcif file atom site. Only those with model number %s "
-            "were counted.",
-            data.pdb_id,
-            only_relevant_model_number,
-        )
-
-    _log_incomplete_atom_occupancies(data.pdb_id, processed_unsure_atoms)
-
-    return list(encountered_ligands.values())
-
-
-def _calculate_ligand_counts(encountered_ligands: list[EncounteredLigand], data: ProteinDataFromPDBx) -> None:
-    """
-    Go through the extracted ligands and get relevant counts from them.
-    :param encountered_ligands: List of unique encountered ligands with atoms they have inside.
-    :param data: Protein data instance in which the collected information is stored.
-    """
-    # goes through the collected ligand (hetatm) groups
-    for encountered_ligand in encountered_ligands:
-        has_water = False
-        has_metal = False
-        for atom_item in encountered_ligand.atoms:
-            if atom_item.residue_name_label == "HOH":
-                has_water = True
-            if atom_item.element_symbol.lower() in METAL_ELEMENT_NAMES:
-                has_metal = True
-
-        hetatms_in_this_ligand = len(encountered_ligand.atoms)
-        data.ligand_count += 1
-        data.hetatm_count += hetatms_in_this_ligand
-        if not has_water:
-            data.ligand_count_no_water += 1
-            data.hetatm_count_no_water += hetatms_in_this_ligand
-        if has_metal:
-            data.ligand_count_metal += 1
-            data.hetatm_count_metal += hetatms_in_this_ligand
-
-        data.ligand_types_present.add(encountered_ligand.id.residue_name_auth)
-
-
-def _atomsite_item_generator(mmcif_dict: MMCIF2Dict) -> Generator[AtomSiteItem, None, None]:
-    """
-    Takes relevant information from _atom_site in mmcif and generates items from it for further processing.
+    Takes relevant information from _atom_site in mmcif and converts it into arrays. If the items have different
+    lengths, only as many atoms as there are values in the shortest one are taken.
     :param mmcif_dict: Holds loaded mmcif data.
-    :return: Generated AtomSiteItem, or None.
+    :return: Atom site columns.
+    :raises PDBxParsingError: When required _atom_site item is missing.
     """
+    # model numbers are needed, as in the case of multiple structure models only the first one is counted
+    if not mmcif_dict.get("_atom_site.pdbx_PDB_model_num"):
+        raise PDBxParsingError("Required item _atom_site.pdbx_PDB_model_num not found in mmcif file or empty.")
     try:
-        atom_id_iter = iter(mmcif_dict["_atom_site.id"])
-        atom_type_iter = iter(mmcif_dict["_atom_site.group_PDB"])  # ATOM or HETATM
-        symbol_type_iter = iter(mmcif_dict["_atom_site.type_symbol"])  # element symbol
-        residue_name_label_iter = iter(mmcif_dict["_atom_site.label_comp_id"])  # residue name label
-        residue_id_auth_iter = iter(mmcif_dict["_atom_site.auth_seq_id"])  # residue ids (by author)
-        residue_name_auth_iter = iter(mmcif_dict["_atom_site.auth_comp_id"])  # residue names (by author)
-        residue_chain_id_iter = iter(mmcif_dict["_atom_site.auth_asym_id"])  # residue chain ids (by author)
-        model_num_iter = iter(mmcif_dict["_atom_site.pdbx_PDB_model_num"])  # model numbers
-        occupancy_iter = iter(mmcif_dict["_atom_site.occupancy"])
+        columns = [
+            mmcif_dict["_atom_site.id"],
+            mmcif_dict["_atom_site.group_PDB"],  # ATOM or HETATM
+            mmcif_dict["_atom_site.type_symbol"],  # element symbol
+            mmcif_dict["_atom_site.label_comp_id"],  # residue name label
+            mmcif_dict["_atom_site.auth_seq_id"],  # residue ids (by author)
+            mmcif_dict["_atom_site.auth_comp_id"],  # residue names (by author)
+            mmcif_dict["_atom_site.auth_asym_id"],  # residue chain ids (by author)
+            mmcif_dict["_atom_site.pdbx_PDB_model_num"],  # model numbers
+            mmcif_dict["_atom_site.occupancy"],
+        ]
     except KeyError as ex:
         raise PDBxParsingError("Required _atom_site item not found in mmcif, cannot proceed with parsing.") from ex
 
-    while True:
-        try:
-            yield AtomSiteItem(
-                atom_id=next(atom_id_iter),
-                is_hetatm=(next(atom_type_iter) == "HETATM"),
-                element_symbol=next(symbol_type_iter),
-                residue_name_label=next(residue_name_label_iter),
-                residue_name_auth=next(residue_name_auth_iter),
-                residue_id_auth=next(residue_id_auth_iter),
-                residue_chain_id=next(residue_chain_id_iter),
-                model_number=next(model_num_iter),
-                occupancy=to_float(next(occupancy_iter)),
+    atom_count = min(len(column) for column in columns)
+    # object arrays only reference the loaded strings (no copying), columns needing sorting are converted later
+    (
+        atom_ids,
+        atom_types,
+        element_symbols,
+        residue_names_label,
+        residue_ids_auth,
+        residue_names_auth,
+        residue_chain_ids,
+        model_numbers,
+        occupancy_strings,
+    ) = (np.array(column[:atom_count] if len(column) > atom_count else column, dtype=object) for column in columns)
+    return AtomSiteColumns(
+        atom_ids=atom_ids,
+        is_hetatm=atom_types == "HETATM",
+        element_symbols=element_symbols,
+        residue_names_label=residue_names_label,
+        residue_ids_auth=residue_ids_auth,
+        residue_names_auth=residue_names_auth,
+        residue_chain_ids=residue_chain_ids,
+        model_numbers=model_numbers,
+        occupancies=_convert_occupancies(occupancy_strings),
+    )
+
+
+def _convert_occupancies(occupancy_strings: np.ndarray) -> np.ndarray:
+    """
+    Convert occupancies to floats. Invalid values are converted to nan (which is not 1.0, the same as None).
+    :param occupancy_strings: Object array of occupancy strings.
+    :return: Float array of occupancies.
+    """
+    try:
+        return occupancy_strings.astype(np.float64)
+    except ValueError:
+        return np.array([to_float(occupancy, math.nan) for occupancy in occupancy_strings], dtype=np.float64)
+
+
+def _select_first_model_atoms(atom_site: AtomSiteColumns, pdb_id: str, other_models_skipped: bool) -> AtomSiteColumns:
+    """
+    Select only atoms from the first structure model (the one that the first atom belongs to).
+    :param atom_site: Atom site columns.
+    :param pdb_id: Protein id (for logging).
+    :param other_models_skipped: True if atoms of other models were not loaded (so they are logged as present).
+    :return: Atom site columns with atoms of the first model only.
+    """
+    if len(atom_site.model_numbers) == 0:
+        return atom_site
+    only_relevant_model_number = atom_site.model_numbers[0]
+    relevant_model_atoms = atom_site.model_numbers == only_relevant_model_number
+    if relevant_model_atoms.all() and not other_models_skipped:
+        return atom_site
+    logging.info(
+        "[%s] Multiple model numbers present in mmcif file atom site. Only those with model number %s "
+        "were counted.",
+        pdb_id,
+        only_relevant_model_number,
+    )
+    return atom_site if relevant_model_atoms.all() else atom_site.select(relevant_model_atoms)
+
+
+def _select_unique_atoms(atom_site: AtomSiteColumns, pdb_id: str) -> AtomSiteColumns:
+    """
+    Select atoms so that each atom with occupancy other than 1.0 (that could be present multiple times, with
+    different positions) is counted only once, by its first occurrence. Atoms whose occupancies do not sum up
+    to 1.0 across their occurrences are logged.
+    :param atom_site: Atom site columns.
+    :param pdb_id: Protein id (for logging).
+    :return: Atom site columns without repeated occurrences of atoms.
+    """
+    unsure_atom_indices = np.flatnonzero(atom_site.occupancies != 1.0)
+    if len(unsure_atom_indices) == 0:
+        return atom_site
+    _, first_occurrence_indices, unsure_atom_groups = np.unique(
+        atom_site.atom_ids[unsure_atom_indices].astype(str), return_index=True, return_inverse=True
+    )
+    # bincount adds the occupancies in the order of occurrence, the same way as the sum of a list would
+    occupancy_sums = np.bincount(
+        unsure_atom_groups.reshape(-1), weights=atom_site.occupancies[unsure_atom_indices]
+    )
+    _log_incomplete_atom_occupancies(pdb_id, int(np.count_nonzero(occupancy_sums != 1.0)))
+
+    selected_atoms = np.ones(len(atom_site.atom_ids), dtype=bool)
+    selected_atoms[unsure_atom_indices] = False
+    selected_atoms[unsure_atom_indices[first_occurrence_indices]] = True
+    return atom_site.select(selected_atoms)
+
+
+def _calculate_ligand_counts(hetatm_site: AtomSiteColumns, data: ProteinDataFromPDBx) -> None:
+    """
+    Group hetatms into ligands (by residue id, residue name and chain id) and get relevant counts from them.
+    :param hetatm_site: Atom site columns with hetatms only.
+    :param data: Protein data instance in which the collected information is stored.
+    """
+    if len(hetatm_site.atom_ids) == 0:
+        return
+    residue_key_codes = np.stack(
+        [
+            np.unique(residue_key_column.astype(str), return_inverse=True)[1].reshape(-1)
+            for residue_key_column in (
+                hetatm_site.residue_ids_auth,
+                hetatm_site.residue_names_auth,
+                hetatm_site.residue_chain_ids,
             )
-        except StopIteration:  # raised when the first list runs out of items
-            return
+        ],
+        axis=1,
+    )
+    _, ligand_indices = np.unique(residue_key_codes, axis=0, return_inverse=True)
+    ligand_indices = ligand_indices.reshape(-1)
+    ligand_sizes = np.bincount(ligand_indices)
+
+    unique_element_symbols, element_symbol_indices = np.unique(
+        hetatm_site.element_symbols.astype(str), return_inverse=True
+    )
+    is_metal_symbol = np.array([symbol.lower() in METAL_ELEMENT_NAMES for symbol in unique_element_symbols.tolist()])
+    is_metal_atom = is_metal_symbol[element_symbol_indices.reshape(-1)]
+    is_water_atom = hetatm_site.residue_names_label == "HOH"
+    ligand_has_water = np.bincount(ligand_indices, weights=is_water_atom, minlength=len(ligand_sizes)) > 0
+    ligand_has_metal = np.bincount(ligand_indices, weights=is_metal_atom, minlength=len(ligand_sizes)) > 0
+
+    data.ligand_count += len(ligand_sizes)
+    data.hetatm_count += int(ligand_sizes.sum())
+    data.ligand_count_no_water += int(np.count_nonzero(~ligand_has_water))
+    data.hetatm_count_no_water += int(ligand_sizes[~ligand_has_water].sum())
+    data.ligand_count_metal += int(np.count_nonzero(ligand_has_metal))
+    data.hetatm_count_metal += int(ligand_sizes[ligand_has_metal].sum())
+    data.ligand_types_present.update(hetatm_site.residue_names_auth.tolist())
+
+
+def _log_incomplete_atom_occupancies(pdb_id: str, incomplete_atom_count: int) -> None:
+    """
+    Logs count of atoms with less than 1.0 occupancies that do not have other instances that would complete their
+    occupancy to 1.0.
+    :param pdb_id: Protein Id.
+    :param incomplete_atom_count: Count of such atoms.
+    """
+    if incomplete_atom_count > 0:
+        logging.info(
+            "[%s] %s atoms have sum of their occupancy less than 1.0 across their possible occurrences.",
+            pdb_id,
+            incomplete_atom_count,
+        )
 
 
-def _extract_weight_data(mmcif_dict: MMCIF2Dict, data: ProteinDataFromPDBx, diagnostics: Diagnostics):
+def _extract_weight_data(mmcif_dict: dict[str, list[str]], data: ProteinDataFromPDBx, diagnostics: Diagnostics):
     """
     Extracts protein data from mmcif_dict related to weights.
     :param mmcif_dict: Holds loaded mmcif data.
@@ -292,7 +372,7 @@ def _extract_weight_data(mmcif_dict: MMCIF2Dict, data: ProteinDataFromPDBx, diag
     data.structure_weight_kda = data.polymer_weight_kda + (data.nonpolymer_weight_da / 1000)
 
 
-def _extract_straightforward_data(mmcif_dict: MMCIF2Dict, data: ProteinDataFromPDBx) -> None:
+def _extract_straightforward_data(mmcif_dict: dict[str, list[str]], data: ProteinDataFromPDBx) -> None:
     """
     Extracts protein data from given mmcif_dict, that are either saved as is or require just small adjustments
     without any calculations or significant transformation.
@@ -305,7 +385,7 @@ def _extract_straightforward_data(mmcif_dict: MMCIF2Dict, data: ProteinDataFromP
     data.aa_count = len(mmcif_dict.get("_entity_poly_seq.entity_id", []))
 
 
-def _extract_data_resolution(mmcif_dict: MMCIF2Dict, data: ProteinDataFromPDBx) -> None:
+def _extract_data_resolution(mmcif_dict: dict[str, list[str]], data: ProteinDataFromPDBx) -> None:
     """
     Extracts and determines structure resolution from the three possible locations.
     :param mmcif_dict: Contains data from the mmcif file.
@@ -355,26 +435,7 @@ def _calculate_additional_counts_and_ratios(data: ProteinDataFromPDBx) -> None:
     data.aa_ligand_count_no_water = data.ligand_count_no_water + data.aa_count
 
 
-def _log_incomplete_atom_occupancies(pdb_id: str, processed_unsure_atoms: dict[str, list[float]]) -> None:
-    """
-    Goes through given atoms with less than 1.0 occupancies, and checks, and logs all that do not have other
-    instances that would complete their occupancy to 1.0.
-    :param pdb_id: Protein Id.
-    :param processed_unsure_atoms: Dictionary with atom_id key and list of occupancy values.
-    """
-    incomplete_atom_count = 0
-    for instance_occupancies in processed_unsure_atoms.values():
-        if sum(instance_occupancies) != 1.0:
-            incomplete_atom_count += 1
-    if incomplete_atom_count > 0:
-        logging.info(
-            "[%s] %s atoms have sum of their occupancy less than 1.0 across their possible occurrences.",
-            pdb_id,
-            incomplete_atom_count,
-        )
-
-
-def _get_first_item(mmcif_dict: MMCIF2Dict, key: str) -> Optional[str]:
+def _get_first_item(mmcif_dict: dict[str, list[str]], key: str) -> Optional[str]:
     """
     By default, MMCIF2DICT returns all values under given key as a list, even if there is only one of them.
     This function extracts such list, and returns only the first item from it.
@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
+from typing import Optional
+
+from src.config import Config
+from src.data_extraction.data_extraction_manager import (
+    DataExtractionManager,
+    PrefetchedProteinData,
+    init_protein_data_loading_worker,
+    load_protein_data_row_in_worker,
+)
+from src.models.ids_to_update import ChangedIds, IdsToUpdateAndRemove
+from src.models.protein_data import ProteinDataRow
+
+# how many settled ids can wait for a free worker (per worker process), before the download is held back
+_QUEUED_IDS_PER_PROCESS = 4
+
+
+class ProteinDataPrefetcher:
+    """
+    Loads protein data of structures whose files finished downloading while the download of other structures
+    still runs. Structure ids are handed over via bounded queue to worker processes (the same loading as during
+    data extraction is used). Nothing is written except ligand stats, the data are only kept in memory (in compact
+    form of crunched csv rows) and are used by data extraction afterwards (which also does all the updates of stored
+    files, so the crash safety of the lock created after download stays the same). Use as context manager.
+    """
+
+    def __init__(self, config: Config):
+        self._config = config
+        self._ids_queue: queue.Queue[Optional[str]] = queue.Queue(
+            maxsize=config.max_process_count * _QUEUED_IDS_PER_PROCESS
+        )
+        self._tasks_in_flight = threading.BoundedSemaphore(config.max_process_count * 2)
+        self._pool: Optional[Pool] = None
+        self._feeder_thread: Optional[threading.Thread] = None
+        self._async_results: list[AsyncResult] = []
+        self._prefetched = PrefetchedProteinData()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ProteinDataPrefetcher":
+        # created before the download starts its threads, so that the worker processes are not forked
+        # while other threads run; ligand stats are not known yet, each worker loads them itself (once) from
+        # the ligand stats file, which is updated before the first structure is handed over
+        self._pool = Pool(
+            self._config.max_process_count, initializer=init_protein_data_loading_worker, initargs=(self._config, None)
+        )
+        return self
+
+    def __exit__(self, *_) -> None:
+        # if the data were not collected (e.g. download failed), the loading is just abandoned
+        self._pool.terminate()
+        self._pool.join()
+
+    def on_ligands_updated(self, changed_ligand_ids: ChangedIds) -> None:
+        """
+        Update ligand stats based on changed ligands (data extraction then uses them instead of updating them
+        again) and start loading protein data of structures handed over from now on.
+        :param changed_ligand_ids: Ligand ids changed during download.
+        """
+        if changed_ligand_ids.updated or changed_ligand_ids.deleted:
+            DataExtractionManager.update_ligand_stats(
+                self._config,
+                IdsToUpdateAndRemove(
+                    ligands_to_update=changed_ligand_ids.updated, ligands_to_delete=changed_ligand_ids.deleted
+                ),
+            )
+        self._prefetched.ligand_stats = DataExtractionManager.load_and_parse_ligand_stats(self._config)
+        self._feeder_thread = threading.Thread(target=self._feed_workers, daemon=True)
+        self._feeder_thread.start()
+        logging.info("Started loading protein data of structures whose download finished.")
+
+    def on_structure_settled(self, pdb_id: str) -> None:
+        """
+        Hand over structure whose files all finished downloading. Blocks if too many structures are waiting
+        to be loaded.
+        :param pdb_id:
+        """
+        self._ids_queue.put(pdb_id)
+
+    def collect(self) -> PrefetchedProteinData:
+        """
+        Wait for the protein data of all handed over structures to be loaded.
+        :return: Loaded protein data (those that failed to load are not included).
+        """
+        if self._feeder_thread is not None:
+            self._ids_queue.put(None)
+            self._feeder_thread.join()
+        for async_result in self._async_results:
+            async_result.wait()
+        logging.info("Loaded protein data of %s structures during download.", len(self._prefetched.protein_data))
+        return self._prefetched
+
+    def _feed_workers(self) -> None:
+        while (pdb_id := self._ids_queue.get()) is not None:
+            self._tasks_in_flight.acquire()  # pylint: disable=consider-using-with
+            self._async_results.append(
+                self._pool.apply_async(
+                    load_protein_data_row_in_worker,
+                    (pdb_id,),
+                    callback=self._store_protein_data,
+                    error_callback=partial(self._log_failed_loading, pdb_id),
+                )
+            )
+
+    def _store_protein_data(self, protein_data_row: ProteinDataRow) -> None:
+        with self._lock:
+            self._prefetched.protein_data[protein_data_row.pdb_id] = protein_data_row
+        self._tasks_in_flight.release()
+
+    def _log_failed_loading(self, pdb_id: str, ex: BaseException) -> None:
+        logging.warning("[%s] Loading protein data during download failed, it is loaded again later: %s", pdb_id, ex)
+        self._tasks_in_flight.release()
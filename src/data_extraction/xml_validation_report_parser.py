@@ -5,6 +5,7 @@ from xml.etree.ElementTree import Element, ParseError
 from xml.etree.ElementTree import parse as parse_element_tree
 
 from src.constants import UNKNOWN_LIGAND_NAME
+from src.generic_file_handlers.plain_file_handler import open_possibly_gzipped_file
 from src.models.protein_data import ProteinDataFromXML
 from src.models import Diagnostics, LigandInfo, XML_ENTRY_ATTRIBUTE_TO_PROPERTY
 from src.utils import to_float, to_int, get_clean_type_hint
@@ -47,7 +48,7 @@ def parse_xml_validation_report(
     """
     Extracts and calculates protein information from given XML validation file.
     :param pdb_id: PDB ID to extract.
-    :param filepath: Path to the xml validation report file.
+    :param filepath: Path to the xml validation report file (may be gzipped, with .gz extension).
     :param ligand_info: Loaded ligand stats.
     :return: Collected protein data.
     """
@@ -56,7 +57,7 @@ def parse_xml_validation_report(
         protein_data, diagnostics = _parse_xml_validation_report_unsafe(pdb_id, filepath, ligand_info)
         diagnostics.process_into_logging("XML parsing", pdb_id)
         return protein_data
-    except OSError as ex:  # Issue with opening given file
+    except (OSError, EOFError) as ex:  # Issue with opening (or decompressing) given file
         logging.info("[%s] No XML validation report found for this pdb id. Reason: %s", pdb_id, ex)
         return None
     except ParseError as ex:  # XML parsing error
@@ -78,7 +79,8 @@ def _parse_xml_validation_report_unsafe(
     :param ligand_infos: Dictionary with general ligand information.
     :return: Collected protein data and diagnostics about non-critical data issues.
     """
-    xml_tree = parse_element_tree(filepath)
+    with open_possibly_gzipped_file(filepath, "rb") as xml_file:
+        xml_tree = parse_element_tree(xml_file)
     protein_data = ProteinDataFromXML(pdb_id=pdb_id)
     diagnostics = Diagnostics()
 
@@ -23,6 +23,23 @@ class DataDownloadError(Exception):
     """
 
 
+class DataDownloadHttpError(DataDownloadError):
+    """
+    Exception raised when http request returns unexpected status code.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after_s: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after_s = retry_after_s
+
+
+class DataDownloadCircuitOpenError(DataDownloadError):
+    """
+    Exception raised when request is not made at all, because its host is considered unavailable.
+    """
+
+
 class DataTransformationError(Exception):
     """
     Exception raised when transforming data into needed output files fails.
@@ -1,8 +1,81 @@
+import gzip
 import logging
+import os
+import threading
+from typing import IO, Optional
 
 from src.exception import FileWritingError, ParsingError
 
 
+class AtomicFileWriter:
+    """
+    Context manager writing binary content into a temporary file next to the target file. The target file
+    is replaced by the temporary one (atomically, by rename) only when commit is called. Otherwise, or if
+    anything fails, the target file stays untouched and the temporary file is removed.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        # pid and thread id make the name unique even if the same file is written from multiple workers
+        self._temp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = None
+        self._committed = False
+
+    def __enter__(self) -> "AtomicFileWriter":
+        try:
+            self._file = open(self._temp_filepath, "wb")  # pylint: disable=consider-using-with
+        except OSError as ex:
+            raise FileWritingError(f"Failed to write file {self.filepath}: {ex}") from ex
+        return self
+
+    def write(self, content: bytes) -> None:
+        """
+        Write content into the temporary file.
+        :param content:
+        :raise FileWritingError: On error with writing the file.
+        """
+        try:
+            self._file.write(content)
+        except OSError as ex:
+            raise FileWritingError(f"Failed to write file {self.filepath}: {ex}") from ex
+
+    def read_written_content(self) -> bytes:
+        """
+        Read back the content written into the temporary file so far.
+        :return: Written content.
+        :raise FileWritingError: On error with reading the file.
+        """
+        try:
+            self._file.flush()
+            with open(self._temp_filepath, "rb") as temp_file:
+                return temp_file.read()
+        except OSError as ex:
+            raise FileWritingError(f"Failed to read written file {self.filepath}: {ex}") from ex
+
+    def commit(self) -> None:
+        """
+        Replace the target file with the written content.
+        :raise FileWritingError: On error with closing or renaming the file.
+        """
+        try:
+            self._file.close()
+            os.replace(self._temp_filepath, self.filepath)
+        except OSError as ex:
+            raise FileWritingError(f"Failed to write file {self.filepath}: {ex}") from ex
+        self._committed = True
+        logging.debug("Saved file %s", self.filepath)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> Optional[bool]:
+        if self._committed:
+            return None
+        try:
+            self._file.close()
+            os.remove(self._temp_filepath)
+        except OSError as ex:
+            logging.warning("Failed to remove temporary file %s: %s", self._temp_filepath, ex)
+        return None
+
+
 def write_file(filepath: str, content: str) -> None:
     """
     Write content into given filepath.
@@ -18,6 +91,35 @@ def write_file(filepath: str, content: str) -> None:
         raise FileWritingError(f"Failed to write file {filepath}: {ex}") from ex
 
 
+def write_binary_file(filepath: str, content: bytes | memoryview) -> None:
+    """
+    Write binary content into given filepath.
+    :param filepath:
+    :param content:
+    :raise FileWritingError: On error with writing/saving file.
+    """
+    try:
+        with open(filepath, "wb") as f:
+            f.write(content)
+            logging.info("Saved file %s", filepath)
+    except OSError as ex:
+        raise FileWritingError(f"Failed to write file {filepath}: {ex}") from ex
+
+
+def open_possibly_gzipped_file(filepath: str, mode: str = "rt") -> IO:
+    """
+    Open file for reading. File with .gz extension is decompressed on the fly as it is read.
+    :param filepath:
+    :param mode: Either "rt" (text) or "rb" (binary).
+    :return: Opened file.
+    :raises OSError: If the file cannot be opened (reading a damaged gz file raises OSError or EOFError).
+    """
+    encoding = "utf8" if "t" in mode else None
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, mode, encoding=encoding)
+    return open(filepath, mode, encoding=encoding)  # pylint: disable=consider-using-with
+
+
 def load_file(filepath: str) -> str:
     """
     Load content from given filepath.
@@ -3,7 +3,8 @@ import os.path
 import sys
 
 from src.data_transformation.data_transform_manager import run_data_transformation
-from src.data_extraction.data_extraction_manager import run_data_extraction
+from src.data_extraction.data_extraction_manager import run_data_extraction, PrefetchedProteinData
+from src.data_extraction.protein_data_prefetcher import ProteinDataPrefetcher
 from src.data_archivation.data_archivation_manager import run_data_archivation
 from src.data_download.data_download_manager import run_data_download
 from src.config import Config
@@ -95,11 +96,16 @@ def run_app_full_flow(config):
     fails, the rest is not run. The app exits with error code after any of the parts failure.
     :param config:
     """
-    if not config.skip_data_download:
+    prefetched_protein_data = None
+    if config.skip_data_download:
+        archivation_success = run_data_archivation(config)
+    elif config.pipelined_data_extraction and not config.force_complete_data_extraction:
+        archivation_success, prefetched_protein_data = run_data_download_and_archivation_pipelined(config)
+    else:
         if not run_data_download(config):
             sys.exit("Cannot continue because data download failed.")
-    archivation_success = run_data_archivation(config)
-    if not run_data_extraction(config):
+        archivation_success = run_data_archivation(config)
+    if not run_data_extraction(config, prefetched_protein_data):
         sys.exit("Cannot continue because data extraction failed.")
     transformation_success = run_data_transformation(config)
     if not archivation_success or not transformation_success:
@@ -111,6 +117,21 @@ def run_app_full_flow(config):
         sys.exit("Post transformation actions failed")
 
 
+def run_data_download_and_archivation_pipelined(config: Config) -> tuple[bool, PrefetchedProteinData]:
+    """
+    Run data download, during which the protein data of structures whose files are all downloaded are already
+    loaded for data extraction. Then run data archivation (while the loading of the remaining ones finishes).
+    The app exits with error code if download fails.
+    :param config:
+    :return: True if archivation succeeded, and protein data loaded during download.
+    """
+    with ProteinDataPrefetcher(config) as prefetcher:
+        if not run_data_download(config, prefetcher.on_structure_settled, prefetcher.on_ligands_updated):
+            sys.exit("Cannot continue because data download failed.")
+        archivation_success = run_data_archivation(config)
+        return archivation_success, prefetcher.collect()
+
+
 def main():
     """
     Application entrypoint.
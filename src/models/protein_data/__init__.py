@@ -4,6 +4,7 @@ from src.models.protein_data.protein_data_from_xml import ProteinDataFromXML
 from src.models.protein_data.protein_data_from_vdb import ProteinDataFromVDB
 from src.models.protein_data.protein_data_inferred import ProteinDataInferred
 from src.models.protein_data.protein_data_complete import ProteinDataComplete
+from src.models.protein_data.protein_data_row import ProteinDataRow
 
 
 __all__ = [
@@ -13,4 +14,5 @@ __all__ = [
     "ProteinDataFromVDB",
     "ProteinDataInferred",
     "ProteinDataComplete",
+    "ProteinDataRow",
 ]
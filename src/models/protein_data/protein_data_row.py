@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from src.models.names_csv_output_attributes import CRUNCHED_CSV_FACTOR_ORDER
+from src.models.protein_data.protein_data_complete import ProteinDataComplete
+
+
+@dataclass(slots=True)
+class ProteinDataRow:
+    """
+    Compact form of collected protein data of one structure, holding only what is stored from them - crunched csv
+    row and ligand types present in the structure (both None if the protein data are not successful).
+    """
+
+    pdb_id: str
+    # values in the order of CRUNCHED_CSV_FACTOR_ORDER
+    csv_values: Optional[tuple[str, ...]] = None
+    ligand_types_present: Optional[list[str]] = None
+
+    @property
+    def successful(self) -> bool:
+        """
+        Whether the protein data were considered successful for subsequent data processing.
+        :return: True if successful, False otherwise.
+        """
+        return self.csv_values is not None
+
+    @staticmethod
+    def from_protein_data(protein_data: ProteinDataComplete) -> "ProteinDataRow":
+        """
+        Create compact row from complete protein data.
+        :param protein_data:
+        :return: Protein data row.
+        """
+        if not protein_data.successful:
+            return ProteinDataRow(pdb_id=protein_data.pdb_id)
+        csv_row = protein_data.as_dict_for_csv()
+        return ProteinDataRow(
+            pdb_id=protein_data.pdb_id,
+            csv_values=tuple(csv_row[csv_name] for csv_name in CRUNCHED_CSV_FACTOR_ORDER),
+            ligand_types_present=sorted(protein_data.pdbx.ligand_types_present),
+        )
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from src.data_download.circuit_breaker import CircuitBreaker, CircuitState
+from src.exception import DataDownloadCircuitOpenError
+
+
+def test_circuit_opens_after_consecutive_failures():
+    # arrange
+    circuit_breaker = CircuitBreaker("example.org", failure_threshold=3, half_open_after_s=60)
+
+    # act
+    for _ in range(3):
+        circuit_breaker.before_request()
+        circuit_breaker.record_failure()
+
+    # assert
+    assert circuit_breaker.state == CircuitState.OPEN
+    with pytest.raises(DataDownloadCircuitOpenError):
+        circuit_breaker.before_request()
+    assert circuit_breaker.rejected_count == 1
+
+
+def test_success_resets_failure_count():
+    # arrange
+    circuit_breaker = CircuitBreaker("example.org", failure_threshold=2, half_open_after_s=60)
+
+    # act
+    circuit_breaker.record_failure()
+    circuit_breaker.record_success()
+    circuit_breaker.record_failure()
+
+    # assert
+    assert circuit_breaker.state == CircuitState.CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    # arrange
+    circuit_breaker = CircuitBreaker("example.org", failure_threshold=1, half_open_after_s=0.05)
+    circuit_breaker.record_failure()
+    time.sleep(0.06)
+
+    # act & assert
+    circuit_breaker.before_request()  # probe
+    assert circuit_breaker.state == CircuitState.HALF_OPEN
+    with pytest.raises(DataDownloadCircuitOpenError):
+        circuit_breaker.before_request()  # other requests still fail fast
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitState.OPEN
+    time.sleep(0.06)
+    circuit_breaker.before_request()
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CircuitState.CLOSED
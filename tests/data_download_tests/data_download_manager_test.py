@@ -0,0 +1,121 @@
+import json
+import threading
+
+from src.config import Config
+from src.data_download.data_download_manager import DownloadManager, run_data_download
+from src.data_download.failing_ids_handler import FailedIdsSourceType
+from src.data_download.rest_download import RestDataType, RestDownloadResult
+from src.models.ids_to_update import ChangedIds
+
+
+def test_run_data_download_syncs_independent_sources_concurrently(tmp_path, mocker):
+    # arrange
+    config = Config()
+    config.filepaths.dataset_root_path = str(tmp_path / "dataset")
+    config.filepaths.logs_root_path = str(tmp_path / "logs")
+    (tmp_path / "logs").mkdir()
+    xml_rsync_started = threading.Event()
+
+    def fake_mmcif_rsync(_):
+        # finishes only if xml rsync runs at the same time
+        assert xml_rsync_started.wait(timeout=5)
+        return ChangedIds(updated=["1dey", "2dh1"], deleted=["3rec"])
+
+    def fake_xml_rsync(_):
+        xml_rsync_started.set()
+        return ["2dh1", "5dh6"]
+
+    def fake_download_one_rest(_, ids_to_download, failed_ids_json, rest_data_type, failed_ids_source_type, *__):
+        assert sorted(ids_to_download) == ["1dey", "2dh1"]
+        failed_ids_json[failed_ids_source_type.value] = {"1dey": 1} if rest_data_type == RestDataType.SUMMARY else {}
+
+    mocker.patch.object(DownloadManager, "sync_pdbe_mmcif_via_rsync", side_effect=fake_mmcif_rsync)
+    mocker.patch.object(DownloadManager, "rsync_xml_validation_files", side_effect=fake_xml_rsync)
+    mocker.patch.object(DownloadManager, "update_ligand_cifs", return_value=ChangedIds(updated=["HEM"]))
+    download_one_rest_mock = mocker.patch.object(
+        DownloadManager, "download_one_rest", side_effect=fake_download_one_rest
+    )
+
+    # act
+    success = run_data_download(config)
+
+    # assert
+    assert success
+    assert download_one_rest_mock.call_count == 6
+    with open(config.filepaths.download_changed_ids_json, encoding="utf8") as f:
+        changed_ids_json = json.load(f)
+    assert sorted(changed_ids_json["structuresToUpdate"]) == ["1dey", "2dh1", "5dh6"]
+    assert changed_ids_json["structuresToDelete"] == ["3rec"]
+    assert changed_ids_json["ligandsToUpdate"] == ["HEM"]
+    with open(config.filepaths.download_failed_ids_to_retry_json, encoding="utf8") as f:
+        failed_ids_json = json.load(f)
+    assert failed_ids_json[FailedIdsSourceType.REST_SUMMARY.value] == {"1dey": 1}
+    assert failed_ids_json[FailedIdsSourceType.VALIDATOR_DB_REPORT.value] == {}
+
+
+def test_run_data_download_hands_over_settled_structures(tmp_path, mocker):
+    # arrange
+    config = Config()
+    config.filepaths.dataset_root_path = str(tmp_path / "dataset")
+    config.filepaths.logs_root_path = str(tmp_path / "logs")
+    (tmp_path / "logs").mkdir()
+    handed_over = []
+
+    def fake_download_one_type_rest_files(ids_to_download, *args):
+        on_id_finished = args[-1]
+        for structure_id in ids_to_download:
+            on_id_finished(structure_id)
+        return RestDownloadResult()
+
+    mocker.patch.object(
+        DownloadManager, "sync_pdbe_mmcif_via_rsync", return_value=ChangedIds(updated=["1dey", "2dh1"])
+    )
+    mocker.patch.object(DownloadManager, "rsync_xml_validation_files", return_value=["5dh6"])
+    mocker.patch.object(DownloadManager, "update_ligand_cifs", return_value=ChangedIds(updated=["HEM"]))
+    mocker.patch(
+        "src.data_download.data_download_manager.download_one_type_rest_files",
+        side_effect=fake_download_one_type_rest_files,
+    )
+
+    # act
+    success = run_data_download(
+        config,
+        on_structure_settled=lambda structure_id: handed_over.append(structure_id),
+        on_ligands_updated=lambda changed_ligand_ids: handed_over.append(changed_ligand_ids.updated),
+    )
+
+    # assert
+    assert success
+    assert handed_over[0] == ["HEM"]
+    assert sorted(handed_over[1:]) == ["1dey", "2dh1"]
+
+
+def test_download_one_rest_keeps_retry_schedule_of_ids_not_requested(mocker):
+    # arrange
+    config = Config()
+    config.current_formatted_date = "20240101"
+    postponed_entry = {"failedCount": 3, "nextAttemptDate": "20240101"}
+    failed_ids_json = {FailedIdsSourceType.REST_SUMMARY.value: {"2dh1": postponed_entry, "3rec": postponed_entry}}
+    resolved_failed_ids = []
+    mocker.patch(
+        "src.data_download.data_download_manager.download_one_type_rest_files",
+        return_value=RestDownloadResult(failed_ids=["1dey", "2dh1", "5dh6"], not_attempted_ids=["2dh1", "5dh6"]),
+    )
+
+    # act
+    DownloadManager.download_one_rest(
+        config,
+        ["1dey", "5dh6"],
+        failed_ids_json,
+        RestDataType.SUMMARY,
+        FailedIdsSourceType.REST_SUMMARY,
+        resolved_failed_ids,
+    )
+
+    # assert
+    assert failed_ids_json[FailedIdsSourceType.REST_SUMMARY.value] == {
+        "1dey": {"failedCount": 1, "nextAttemptDate": "20240102"},
+        "2dh1": postponed_entry,
+        "5dh6": {"failedCount": 0, "nextAttemptDate": None},
+    }
+    assert resolved_failed_ids == ["3rec"]
@@ -0,0 +1,116 @@
+import json
+import os
+
+import pandas as pd
+import requests
+
+from src.data_download.circuit_breaker import configure_circuit_breakers
+from src.data_download.download_metrics import (
+    get_download_metrics, record_rsync, reset_download_metrics, save_download_metrics
+)
+from src.data_download.gzip_unpacker import GunzipStats
+from src.data_download.http_request_handler import get_response_with_retries, configure_retry_backoff
+from src.data_download.rate_limiter import configure_rate_limiting, get_rate_limiter, RateLimitSettings
+from src.exception import DataDownloadError
+
+
+def create_response(status_code: int, content: bytes = b"{}") -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content  # pylint: disable=protected-access
+    return response
+
+
+def test_requests_are_recorded_per_endpoint(mocker):
+    # arrange
+    configure_rate_limiting(RateLimitSettings(initial_rate=1000, min_rate=1, max_rate=1000))
+    configure_retry_backoff(0.0, 0.0)
+    configure_circuit_breakers(failure_threshold=10, half_open_after_s=60)
+    reset_download_metrics()
+    session_mock = mocker.patch("src.data_download.http_request_handler.get_http_session").return_value
+    session_mock.get.side_effect = [
+        create_response(429, b""),
+        requests.exceptions.ReadTimeout("read timed out"),
+        create_response(200, b'{"1dey": []}'),
+        create_response(404),
+    ]
+
+    # act
+    get_response_with_retries("https://example.org/api/summary/1dey", 10, retry_attempts=2)
+    try:
+        get_response_with_retries("https://example.org/api/molecules/1dey", 10)
+    except DataDownloadError:
+        pass
+
+    # assert
+    metrics = get_download_metrics()
+    assert sorted(metrics) == ["example.org/api/molecules", "example.org/api/summary"]
+    summary_metrics = metrics["example.org/api/summary"]
+    assert summary_metrics.request_count == 3
+    assert summary_metrics.failed_request_count == 2
+    assert summary_metrics.retry_count == 2
+    assert summary_metrics.throttled_count == 1
+    assert summary_metrics.timeout_count == 1
+    assert summary_metrics.response_bytes == len(b'{"1dey": []}')
+    assert sum(summary_metrics.latency_histogram) == 3
+    assert metrics["example.org/api/molecules"].failed_request_count == 1
+
+
+def test_download_metrics_are_saved_as_json_and_csv(tmp_path):
+    # arrange
+    reset_download_metrics()
+    gunzip_stats = GunzipStats(
+        file_count=2,
+        compressed_size=1_000_000,
+        unpacked_size=4_000_000,
+        duration_s=1.0,
+        started_at=100.0,
+        finished_at=102.0,
+    )
+    record_rsync("rsync_archive_mmcif", 3.0, 2, 1, gunzip_stats)
+
+    # act
+    save_download_metrics(str(tmp_path / "metrics.json"), str(tmp_path / "metrics.csv"))
+
+    # assert
+    with open(tmp_path / "metrics.json", encoding="utf8") as f:
+        metrics_json = json.load(f)
+    assert metrics_json["rsync_archive_mmcif"]["recievedFileCount"] == 2
+    assert metrics_json["rsync_archive_mmcif"]["transferWallTimeS"] == 3.0
+    assert metrics_json["rsync_archive_mmcif"]["unpackingWallTimeS"] == 2.0
+    assert metrics_json["rsync_archive_mmcif"]["unpackingMBPerS"] == 2.0
+    assert metrics_json["rsync_archive_mmcif"]["unpackingMBPerSPerWorker"] == 4.0
+    metrics_df = pd.read_csv(tmp_path / "metrics.csv", delimiter=";")
+    assert list(metrics_df["source"]) == ["rsync_archive_mmcif"]
+    assert list(metrics_df.columns[1:]) == list(metrics_json["rsync_archive_mmcif"])
+
+
+def test_download_metrics_are_saved_into_folder_that_does_not_exist_yet(tmp_path):
+    # arrange
+    reset_download_metrics()
+    record_rsync("rsync_archive_mmcif", 3.0, 2, 1)
+    metrics_folder = tmp_path / "logs" / "rsync_logs"
+
+    # act
+    save_download_metrics(str(metrics_folder / "metrics.json"), str(metrics_folder / "metrics.csv"))
+
+    # assert
+    assert sorted(os.listdir(metrics_folder)) == ["metrics.csv", "metrics.json"]
+
+
+def test_server_errors_are_recorded_as_throttling(mocker):
+    # arrange
+    configure_rate_limiting(RateLimitSettings(initial_rate=1000, min_rate=1, max_rate=1000))
+    configure_retry_backoff(0.0, 0.0)
+    configure_circuit_breakers(failure_threshold=10, half_open_after_s=60)
+    reset_download_metrics()
+    session_mock = mocker.patch("src.data_download.http_request_handler.get_http_session").return_value
+    session_mock.get.side_effect = [create_response(503), create_response(429), create_response(200)]
+
+    # act
+    get_response_with_retries("https://example.org/api/summary/1dey", 10, retry_attempts=2)
+
+    # assert
+    summary_metrics = get_download_metrics()["example.org/api/summary"]
+    assert summary_metrics.throttled_count == 2
+    assert summary_metrics.throttled_count == get_rate_limiter("https://example.org/api/summary/1dey").throttled_count
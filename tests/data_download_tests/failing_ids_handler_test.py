@@ -0,0 +1,96 @@
+import pytest
+
+from src.data_download.failing_ids_handler import (
+    get_failing_ids, update_failing_ids, FailedIdsSourceType, RetrySchedule
+)
+
+SCHEDULE = RetrySchedule(base_interval_days=1, max_interval_days=8)
+
+
+def test_get_failing_ids_retries_only_those_due():
+    # arrange
+    failed_ids_json = {
+        FailedIdsSourceType.REST_SUMMARY.value: {
+            "1dey": {"failedCount": 1, "nextAttemptDate": "20240102"},
+            "2dh1": {"failedCount": 5, "nextAttemptDate": "20240110"},
+            "3rec": 200,  # older format with failed count only
+        }
+    }
+
+    # act
+    ids_to_retry = get_failing_ids(failed_ids_json, FailedIdsSourceType.REST_SUMMARY, "20240102", SCHEDULE)
+
+    # assert
+    assert ids_to_retry == ["1dey", "3rec"]
+
+
+def test_get_failing_ids_retries_those_with_fewest_failures_first():
+    # arrange
+    failed_ids_json = {
+        FailedIdsSourceType.VALIDATOR_DB_REPORT.value: {
+            "1dey": {"failedCount": 7, "nextAttemptDate": "20240101"},
+            "2dh1": {"failedCount": 2, "nextAttemptDate": "20240101"},
+            "3rec": {"failedCount": 4, "nextAttemptDate": "20240101"},
+        }
+    }
+    schedule = RetrySchedule(max_retried_ids_per_run=2)
+
+    # act
+    ids_to_retry = get_failing_ids(failed_ids_json, FailedIdsSourceType.VALIDATOR_DB_REPORT, "20240102", schedule)
+
+    # assert
+    assert ids_to_retry == ["2dh1", "3rec"]
+
+
+@pytest.mark.parametrize(
+    "previous_entry, expected_entry",
+    [
+        (None, {"failedCount": 1, "nextAttemptDate": "20240102"}),
+        ({"failedCount": 2, "nextAttemptDate": "20240101"}, {"failedCount": 3, "nextAttemptDate": "20240105"}),
+        ({"failedCount": 199, "nextAttemptDate": "20231231"}, {"failedCount": 200, "nextAttemptDate": "20240109"}),
+        (3, {"failedCount": 4, "nextAttemptDate": "20240109"}),
+    ],
+)
+def test_update_failing_ids_postpones_next_attempt(previous_entry, expected_entry):
+    # arrange
+    failed_ids_json = {FailedIdsSourceType.REST_SUMMARY.value: {"1dey": previous_entry} if previous_entry else {}}
+
+    # act
+    update_failing_ids(failed_ids_json, FailedIdsSourceType.REST_SUMMARY, ["1dey"], ["1dey"], "20240101", SCHEDULE)
+
+    # assert
+    assert failed_ids_json[FailedIdsSourceType.REST_SUMMARY.value] == {"1dey": expected_entry}
+
+
+def test_update_failing_ids_keeps_ids_not_attempted():
+    # arrange
+    postponed_entry = {"failedCount": 5, "nextAttemptDate": "20240110"}
+    failed_ids_json = {
+        FailedIdsSourceType.REST_MOLECULES.value: {
+            "1dey": {"failedCount": 1, "nextAttemptDate": "20240101"},
+            "2dh1": postponed_entry,
+        }
+    }
+
+    # act
+    update_failing_ids(failed_ids_json, FailedIdsSourceType.REST_MOLECULES, ["1dey", "3rec"], [], "20240101", SCHEDULE)
+
+    # assert
+    assert failed_ids_json[FailedIdsSourceType.REST_MOLECULES.value] == {"2dh1": postponed_entry}
+
+
+def test_update_failing_ids_keeps_retry_schedule_of_ids_not_requested():
+    # arrange
+    postponed_entry = {"failedCount": 5, "nextAttemptDate": "20240110"}
+    failed_ids_json = {FailedIdsSourceType.REST_SUMMARY.value: {"1dey": postponed_entry}}
+
+    # act
+    update_failing_ids(
+        failed_ids_json, FailedIdsSourceType.REST_SUMMARY, [], [], "20240101", SCHEDULE, ["1dey", "2dh1"]
+    )
+
+    # assert
+    assert failed_ids_json[FailedIdsSourceType.REST_SUMMARY.value] == {
+        "1dey": postponed_entry,
+        "2dh1": {"failedCount": 0, "nextAttemptDate": None},
+    }
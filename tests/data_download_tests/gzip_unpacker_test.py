@@ -0,0 +1,53 @@
+import gzip
+
+from src.data_download.gzip_unpacker import gunzip_file, GunzipResult, GunzipStats
+
+
+def test_gunzip_file(tmp_path):
+    # arrange
+    content = b"data_1dey\n" * 100_000
+    with gzip.open(tmp_path / "1dey.cif.gz", "wb") as f:
+        f.write(content)
+
+    # act
+    gunzip_result = gunzip_file(str(tmp_path / "1dey.cif.gz"), str(tmp_path / "1dey.cif"))
+
+    # assert
+    assert gunzip_result.error is None
+    assert (tmp_path / "1dey.cif").read_bytes() == content
+    assert gunzip_result.unpacked_size == len(content)
+    assert gunzip_result.compressed_size == (tmp_path / "1dey.cif.gz").stat().st_size
+
+
+def test_gunzip_file_returns_error_for_truncated_file(tmp_path):
+    # arrange
+    compressed_content = gzip.compress(b"data_1dey\n" * 1000)
+    (tmp_path / "1dey.cif.gz").write_bytes(compressed_content[:len(compressed_content) // 2])
+    gunzip_stats = GunzipStats()
+
+    # act
+    gunzip_result = gunzip_file(str(tmp_path / "1dey.cif.gz"), str(tmp_path / "1dey.cif"))
+    gunzip_stats.add(gunzip_result)
+
+    # assert
+    assert gunzip_result.error is not None
+    assert gunzip_stats.file_count == 1
+    assert gunzip_stats.failed_count == 1
+
+
+def test_gunzip_stats_measure_wall_time_of_all_unpackings():
+    # arrange
+    gunzip_stats = GunzipStats()
+    gunzip_results = [
+        GunzipResult(unpacked_size=10, duration_s=1.0, started_at=100.5),
+        GunzipResult(unpacked_size=10, duration_s=2.0, started_at=100.0),
+        GunzipResult(error="Failed to unpack gz file"),
+    ]
+
+    # act
+    for gunzip_result in gunzip_results:
+        gunzip_stats.add(gunzip_result)
+
+    # assert
+    assert gunzip_stats.duration_s == 3.0
+    assert gunzip_stats.wall_time_s == 2.0
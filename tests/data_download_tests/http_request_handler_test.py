@@ -0,0 +1,88 @@
+import time
+
+import pytest
+import requests
+
+from src.data_download.circuit_breaker import CircuitState, configure_circuit_breakers, get_circuit_breaker
+from src.data_download.http_request_handler import get_response, get_response_with_retries, configure_retry_backoff
+from src.data_download.rate_limiter import configure_rate_limiting, get_rate_limiter, RateLimitSettings
+from src.exception import DataDownloadError, DataDownloadHttpError
+
+
+def create_response(status_code: int, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b"{}"  # pylint: disable=protected-access
+    response.headers.update(headers or {})
+    return response
+
+
+@pytest.fixture(autouse=True)
+def fast_rate_limits():
+    configure_rate_limiting(RateLimitSettings(initial_rate=1000, min_rate=1, max_rate=1000))
+    configure_retry_backoff(0.0, 0.0)
+    configure_circuit_breakers(failure_threshold=10, half_open_after_s=60)
+
+
+def test_retry_honors_retry_after_and_slows_down(mocker):
+    # arrange
+    session_mock = mocker.patch("src.data_download.http_request_handler.get_http_session").return_value
+    session_mock.get.side_effect = [create_response(429, {"Retry-After": "0.2"}), create_response(200)]
+    start = time.monotonic()
+
+    # act
+    response = get_response_with_retries("https://example.org/api/summary/1dey", 10, retry_attempts=2)
+
+    # assert
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.2
+    rate_limiter = get_rate_limiter("https://example.org/api/summary/2dh1")
+    assert rate_limiter.throttled_count == 1
+    assert rate_limiter.rate < 1000
+
+
+def test_not_found_is_not_retried(mocker):
+    # arrange
+    session_mock = mocker.patch("src.data_download.http_request_handler.get_http_session").return_value
+    session_mock.get.return_value = create_response(404)
+
+    # act & assert
+    with pytest.raises(DataDownloadHttpError):
+        get_response_with_retries("https://example.org/api/summary/1dey", 10, retry_attempts=2)
+    assert session_mock.get.call_count == 1
+
+
+def test_server_error_is_retried_until_attempts_run_out(mocker):
+    # arrange
+    session_mock = mocker.patch("src.data_download.http_request_handler.get_http_session").return_value
+    session_mock.get.return_value = create_response(503)
+
+    # act & assert
+    with pytest.raises(DataDownloadHttpError):
+        get_response_with_retries("https://example.org/api/summary/1dey", 10, retry_attempts=2)
+    assert session_mock.get.call_count == 3
+
+
+def test_failed_probe_with_other_request_error_opens_circuit_again(mocker):
+    # arrange
+    configure_circuit_breakers(failure_threshold=1, half_open_after_s=0)
+    address = "https://example.org/api/summary/1dey"
+    session_mock = mocker.patch("src.data_download.http_request_handler.get_http_session").return_value
+    session_mock.get.side_effect = [
+        requests.exceptions.ConnectionError(),
+        requests.exceptions.TooManyRedirects(),
+        create_response(200),
+    ]
+    with pytest.raises(DataDownloadError):
+        get_response(address, 10)  # opens the circuit
+
+    # act
+    with pytest.raises(DataDownloadError):
+        get_response(address, 10)  # probe of half-open circuit
+    circuit_state_after_probe = get_circuit_breaker(address).state
+    response = get_response(address, 10)
+
+    # assert
+    assert circuit_state_after_probe == CircuitState.OPEN
+    assert response.status_code == 200
+    assert get_circuit_breaker(address).state == CircuitState.CLOSED
@@ -0,0 +1,201 @@
+import json
+
+import pytest
+import requests
+
+from src.data_download import ligand_ccd_handler
+from src.data_download.ligand_ccd_handler import download_and_find_changed_ligand_cifs
+from src.exception import DataDownloadError, FileWritingError
+
+COMPONENTS_CIF = (
+    b"data_HEM\n_chem_comp.id HEM\n_chem_comp.name 'not data_XXX header'\n#\ndata_ATP\n_chem_comp.id ATP\n#\n"
+)
+AA_VARIANTS_CIF = b"data_ALA_LL\n_chem_comp.id ALA_LL\n#\n"
+
+
+def create_response(status_code: int, content: bytes = b"", etag: str = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content  # pylint: disable=protected-access
+    response._content_consumed = True  # pylint: disable=protected-access
+    if etag:
+        response.headers["ETag"] = etag
+    return response
+
+
+def fake_ccd_server(mocker, contents: dict[str, bytes]):
+    def fake_get_response(address, _, headers=None, **__):
+        source_name = address.split("/")[-1]
+        etag = f'"{hash(contents[source_name])}"'
+        if headers and headers.get("If-None-Match") == etag:
+            return create_response(304)
+        return create_response(200, contents[source_name], etag)
+
+    return mocker.patch("src.data_download.ligand_ccd_handler.get_response", side_effect=fake_get_response)
+
+
+def download(tmp_path, max_workers: int = 2):
+    return download_and_find_changed_ligand_cifs(
+        str(tmp_path / "ligands"),
+        str(tmp_path / "cache"),
+        str(tmp_path / "ccd_state.json"),
+        str(tmp_path / "manifest.json"),
+        10,
+        max_workers,
+    )
+
+
+@pytest.fixture(name="ccd_folders")
+def ccd_folders_fixture(tmp_path):
+    (tmp_path / "ligands").mkdir()
+    (tmp_path / "cache").mkdir()
+    return tmp_path
+
+
+@pytest.mark.parametrize("split_chunk_size", [3, 7, 1024])
+def test_download_and_find_changed_ligand_cifs_splits_ccd_files(ccd_folders, mocker, split_chunk_size):
+    # arrange
+    mocker.patch("src.data_download.ligand_ccd_handler._CCD_SPLIT_CHUNK_SIZE", split_chunk_size)
+    fake_ccd_server(mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF})
+    (ccd_folders / "ligands" / "OLD.cif").write_text("data_OLD\n")
+
+    # act
+    changed_ids = download(ccd_folders)
+
+    # assert
+    assert changed_ids.updated == ["HEM", "ATP", "ALA_LL"]
+    assert changed_ids.deleted == ["OLD"]
+    assert (ccd_folders / "ligands" / "HEM.cif").read_bytes() == COMPONENTS_CIF[:COMPONENTS_CIF.index(b"data_ATP")]
+    assert (ccd_folders / "ligands" / "ATP.cif").read_bytes() == b"data_ATP\n_chem_comp.id ATP\n#\n"
+    assert (ccd_folders / "ligands" / "ALA_LL.cif").read_bytes() == AA_VARIANTS_CIF
+    assert (ccd_folders / "cache" / "components.cif").read_bytes() == COMPONENTS_CIF
+    with open(ccd_folders / "ccd_state.json", encoding="utf8") as f:
+        ccd_state = json.load(f)
+    assert ccd_state["components.cif"]["processedHash"] == ccd_state["components.cif"]["downloadedHash"]
+
+
+def test_download_and_find_changed_ligand_cifs_skips_unchanged_ccd_files(ccd_folders, mocker):
+    # arrange
+    get_response_mock = fake_ccd_server(
+        mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF}
+    )
+    download(ccd_folders)
+    (ccd_folders / "ligands" / "HEM.cif").write_text("changed locally")
+    get_response_mock.reset_mock()
+
+    # act
+    changed_ids = download(ccd_folders)
+
+    # assert
+    assert not changed_ids.updated
+    assert not changed_ids.deleted
+    assert get_response_mock.call_count == 2
+    assert all(call.kwargs["headers"]["If-None-Match"] for call in get_response_mock.call_args_list)
+    assert (ccd_folders / "ligands" / "HEM.cif").read_text() == "changed locally"
+
+
+def test_download_and_find_changed_ligand_cifs_resumes_failed_split_from_cache(ccd_folders, mocker):
+    # arrange
+    fake_ccd_server(mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF})
+    mocker.patch(
+        "src.data_download.ligand_ccd_handler._delete_ligand_file", side_effect=PermissionError("read-only")
+    )
+    (ccd_folders / "ligands" / "OLD.cif").write_text("data_OLD\n")
+    with pytest.raises(PermissionError):
+        download(ccd_folders)
+    mocker.stopall()
+    get_response_mock = fake_ccd_server(
+        mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF}
+    )
+
+    # act
+    changed_ids = download(ccd_folders)
+
+    # assert
+    assert changed_ids.deleted == ["OLD"]
+    assert all(call.kwargs["headers"]["If-None-Match"] for call in get_response_mock.call_args_list)
+    assert not (ccd_folders / "ligands" / "OLD.cif").exists()
+
+
+def test_download_and_find_changed_ligand_cifs_saves_failed_ligands_again_next_run(ccd_folders, mocker):
+    # arrange
+    fake_ccd_server(mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF})
+    save_ligand_cif_into_file = ligand_ccd_handler._save_ligand_cif_into_file  # pylint: disable=protected-access
+
+    def fail_saving_atp(cif_content, ligand_cifs_folder_path):
+        if cif_content.ligand_id == "ATP":
+            raise FileWritingError("disk full")
+        save_ligand_cif_into_file(cif_content, ligand_cifs_folder_path)
+
+    mocker.patch.object(ligand_ccd_handler, "_save_ligand_cif_into_file", side_effect=fail_saving_atp)
+    download(ccd_folders)
+    mocker.stopall()
+    fake_ccd_server(mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF})
+
+    # act
+    changed_ids = download(ccd_folders)
+
+    # assert
+    assert changed_ids.updated == ["ATP"]
+    assert (ccd_folders / "ligands" / "ATP.cif").read_bytes() == b"data_ATP\n_chem_comp.id ATP\n#\n"
+    with open(ccd_folders / "ccd_state.json", encoding="utf8") as f:
+        ccd_state = json.load(f)
+    assert ccd_state["components.cif"]["processedHash"] == ccd_state["components.cif"]["downloadedHash"]
+
+
+def test_download_and_find_changed_ligand_cifs_raises_on_missing_ligand_header(ccd_folders, mocker):
+    # arrange
+    fake_ccd_server(mocker, {"components.cif": b"#\n" + COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF})
+
+    # act & assert
+    with pytest.raises(DataDownloadError):
+        download(ccd_folders)
+    assert not list((ccd_folders / "ligands").iterdir())
+
+
+def test_download_and_find_changed_ligand_cifs_raises_on_failed_download(ccd_folders, mocker):
+    # arrange
+    mocker.patch(
+        "src.data_download.ligand_ccd_handler.get_response", side_effect=DataDownloadError("503 Service Unavailable")
+    )
+
+    # act & assert
+    with pytest.raises(DataDownloadError):
+        download(ccd_folders)
+    assert not list((ccd_folders / "cache").iterdir())
+
+
+def test_download_and_find_changed_ligand_cifs_compares_ligands_using_manifest(ccd_folders, mocker):
+    # arrange
+    fake_ccd_server(mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF})
+    download(ccd_folders)
+    changed_components_cif = COMPONENTS_CIF.replace(b"HEM\n_chem", b"HEM\n_new\n_chem")
+    fake_ccd_server(mocker, {"components.cif": changed_components_cif, "aa-variants-v1.cif": b""})
+    file_hash_mock = mocker.patch("src.data_download.ligand_ccd_handler.file_hash")
+
+    # act
+    changed_ids = download(ccd_folders)
+
+    # assert
+    file_hash_mock.assert_not_called()
+    assert changed_ids.updated == ["HEM"]
+    assert changed_ids.deleted == ["ALA_LL"]
+    with open(ccd_folders / "manifest.json", encoding="utf8") as f:
+        assert sorted(json.load(f)) == ["ATP", "HEM"]
+
+
+def test_download_and_find_changed_ligand_cifs_rebuilds_missing_manifest(ccd_folders, mocker):
+    # arrange
+    fake_ccd_server(mocker, {"components.cif": COMPONENTS_CIF, "aa-variants-v1.cif": AA_VARIANTS_CIF})
+    download(ccd_folders)
+    (ccd_folders / "manifest.json").unlink()
+    (ccd_folders / "ccd_state.json").unlink()
+    (ccd_folders / "ligands" / "ATP.cif").write_text("changed locally")
+
+    # act
+    changed_ids = download(ccd_folders)
+
+    # assert
+    assert changed_ids.updated == ["ATP"]
+    assert (ccd_folders / "manifest.json").exists()
+    assert (ccd_folders / "ligands" / "ATP.cif").read_bytes().splitlines() == [b"data_ATP", b"_chem_comp.id ATP", b"#"]
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+
+import pytest
+import requests
+from urllib3.exceptions import ProtocolError
+
+from src.data_download.rest_download import RestDataType, download_one_type_rest_files
+from src.data_download.rest_validator_store import RestValidatorStore
+from src.exception import DataDownloadError, DataDownloadCircuitOpenError
+
+
+def create_response(status_code: int, content: bytes = b"", etag: str = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content  # pylint: disable=protected-access
+    response._content_consumed = True  # pylint: disable=protected-access
+    if etag:
+        response.headers["ETag"] = etag
+    return response
+
+
+def test_download_one_type_rest_files_in_parallel(tmp_path, mocker):
+    # arrange
+    ids_to_download = {"1dey", "2dh1", "3rec", "5dh6"}
+    os.mkdir(tmp_path / "summary")
+
+    def fake_get_response(address, **_):
+        structure_id = address.split("/")[-1]
+        if structure_id == "3rec":
+            raise DataDownloadError("404")
+        return create_response(200, json.dumps({structure_id: [{"title": structure_id}]}).encode("utf8"))
+
+    mocker.patch("src.data_download.rest_download.get_response_with_retries", side_effect=fake_get_response)
+
+    # act
+    result = download_one_type_rest_files(ids_to_download, RestDataType.SUMMARY, str(tmp_path), 10, 4)
+
+    # assert
+    assert result.failed_ids == ["3rec"]
+    assert not result.unchanged_ids
+    for structure_id in ["1dey", "2dh1", "5dh6"]:
+        with open(tmp_path / "summary" / f"{structure_id}.json", encoding="utf8") as f:
+            assert json.load(f) == {structure_id: [{"title": structure_id}]}
+    assert not os.path.exists(tmp_path / "summary" / "3rec.json")
+
+
+def test_download_one_type_rest_files_skips_unchanged_files(tmp_path, mocker):
+    # arrange
+    os.mkdir(tmp_path / "summary")
+    validator_store = RestValidatorStore()
+    responses = {
+        "1dey": create_response(200, b'{"1dey": []}', etag='"v1"'),
+        "2dh1": create_response(200, b'{"2dh1": []}'),
+    }
+    get_response_mock = mocker.patch(
+        "src.data_download.rest_download.get_response_with_retries",
+        side_effect=lambda address, **_: responses[address.split("/")[-1]],
+    )
+    download_one_type_rest_files({"1dey", "2dh1"}, RestDataType.SUMMARY, str(tmp_path), 10, 2, validator_store)
+    modification_time = os.path.getmtime(tmp_path / "summary" / "2dh1.json")
+    responses["1dey"] = create_response(304)
+
+    # act
+    result = download_one_type_rest_files(
+        {"1dey", "2dh1"}, RestDataType.SUMMARY, str(tmp_path), 10, 2, validator_store
+    )
+
+    # assert
+    assert not result.failed_ids
+    assert sorted(result.unchanged_ids) == ["1dey", "2dh1"]
+    assert os.path.getmtime(tmp_path / "summary" / "2dh1.json") == modification_time
+    conditional_headers = [
+        call.kwargs["headers"] for call in get_response_mock.call_args_list[2:] if "1dey" in call.args[0]
+    ]
+    assert conditional_headers == [{"If-None-Match": '"v1"'}]
+
+
+class InterruptedRaw:  # pylint: disable=too-few-public-methods
+    def stream(self, *_, **__):
+        yield b'{"1dey": [{"title": '
+        raise ProtocolError("Connection broken")
+
+
+def test_download_one_type_rest_files_saves_response_bytes_unchanged(tmp_path, mocker):
+    # arrange
+    os.mkdir(tmp_path / "summary")
+    content = b'{"1dey":[{"title":"\\u00e9 title"}]}'
+    mocker.patch(
+        "src.data_download.rest_download.get_response_with_retries", return_value=create_response(200, content)
+    )
+
+    # act
+    result = download_one_type_rest_files({"1dey"}, RestDataType.SUMMARY, str(tmp_path), 10)
+
+    # assert
+    assert not result.failed_ids
+    with open(tmp_path / "summary" / "1dey.json", "rb") as f:
+        assert f.read() == content
+    assert os.listdir(tmp_path / "summary") == ["1dey.json"]
+
+
+def test_download_one_type_rest_files_returns_ids_not_requested_because_of_open_circuit_separately(tmp_path, mocker):
+    # arrange
+    os.mkdir(tmp_path / "summary")
+
+    def fake_get_response(address, **_):
+        structure_id = address.split("/")[-1]
+        if structure_id == "2dh1":
+            raise DataDownloadCircuitOpenError("Host is unavailable.")
+        if structure_id == "3rec":
+            raise DataDownloadError("404")
+        return create_response(200, json.dumps({structure_id: []}).encode("utf8"))
+
+    mocker.patch("src.data_download.rest_download.get_response_with_retries", side_effect=fake_get_response)
+
+    # act
+    result = download_one_type_rest_files({"1dey", "2dh1", "3rec"}, RestDataType.SUMMARY, str(tmp_path), 10)
+
+    # assert
+    assert sorted(result.failed_ids) == ["2dh1", "3rec"]
+    assert result.not_attempted_ids == ["2dh1"]
+
+
+def test_download_one_type_rest_files_stores_hash_of_response_bytes_without_decoding_them(tmp_path, mocker):
+    # arrange
+    os.mkdir(tmp_path / "summary")
+    validator_store = RestValidatorStore()
+    content = b'{"1dey": [{"title": "title"}]}'
+    mocker.patch(
+        "src.data_download.rest_download.get_response_with_retries",
+        side_effect=lambda *_, **__: create_response(200, content),
+    )
+    download_one_type_rest_files({"1dey"}, RestDataType.SUMMARY, str(tmp_path), 10, 1, validator_store)
+    json_loads_spy = mocker.spy(json, "loads")
+
+    # act
+    result = download_one_type_rest_files({"1dey"}, RestDataType.SUMMARY, str(tmp_path), 10, 1, validator_store)
+
+    # assert
+    assert result.unchanged_ids == ["1dey"]
+    assert validator_store.get("summary", "1dey").content_hash == hashlib.sha256(content).hexdigest()
+    json_loads_spy.assert_not_called()
+
+
+def test_download_one_type_rest_files_keeps_stored_file_on_interrupted_download(tmp_path, mocker):
+    # arrange
+    os.mkdir(tmp_path / "summary")
+    with open(tmp_path / "summary" / "1dey.json", "wb") as f:
+        f.write(b'{"1dey": []}')
+    response = create_response(200)
+    response._content = False  # pylint: disable=protected-access
+    response._content_consumed = False  # pylint: disable=protected-access
+    response.raw = InterruptedRaw()
+    mocker.patch("src.data_download.rest_download.get_response_with_retries", return_value=response)
+
+    # act
+    result = download_one_type_rest_files({"1dey"}, RestDataType.SUMMARY, str(tmp_path), 10)
+
+    # assert
+    assert result.failed_ids == ["1dey"]
+    with open(tmp_path / "summary" / "1dey.json", "rb") as f:
+        assert f.read() == b'{"1dey": []}'
+    assert os.listdir(tmp_path / "summary") == ["1dey.json"]
+
+
+@pytest.mark.parametrize(
+    "content, expected_saved",
+    [
+        (b'{\n\t"Version": "1.5.1",\n\t"Summary": {}\n}', True),
+        (b'{"Version": null, "Summary": {}}', False),
+        (b'{"Version": "n/a"}', False),
+        (b'{"Summary": {}}', False),
+        (b'{"Summary": {"Version": "1.5.1"}, "Version": null}', False),
+        (b'{"Version": "1.5.1", "Summary": {"Version": null}}', True),
+        (b"<html>Service unavailable</html>", False),
+    ],
+)
+def test_download_one_type_rest_files_checks_validator_db_content(tmp_path, mocker, content, expected_saved):
+    # arrange
+    mocker.patch(
+        "src.data_download.rest_download.get_response_with_retries", return_value=create_response(200, content)
+    )
+
+    # act
+    result = download_one_type_rest_files({"1dey"}, RestDataType.VALIDATOR_DB, str(tmp_path), 10)
+
+    # assert
+    assert (not result.failed_ids) == expected_saved
+    assert os.path.exists(tmp_path / "1dey" / "result.json") == expected_saved
+    assert os.listdir(tmp_path) == (["1dey"] if expected_saved else [])
+
+
+def test_download_one_type_rest_files_in_batches(tmp_path, mocker):
+    # arrange
+    os.mkdir(tmp_path / "summary")
+
+    def fake_get_response(address, **kwargs):
+        if kwargs.get("data") is None:  # single id request
+            structure_id = address.split("/")[-1]
+            if structure_id == "3rec":
+                raise DataDownloadError("404")
+            return create_response(200, json.dumps({structure_id: [{"title": "single"}]}).encode("utf8"))
+        batch_ids = kwargs["data"].split(",")
+        if "9zzz" in batch_ids:
+            raise DataDownloadError("500")
+        # response omits ids the api does not know
+        batch_json = {structure_id: [{"title": "batch"}] for structure_id in batch_ids if structure_id != "3rec"}
+        return create_response(200, json.dumps(batch_json).encode("utf8"))
+
+    get_response_mock = mocker.patch(
+        "src.data_download.rest_download.get_response_with_retries", side_effect=fake_get_response
+    )
+
+    # act
+    result = download_one_type_rest_files(
+        {"1dey", "2dh1", "3rec", "5dh6", "9zzz"}, RestDataType.SUMMARY, str(tmp_path), 10, 2, batch_size=3
+    )
+
+    # assert
+    assert result.failed_ids == ["3rec"]
+    assert not result.unchanged_ids
+    expected_titles = {"1dey": "batch", "2dh1": "batch", "5dh6": "single", "9zzz": "single"}
+    for structure_id, expected_title in expected_titles.items():
+        with open(tmp_path / "summary" / f"{structure_id}.json", encoding="utf8") as f:
+            assert json.load(f) == {structure_id: [{"title": expected_title}]}
+    batch_requests = [call.kwargs["data"] for call in get_response_mock.call_args_list if call.kwargs.get("data")]
+    assert sorted(batch_requests) == ["1dey,2dh1,3rec", "5dh6,9zzz"]
+    assert get_response_mock.call_count == 5  # two batches, then 3rec, 5dh6 and 9zzz one by one
+
+
+@pytest.mark.parametrize("first_batch_size, second_batch_size", [(1, 2), (2, 1)])
+def test_download_one_type_rest_files_finds_the_same_content_unchanged_in_batch_and_single_download(
+    first_batch_size, second_batch_size, tmp_path, mocker
+):
+    # arrange
+    os.mkdir(tmp_path / "summary")
+    validator_store = RestValidatorStore()
+    summary_jsons = {
+        structure_id: [{"title": f"é {structure_id}", "release_date": "20000101", "resolution": 1.50}]
+        for structure_id in ["1dey", "2dh1"]
+    }
+
+    def fake_get_response(address, **kwargs):
+        if kwargs.get("data") is None:  # single id request, the body formatted differently than batch items
+            structure_id = address.split("/")[-1]
+            return create_response(200, json.dumps({structure_id: summary_jsons[structure_id]}, indent=2).encode())
+        return create_response(200, json.dumps(summary_jsons).encode("utf8"))
+
+    mocker.patch("src.data_download.rest_download.get_response_with_retries", side_effect=fake_get_response)
+
+    def download(batch_size):
+        return download_one_type_rest_files(
+            {"1dey", "2dh1"}, RestDataType.SUMMARY, str(tmp_path), 10, 2, validator_store, batch_size=batch_size
+        )
+
+    download(first_batch_size)
+    stored_contents = {path: path.read_bytes() for path in (tmp_path / "summary").iterdir()}
+
+    # act
+    result = download(second_batch_size)
+
+    # assert
+    assert not result.failed_ids
+    assert sorted(result.unchanged_ids) == ["1dey", "2dh1"]
+    assert {path: path.read_bytes() for path in (tmp_path / "summary").iterdir()} == stored_contents
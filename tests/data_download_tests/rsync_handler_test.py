@@ -0,0 +1,192 @@
+import sys
+
+import pytest
+
+from src.data_download.rsync_handler import rsync_and_unzip, RsyncDataType
+from src.exception import DataDownloadError
+
+# stands in for rsync: reports each file before it is "transferred" (written), as rsync does with "%o %f" format
+FAKE_RSYNC_SCRIPT = """
+import gzip, os, sys, time
+target_folder, exit_code = sys.argv[1], int(sys.argv[2])
+for filename in ["1dey.cif.gz", "2dh1.cif.gz", "broken.cif.gz"]:
+    print(f'"recv {filename}"', flush=True)
+    time.sleep(0.05)
+    if filename == "broken.cif.gz":
+        with open(os.path.join(target_folder, filename), "wb") as f:
+            f.write(b"not a gzip")
+    else:
+        with gzip.open(os.path.join(target_folder, filename), "wb") as f:
+            f.write(f"data_{filename[:4]}".encode("utf8"))
+    if exit_code != 0 and filename == "2dh1.cif.gz":
+        sys.exit(exit_code)
+print('"del. 3rec.cif.gz"', flush=True)
+print('"recv somewhere/readme.txt"', flush=True)
+"""
+
+
+def create_fake_rsync(mocker, exit_code: int = 0) -> None:
+    mocker.patch(
+        "src.data_download.rsync_handler._assemble_rsync_command",
+        side_effect=lambda _, target_folder: [sys.executable, "-c", FAKE_RSYNC_SCRIPT, target_folder, str(exit_code)],
+    )
+
+
+def test_rsync_and_unzip_unpacks_files_as_they_are_recieved(tmp_path, mocker):
+    # arrange
+    create_fake_rsync(mocker)
+    (tmp_path / "gz").mkdir()
+    (tmp_path / "unpacked").mkdir()
+    (tmp_path / "unpacked" / "3rec.cif").write_text("data_3rec")
+
+    # act
+    rsync_log = rsync_and_unzip(
+        RsyncDataType.ARCHIVE_MMCIF,
+        str(tmp_path / "gz"),
+        str(tmp_path / "unpacked"),
+        str(tmp_path / "rsync.log"),
+        max_unpacking_workers=2,
+    )
+
+    # assert
+    assert rsync_log.get_successful_recieved_ids() == ["1dey", "2dh1"]
+    assert [item.structure_id for item in rsync_log.recieved if item.unpacking_failure] == ["broken"]
+    assert rsync_log.get_deleted_ids() == ["3rec"]
+    assert (tmp_path / "unpacked" / "1dey.cif").read_text() == "data_1dey"
+    assert (tmp_path / "unpacked" / "2dh1.cif").read_text() == "data_2dh1"
+    assert not (tmp_path / "unpacked" / "3rec.cif").exists()
+    assert (tmp_path / "rsync.log").read_text().splitlines() == [
+        '"recv 1dey.cif.gz"',
+        '"recv 2dh1.cif.gz"',
+        '"recv broken.cif.gz"',
+        '"del. 3rec.cif.gz"',
+        '"recv somewhere/readme.txt"',
+    ]
+
+
+def test_rsync_and_unzip_raises_on_rsync_failure(tmp_path, mocker):
+    # arrange
+    create_fake_rsync(mocker, exit_code=23)
+    (tmp_path / "gz").mkdir()
+    (tmp_path / "unpacked").mkdir()
+
+    # act & assert
+    with pytest.raises(DataDownloadError):
+        rsync_and_unzip(
+            RsyncDataType.ARCHIVE_MMCIF,
+            str(tmp_path / "gz"),
+            str(tmp_path / "unpacked"),
+            str(tmp_path / "rsync.log"),
+        )
+    assert (tmp_path / "unpacked" / "1dey.cif").read_text() == "data_1dey"
+    assert (tmp_path / "rsync.log").read_text().splitlines() == ['"recv 1dey.cif.gz"', '"recv 2dh1.cif.gz"']
+
+
+def test_rsync_and_unzip_without_unpacking(tmp_path, mocker):
+    # arrange
+    create_fake_rsync(mocker)
+    (tmp_path / "gz").mkdir()
+    (tmp_path / "unpacked").mkdir()
+    (tmp_path / "unpacked" / "3rec.cif").write_text("data_3rec")
+
+    # act
+    rsync_log = rsync_and_unzip(
+        RsyncDataType.ARCHIVE_MMCIF,
+        str(tmp_path / "gz"),
+        str(tmp_path / "unpacked"),
+        str(tmp_path / "rsync.log"),
+        unpack=False,
+    )
+
+    # assert
+    assert rsync_log.get_successful_recieved_ids() == ["1dey", "2dh1", "broken"]
+    assert rsync_log.get_deleted_ids() == ["3rec"]
+    assert [path.name for path in (tmp_path / "unpacked").iterdir()] == ["3rec.cif"]
+
+
+# stands in for rsync with shard filter rules: reports only files that are not excluded by them
+FAKE_FILTERING_RSYNC_SCRIPT = """
+import fnmatch, gzip, os, sys
+target_folder, filters = sys.argv[1], sys.argv[2:]
+
+def is_included(filename):
+    for rule in filters:
+        action, pattern = rule.split("=", 1)
+        if fnmatch.fnmatchcase("/" + filename, pattern):
+            return action == "--include"
+    return True
+
+for filename in ["1dey.cif.gz", "2dh1.cif.gz", "1abc.cif.gz", "103d.cif.gz", "5zck.cif.gz", "README.cif.gz"]:
+    if is_included(filename):
+        print(f'"recv {filename}"', flush=True)
+        with gzip.open(os.path.join(target_folder, filename), "wb") as f:
+            f.write(f"data_{filename[:4]}".encode("utf8"))
+for filename in ["3rec.cif.gz", "8ucv.cif.gz"]:
+    if is_included(filename):
+        print(f'"del. {filename}"', flush=True)
+"""
+
+
+def run_filtering_rsync(tmp_path, mocker, rsync_shards: int):
+    mocker.patch(
+        "src.data_download.rsync_handler._assemble_rsync_command",
+        side_effect=lambda _, target_folder, *filters: [
+            sys.executable, "-c", FAKE_FILTERING_RSYNC_SCRIPT, target_folder, *filters
+        ],
+    )
+    folder = tmp_path / f"shards{rsync_shards}"
+    (folder / "gz").mkdir(parents=True)
+    (folder / "unpacked").mkdir()
+    rsync_log = rsync_and_unzip(
+        RsyncDataType.ARCHIVE_MMCIF,
+        str(folder / "gz"),
+        str(folder / "unpacked"),
+        str(folder / "rsync.log"),
+        max_unpacking_workers=2,
+        rsync_shards=rsync_shards,
+    )
+    return rsync_log, folder
+
+
+@pytest.mark.parametrize("rsync_shards", [2, 5, 36])
+def test_rsync_and_unzip_in_shards_matches_single_rsync(tmp_path, mocker, rsync_shards):
+    # arrange
+    single_rsync_log, single_rsync_folder = run_filtering_rsync(tmp_path, mocker, 1)
+
+    # act
+    rsync_log, folder = run_filtering_rsync(tmp_path, mocker, rsync_shards)
+
+    # assert
+    assert sorted(rsync_log.get_successful_recieved_ids()) == sorted(single_rsync_log.get_successful_recieved_ids())
+    assert sorted(rsync_log.get_deleted_ids()) == sorted(single_rsync_log.get_deleted_ids())
+    assert sorted(path.name for path in (folder / "unpacked").iterdir()) == sorted(
+        path.name for path in (single_rsync_folder / "unpacked").iterdir()
+    )
+    assert sorted((folder / "rsync.log").read_text().splitlines()) == sorted(
+        (single_rsync_folder / "rsync.log").read_text().splitlines()
+    )
+    assert [path.name for path in folder.iterdir() if path.name.startswith("rsync.log")] == ["rsync.log"]
+
+
+def test_rsync_and_unzip_in_shards_raises_after_all_shards_finish(tmp_path, mocker):
+    # arrange
+    def fake_rsync_command(_, target_folder, *filters):
+        if filters and filters[0].startswith("--exclude"):  # first shard fails
+            return [sys.executable, "-c", "import sys; print('\"recv 1abc.cif.gz\"'); sys.exit(12)"]
+        return [sys.executable, "-c", FAKE_FILTERING_RSYNC_SCRIPT, target_folder, *filters]
+
+    mocker.patch("src.data_download.rsync_handler._assemble_rsync_command", side_effect=fake_rsync_command)
+    (tmp_path / "gz").mkdir()
+    (tmp_path / "unpacked").mkdir()
+
+    # act & assert
+    with pytest.raises(DataDownloadError):
+        rsync_and_unzip(
+            RsyncDataType.ARCHIVE_MMCIF,
+            str(tmp_path / "gz"),
+            str(tmp_path / "unpacked"),
+            str(tmp_path / "rsync.log"),
+            rsync_shards=2,
+        )
+    assert (tmp_path / "unpacked" / "1dey.cif").read_text() == "data_1dey"
+    assert '"recv 1abc.cif.gz"' in (tmp_path / "rsync.log").read_text().splitlines()
@@ -0,0 +1,33 @@
+from src.data_download.settled_structures_tracker import SettledStructuresTracker
+
+
+def test_structure_is_settled_once_all_its_sources_finished():
+    # arrange
+    settled_ids = []
+    tracker = SettledStructuresTracker(["1dey", "2dh1"], ["summary", "molecules"], ["xml"], settled_ids.append)
+
+    # act & assert
+    tracker.structure_source_finished("summary", "1dey")
+    tracker.structure_source_finished("molecules", "1dey")
+    tracker.structure_source_finished("summary", "2dh1")
+    assert not settled_ids  # xml rsync still runs
+
+    tracker.source_finished("xml")
+    assert settled_ids == ["1dey"]
+
+    tracker.structure_source_finished("molecules", "2dh1")
+    tracker.structure_source_finished("molecules", "2dh1")
+    assert settled_ids == ["1dey", "2dh1"]
+
+
+def test_structures_not_tracked_are_not_settled():
+    # arrange
+    settled_ids = []
+    tracker = SettledStructuresTracker(["1dey"], ["summary"], [], settled_ids.append)
+
+    # act
+    tracker.structure_source_finished("summary", "5dh6")
+    tracker.structure_source_finished("summary", "1dey")
+
+    # assert
+    assert settled_ids == ["1dey"]
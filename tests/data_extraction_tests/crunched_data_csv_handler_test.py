@@ -0,0 +1,24 @@
+from src.data_extraction.crunched_data_csv_handler import CrunchedRowsSink
+from src.models.names_csv_output_attributes import CRUNCHED_CSV_FACTOR_ORDER
+
+
+def test_crunched_rows_sink_returns_rows_as_added(tmp_path):
+    # arrange
+    column_count = len(CRUNCHED_CSV_FACTOR_ORDER)
+    rows = [
+        tuple(f"{row_index}_{column_index}" for column_index in range(column_count))
+        for row_index in range(5)
+    ]
+    rows.append(("1abc", "nan", "", 'text; with "quotes"\nand newline') + ("0.5",) * (column_count - 4))
+
+    # act
+    with CrunchedRowsSink(str(tmp_path), chunk_size=2) as rows_sink:
+        for row in rows:
+            rows_sink.add(row)
+        loaded_df = rows_sink.load_as_dataframe()
+
+    # assert
+    assert rows_sink.row_count == len(rows)
+    assert list(loaded_df.columns) == CRUNCHED_CSV_FACTOR_ORDER
+    assert [tuple(row) for row in loaded_df.itertuples(index=False)] == rows
+    assert not list(tmp_path.iterdir())
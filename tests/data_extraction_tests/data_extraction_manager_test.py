@@ -0,0 +1,84 @@
+from src.config import Config
+from src.data_extraction import data_extraction_manager
+from src.data_extraction.data_extraction_manager import (
+    DataExtractionManager,
+    PrefetchedProteinData,
+    init_protein_data_loading_worker,
+    load_protein_data_in_worker,
+    run_data_extraction,
+)
+from src.models import LigandInfo
+from src.models.ids_to_update import IdsToUpdateAndRemove
+from src.models.protein_data import ProteinDataRow
+
+
+def test_protein_data_loading_worker_uses_ligand_stats_it_was_initialized_with(mocker):
+    # arrange
+    config = Config()
+    ligand_stats = {"AOH": LigandInfo(id="AOH", heavy_atom_count=61, flexibility=0.124031)}
+    mocked_load_all = mocker.patch.object(DataExtractionManager, "load_all_protein_data")
+    mocked_load_ligand_stats = mocker.patch.object(DataExtractionManager, "load_and_parse_ligand_stats")
+    init_protein_data_loading_worker(config, ligand_stats)
+
+    # act
+    load_protein_data_in_worker("1dey")
+    load_protein_data_in_worker("2pde")
+
+    # assert
+    mocked_load_ligand_stats.assert_not_called()
+    assert [call.args for call in mocked_load_all.call_args_list] == [
+        ("1dey", config, ligand_stats),
+        ("2pde", config, ligand_stats),
+    ]
+
+
+def test_protein_data_loading_worker_loads_ligand_stats_once_if_not_given(mocker):
+    # arrange
+    config = Config()
+    ligand_stats = {"AOH": LigandInfo(id="AOH", heavy_atom_count=61, flexibility=0.124031)}
+    mocked_load_all = mocker.patch.object(DataExtractionManager, "load_all_protein_data")
+    mocked_load_ligand_stats = mocker.patch.object(
+        DataExtractionManager, "load_and_parse_ligand_stats", return_value=ligand_stats
+    )
+    init_protein_data_loading_worker(config, None)
+
+    # act
+    load_protein_data_in_worker("1dey")
+    load_protein_data_in_worker("2pde")
+
+    # assert
+    mocked_load_ligand_stats.assert_called_once_with(config)
+    mocked_load_all.assert_called_with("2pde", config, ligand_stats)
+
+
+def test_run_data_extraction_uses_ligand_stats_updated_during_download(mocker):
+    # arrange
+    config = Config()
+    ligand_stats = {"AOH": LigandInfo(id="AOH", heavy_atom_count=61, flexibility=0.124031)}
+    prefetched_row = ProteinDataRow(pdb_id="1dey", csv_values=("1dey",), ligand_types_present=["AOH"])
+    prefetched_protein_data = PrefetchedProteinData(ligand_stats=ligand_stats, protein_data={"1dey": prefetched_row})
+    mocker.patch.object(
+        data_extraction_manager,
+        "finds_ids_to_update_and_remove",
+        return_value=IdsToUpdateAndRemove(structures_to_update=["1dey"], ligands_to_update=["AOH"]),
+    )
+    mocker.patch.object(DataExtractionManager, "update_ids_to_update_based_on_ligand_occurences")
+    mocked_update_ligand_stats = mocker.patch.object(DataExtractionManager, "update_ligand_stats")
+    mocked_load_ligand_stats = mocker.patch.object(DataExtractionManager, "load_and_parse_ligand_stats")
+    mocked_pool = mocker.patch.object(data_extraction_manager, "Pool")
+    mocked_rows_sink = mocker.patch.object(data_extraction_manager, "CrunchedRowsSink").return_value.__enter__()
+    mocked_rows_sink.row_count = 1
+    mocker.patch.object(DataExtractionManager, "update_ligand_occurrence_json", return_value=True)
+    mocker.patch.object(DataExtractionManager, "store_protein_data_into_crunched_csv", return_value=True)
+    mocker.patch.object(data_extraction_manager, "delete_old_crunched_csv")
+    mocker.patch.object(data_extraction_manager, "release_simple_lock_file")
+
+    # act
+    success = run_data_extraction(config, prefetched_protein_data)
+
+    # assert
+    assert success
+    mocked_update_ligand_stats.assert_not_called()
+    mocked_load_ligand_stats.assert_not_called()
+    assert mocked_pool.call_args.kwargs["initargs"] == (config, ligand_stats)
+    mocked_rows_sink.add.assert_called_once_with(("1dey",))
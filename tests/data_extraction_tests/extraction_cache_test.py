@@ -0,0 +1,114 @@
+import hashlib
+import os
+
+from src.config import Config
+from src.data_extraction import data_extraction_manager
+from src.data_extraction.data_extraction_manager import DataExtractionManager
+from src.data_extraction.extraction_cache import ExtractionCache, FileFingerprint, _get_file_fingerprint
+from src.models import LigandInfo
+from tests.test_constants import TEST_DATA_PATH
+
+
+def _parse_file_content(filepath: str, ligand_stats=None) -> str:
+    with open(filepath, encoding="utf8") as file:
+        content = file.read()
+    if ligand_stats is not None:
+        ligand_info = ligand_stats.get(content)
+        content += f";{ligand_info.heavy_atom_count if ligand_info else None}"
+    return content
+
+
+def test_get_file_fingerprint_without_hashlib_file_digest(tmp_path, monkeypatch):
+    # arrange
+    input_path = str(tmp_path / "input.json")
+    content = b"content" * 100_000
+    with open(input_path, "wb") as file:
+        file.write(content)
+    os.utime(input_path, ns=(1_000_000_000, 2_000_000_000))
+    # not available in python 3.10
+    monkeypatch.delattr(hashlib, "file_digest", raising=False)
+
+    # act
+    fingerprint = _get_file_fingerprint(input_path)
+
+    # assert
+    assert fingerprint == FileFingerprint(
+        size=len(content), mtime_ns=2_000_000_000, sha256=hashlib.sha256(content).hexdigest()
+    )
+
+
+def test_extraction_cache_parses_again_only_changed_files(tmp_path, mocker):
+    # arrange
+    input_path = str(tmp_path / "input.json")
+    with open(input_path, "w", encoding="utf8") as file:
+        file.write("first")
+    extraction_cache = ExtractionCache(str(tmp_path / "cache"))
+    parse = mocker.Mock(side_effect=lambda _: _parse_file_content(input_path))
+
+    # act
+    first_result = extraction_cache.load_or_parse("vdb", "1dey", [input_path], parse)
+    os.utime(input_path, ns=(1_000_000_000, 1_000_000_000))  # modified without content change
+    unchanged_result = extraction_cache.load_or_parse("vdb", "1dey", [input_path], parse)
+    with open(input_path, "w", encoding="utf8") as file:
+        file.write("other")
+    changed_result = extraction_cache.load_or_parse("vdb", "1dey", [input_path], parse)
+
+    # assert
+    assert (first_result, unchanged_result, changed_result) == ("first", "first", "other")
+    assert parse.call_count == 2
+
+
+def test_extraction_cache_parses_again_only_if_used_ligand_stats_changed(tmp_path, mocker):
+    # arrange
+    input_path = str(tmp_path / "result.json")
+    with open(input_path, "w", encoding="utf8") as file:
+        file.write("AOH")
+    extraction_cache = ExtractionCache(str(tmp_path / "cache"))
+    parse = mocker.Mock(side_effect=lambda ligand_stats: _parse_file_content(input_path, ligand_stats))
+    ligand_stats = {"AOH": LigandInfo(id="AOH", heavy_atom_count=61, flexibility=0.124031)}
+    ligand_stats_with_other_ligand = ligand_stats | {"HEM": LigandInfo(id="HEM", heavy_atom_count=43, flexibility=0.1)}
+    changed_ligand_stats = {"AOH": LigandInfo(id="AOH", heavy_atom_count=62, flexibility=0.124031)}
+
+    # act
+    first_result = extraction_cache.load_or_parse("xml", "1dey", [input_path], parse, ligand_stats)
+    unchanged_result = extraction_cache.load_or_parse(
+        "xml", "1dey", [input_path], parse, ligand_stats_with_other_ligand
+    )
+    changed_result = extraction_cache.load_or_parse("xml", "1dey", [input_path], parse, changed_ligand_stats)
+    removed_result = extraction_cache.load_or_parse("xml", "1dey", [input_path], parse, {})
+
+    # assert
+    assert [first_result, unchanged_result, changed_result, removed_result] == [
+        "AOH;61",
+        "AOH;61",
+        "AOH;62",
+        "AOH;None",
+    ]
+    assert parse.call_count == 3
+
+
+def test_load_all_protein_data_with_extraction_cache_loads_the_same_data(tmp_path, mocker):
+    # arrange
+    pdb_id = "1dey"
+    config = Config()
+    config.use_extraction_cache = True
+    config.filepaths.dataset_root_path = TEST_DATA_PATH
+    config.filepaths._rest_jsons_name = pdb_id
+    config.filepaths._pdb_mmcifs_name = pdb_id
+    config.filepaths._xml_reports_name = pdb_id
+    config.filepaths._validator_db_results_name = ""
+    config.filepaths._extraction_cache_name = str(tmp_path / "extraction_cache")
+    ligand_stats = DataExtractionManager.load_and_parse_ligand_stats(config)
+    expected_protein_data = DataExtractionManager.load_all_protein_data(pdb_id, config, ligand_stats)
+    parsers = [
+        mocker.patch.object(data_extraction_manager, parser_name)
+        for parser_name in ["parse_pdbx", "parse_rest", "parse_xml_validation_report", "parse_validator_db_result"]
+    ]
+
+    # act
+    actual_protein_data = DataExtractionManager.load_all_protein_data(pdb_id, config, ligand_stats)
+
+    # assert
+    for parser in parsers:
+        parser.assert_not_called()
+    assert actual_protein_data == expected_protein_data
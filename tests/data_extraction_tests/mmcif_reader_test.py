@@ -0,0 +1,200 @@
+import gzip
+import shutil
+
+import pytest
+from Bio.PDB.MMCIF2Dict import MMCIF2Dict
+
+import src.data_extraction.mmcif_reader as mmcif_reader
+from src.data_extraction.mmcif_reader import read_mmcif_items, read_mmcif_items_of_first_group
+from tests.test_constants import *
+
+MMCIF_WITH_SKIPPED_TEXT_FIELDS = """data_TEST
+#
+_entry.id TEST
+_struct.title
+;Title with 'quotes' and
+_item_like_line inside text field
+;
+loop_
+_skipped.id
+_skipped.text
+1
+;_looks like item
+loop_
+;
+2 'quoted # not comment'
+loop_
+_wanted.id
+_wanted.name
+_wanted.value
+1 "first name" 1.5 # comment
+2 'it''s' 2.5
+3
+;multi
+line
+; 3.5
+_single.value   'last value'
+"""
+
+MMCIF_WITH_MULTIPLE_MODELS = """data_TEST
+loop_
+_atom_site.id
+_atom_site.label_atom_id
+_atom_site.pdbx_PDB_model_num
+_atom_site.occupancy
+1 N 1 1.0
+2 "C1'" 1 0.5
+3 CA 1 1.0
+1 N 2 1.0
+2 "C1'" 2 0.5
+#
+_exptl.method 'SOLUTION NMR'
+"""
+
+MMCIF_WITH_LOOP_VALUES_STARTING_WITH_UNDERSCORE = """data_TEST
+loop_
+_skipped.id
+_skipped.name
+_skipped.value
+1 first
+_underscore_value
+2 'quoted value'
+_another_underscore_value
+3 loop_value 3.5
+_exptl.method 'X-RAY DIFFRACTION'
+_refine.ls_d_res_high 1.50
+"""
+
+
+@pytest.mark.parametrize("pdb_id", TEST_PDB_IDS)
+@pytest.mark.parametrize("gzipped, memory_mapped", [(False, False), (False, True), (True, False)])
+def test_read_mmcif_items_same_as_mmcif2dict(pdb_id: str, gzipped: bool, memory_mapped: bool, tmp_path, mocker):
+    # arrange
+    path_to_pdbx_file = path.join(TEST_DATA_PATH, pdb_id, f"{pdb_id}.cif")
+    if gzipped:
+        path_to_gzipped_pdbx_file = str(tmp_path / f"{pdb_id}.cif.gz")
+        with open(path_to_pdbx_file, "rb") as input_file, gzip.open(path_to_gzipped_pdbx_file, "wb") as output_file:
+            shutil.copyfileobj(input_file, output_file)
+        path_to_pdbx_file = path_to_gzipped_pdbx_file
+    if memory_mapped:
+        mocker.patch.object(mmcif_reader, "MMCIF_MEMORY_MAP_MIN_SIZE", 1)
+    with open(path.join(TEST_DATA_PATH, pdb_id, f"{pdb_id}.cif"), encoding="utf8") as mmcif_file:
+        expected_items = MMCIF2Dict(mmcif_file)
+    # every third item, so that some loops are read and others skipped, and items missing in the file
+    item_names = [item_name for item_name in expected_items if item_name != "data_"][::3]
+    item_names += ["_atom_site.id", "_atom_site.occupancy", "_missing.item", "_em_3d_reconstruction.resolution"]
+
+    # act
+    actual_items = read_mmcif_items(path_to_pdbx_file, item_names)
+
+    # assert
+    assert actual_items == {
+        item_name: expected_items[item_name] for item_name in item_names if item_name in expected_items
+    }
+
+
+def test_read_mmcif_items_skips_text_fields_and_tokenizes_quotes(tmp_path):
+    # arrange
+    mmcif_path = str(tmp_path / "test.cif")
+    with open(mmcif_path, "w", encoding="utf8") as mmcif_file:
+        mmcif_file.write(MMCIF_WITH_SKIPPED_TEXT_FIELDS)
+    item_names = ["_entry.id", "_struct.title", "_wanted.id", "_wanted.name", "_wanted.value", "_single.value"]
+    with open(mmcif_path, encoding="utf8") as mmcif_file:
+        expected_items = MMCIF2Dict(mmcif_file)
+
+    # act
+    actual_items = read_mmcif_items(mmcif_path, item_names)
+
+    # assert
+    assert actual_items == {item_name: expected_items[item_name] for item_name in item_names}
+    assert actual_items["_wanted.name"] == ["first name", "it''s", "multi\nline"]
+
+
+def test_read_mmcif_items_raises_on_invalid_file(tmp_path):
+    # arrange
+    mmcif_path = str(tmp_path / "test.cif")
+    with open(mmcif_path, "w", encoding="utf8") as mmcif_file:
+        mmcif_file.write("_entry.id TEST\n")
+
+    # act & assert
+    with pytest.raises(ValueError):
+        read_mmcif_items(mmcif_path, ["_entry.id"])
+
+
+@pytest.mark.parametrize("second_model_row", ["1 N 2 1.0", "2 \"C1'\" 2 0.5"])
+def test_read_mmcif_items_of_first_group_reads_only_first_model(second_model_row: str, tmp_path):
+    # arrange
+    mmcif_path = str(tmp_path / "test.cif")
+    with open(mmcif_path, "w", encoding="utf8") as mmcif_file:
+        mmcif_file.write(MMCIF_WITH_MULTIPLE_MODELS.replace("1 N 2 1.0", second_model_row))
+    item_names = ["_atom_site.id", "_atom_site.label_atom_id", "_atom_site.pdbx_PDB_model_num", "_exptl.method"]
+
+    # act
+    items, rows_skipped = read_mmcif_items_of_first_group(mmcif_path, item_names, "_atom_site.pdbx_PDB_model_num")
+
+    # assert
+    assert rows_skipped
+    assert items == {
+        "_atom_site.id": ["1", "2", "3"],
+        "_atom_site.label_atom_id": ["N", "C1'", "CA"],
+        "_atom_site.pdbx_PDB_model_num": ["1", "1", "1"],
+        "_exptl.method": ["SOLUTION NMR"],
+    }
+
+
+def test_read_mmcif_items_of_first_group_reads_all_rows_of_single_model(tmp_path):
+    # arrange
+    mmcif_path = str(tmp_path / "test.cif")
+    with open(mmcif_path, "w", encoding="utf8") as mmcif_file:
+        mmcif_file.write(MMCIF_WITH_MULTIPLE_MODELS.replace(" 2 ", " 1 "))
+    item_names = ["_atom_site.id", "_atom_site.pdbx_PDB_model_num"]
+
+    # act
+    items, rows_skipped = read_mmcif_items_of_first_group(mmcif_path, item_names, "_atom_site.pdbx_PDB_model_num")
+
+    # assert
+    assert not rows_skipped
+    assert items == {"_atom_site.id": ["1", "2", "3", "1", "2"], "_atom_site.pdbx_PDB_model_num": ["1"] * 5}
+
+
+@pytest.mark.parametrize(
+    "item_names",
+    [
+        ["_exptl.method", "_refine.ls_d_res_high"],
+        ["_skipped.id", "_exptl.method", "_refine.ls_d_res_high"],
+    ],
+)
+def test_read_mmcif_items_ends_loop_only_on_row_boundary(item_names: list[str], tmp_path):
+    # arrange
+    mmcif_path = str(tmp_path / "test.cif")
+    with open(mmcif_path, "w", encoding="utf8") as mmcif_file:
+        mmcif_file.write(MMCIF_WITH_LOOP_VALUES_STARTING_WITH_UNDERSCORE)
+    with open(mmcif_path, encoding="utf8") as mmcif_file:
+        expected_items = MMCIF2Dict(mmcif_file)
+
+    # act
+    actual_items = read_mmcif_items(mmcif_path, item_names)
+
+    # assert
+    assert actual_items == {item_name: expected_items[item_name] for item_name in item_names}
+    assert actual_items["_exptl.method"] == ["X-RAY DIFFRACTION"]
+    assert actual_items["_refine.ls_d_res_high"] == ["1.50"]
+
+
+def test_read_mmcif_items_of_first_group_ends_loop_only_on_row_boundary(tmp_path):
+    # arrange
+    mmcif_path = str(tmp_path / "test.cif")
+    with open(mmcif_path, "w", encoding="utf8") as mmcif_file:
+        mmcif_file.write(MMCIF_WITH_MULTIPLE_MODELS.replace("2 \"C1'\" 2 0.5", "2\n_underscore_value 2 0.5"))
+    item_names = ["_atom_site.id", "_atom_site.pdbx_PDB_model_num", "_exptl.method"]
+
+    # act
+    items, rows_skipped = read_mmcif_items_of_first_group(mmcif_path, item_names, "_atom_site.pdbx_PDB_model_num")
+
+    # assert
+    assert rows_skipped
+    assert items == {
+        "_atom_site.id": ["1", "2", "3"],
+        "_atom_site.pdbx_PDB_model_num": ["1", "1", "1"],
+        "_exptl.method": ["SOLUTION NMR"],
+    }
@@ -1,3 +1,7 @@
+import gzip
+import logging
+import shutil
+
 import pytest
 
 from src.data_extraction.pdbx_parser import parse_pdbx
@@ -24,3 +28,64 @@ def test_parse_pdbx_basic(pdb_id: str):
         ignored_fields=["ligand_types_present"]  # value for ligand_occurence purposes, tested in other test
     )
     assert not differences.count, differences.get_difference_description()
+
+
+@pytest.mark.parametrize("pdb_id", TEST_PDB_IDS[:2])
+def test_parse_pdbx_gzipped(pdb_id: str, tmp_path):
+    # arrange
+    path_to_pdbx_file = path.join(TEST_DATA_PATH, pdb_id, f"{pdb_id}.cif")
+    path_to_gzipped_pdbx_file = str(tmp_path / f"{pdb_id}.cif.gz")
+    with open(path_to_pdbx_file, "rb") as input_file, gzip.open(path_to_gzipped_pdbx_file, "wb") as output_file:
+        shutil.copyfileobj(input_file, output_file)
+    expected_protein_data = parse_pdbx(pdb_id, path_to_pdbx_file)
+
+    # act
+    actual_protein_data = parse_pdbx(pdb_id, path_to_gzipped_pdbx_file)
+
+    # assert
+    assert actual_protein_data
+    differences = compare_dataclasses(actual_protein_data, expected_protein_data)
+    assert not differences.count, differences.get_difference_description()
+
+
+def test_parse_pdbx_counts_first_model_and_alternative_positions_once(tmp_path, caplog):
+    # arrange
+    caplog.set_level(logging.INFO)
+    path_to_pdbx_file = tmp_path / "1abc.cif"
+    path_to_pdbx_file.write_text(
+        "data_1ABC\n"
+        "_entry.id 1ABC\n"
+        "loop_\n_entity.id\n_entity.type\n_entity.pdbx_number_of_molecules\n_entity.formula_weight\n"
+        "1 polymer 1 89.093\n"
+        "loop_\n"
+        "_atom_site.group_PDB\n_atom_site.id\n_atom_site.type_symbol\n_atom_site.label_comp_id\n"
+        "_atom_site.occupancy\n_atom_site.auth_seq_id\n_atom_site.auth_comp_id\n_atom_site.auth_asym_id\n"
+        "_atom_site.pdbx_PDB_model_num\n"
+        "ATOM 1 N ALA 1.00 1 ALA A 1\n"
+        "ATOM 2 C ALA 0.60 1 ALA A 1\n"
+        "ATOM 2 C ALA 0.40 1 ALA A 1\n"
+        "HETATM 3 ZN ZN 1.00 101 ZN A 1\n"
+        "HETATM 4 O HOH 0.50 201 HOH A 1\n"
+        "HETATM 4 O HOH 0.30 201 HOH A 1\n"
+        "HETATM 5 O HOH 1.00 202 HOH A 1\n"
+        "HETATM 6 C GOL 1.00 301 GOL B 1\n"
+        "HETATM 7 O GOL 1.00 301 GOL B 1\n"
+        "HETATM 8 C GOL 1.00 301 GOL A 1\n"
+        "ATOM 1 N ALA 1.00 1 ALA A 2\n"
+        "HETATM 3 ZN ZN 1.00 101 ZN A 2\n",
+        encoding="utf8",
+    )
+
+    # act
+    protein_data = parse_pdbx("1abc", str(path_to_pdbx_file))
+
+    # assert
+    assert protein_data.atom_count_without_hetatms == 2
+    assert protein_data.hetatm_count == 6
+    assert protein_data.ligand_count == 5
+    assert protein_data.ligand_count_no_water == 3
+    assert protein_data.hetatm_count_no_water == 4
+    assert protein_data.ligand_count_metal == 1
+    assert protein_data.hetatm_count_metal == 1
+    assert protein_data.ligand_types_present == {"ZN", "HOH", "GOL"}
+    assert "Multiple model numbers present" in caplog.text
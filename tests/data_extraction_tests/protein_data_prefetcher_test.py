@@ -0,0 +1,34 @@
+import pytest
+
+from src.config import Config
+from src.data_extraction.data_extraction_manager import DataExtractionManager
+from src.data_extraction.protein_data_prefetcher import ProteinDataPrefetcher
+from src.models.ids_to_update import ChangedIds
+from src.models.protein_data import ProteinDataRow
+from tests.test_constants import TEST_DATA_PATH
+
+
+@pytest.mark.integration
+def test_protein_data_prefetcher_loads_the_same_data_as_data_extraction():
+    # arrange
+    pdb_id = "1dey"
+    config = Config()
+    config.max_process_count = 2
+    config.filepaths.dataset_root_path = TEST_DATA_PATH
+    config.filepaths._rest_jsons_name = pdb_id
+    config.filepaths._pdb_mmcifs_name = pdb_id
+    config.filepaths._xml_reports_name = pdb_id
+    config.filepaths._validator_db_results_name = ""
+    config.filepaths._ligand_stats_name = "ligandStats.csv"
+
+    # act
+    with ProteinDataPrefetcher(config) as prefetcher:
+        prefetcher.on_ligands_updated(ChangedIds())
+        prefetcher.on_structure_settled(pdb_id)
+        prefetched = prefetcher.collect()
+
+    # assert
+    assert prefetched.ligand_stats == DataExtractionManager.load_and_parse_ligand_stats(config)
+    assert list(prefetched.protein_data) == [pdb_id]
+    expected_protein_data = DataExtractionManager.load_all_protein_data(pdb_id, config)
+    assert prefetched.protein_data[pdb_id] == ProteinDataRow.from_protein_data(expected_protein_data)
@@ -1,3 +1,6 @@
+import gzip
+import shutil
+
 import pytest
 
 from src.data_extraction.ligand_stats_parser import parse_ligand_stats
@@ -47,3 +50,22 @@ def assert_correct_parse_xml_with_validation_report(pdb_id: str):
     assert actual_protein_data
     differences = compare_dataclasses(actual_protein_data, expected_protein_data)
     assert not differences.count, differences.get_difference_description()
+
+
+def test_parse_xml_validation_report_gzipped(tmp_path):
+    # arrange
+    pdb_id = TEST_PDB_IDS[0]
+    xml_file_path = path.join(TEST_DATA_PATH, pdb_id, f"{pdb_id}_validation.xml")
+    gzipped_xml_file_path = str(tmp_path / f"{pdb_id}_validation.xml.gz")
+    with open(xml_file_path, "rb") as input_file, gzip.open(gzipped_xml_file_path, "wb") as output_file:
+        shutil.copyfileobj(input_file, output_file)
+    ligand_stats = parse_ligand_stats(path.join(TEST_DATA_PATH, "ligandStats.csv"))
+    expected_protein_data = load_expected_xml_protein_data(pdb_id)
+
+    # act
+    actual_protein_data = parse_xml_validation_report(pdb_id, gzipped_xml_file_path, ligand_stats)
+
+    # assert
+    assert actual_protein_data
+    differences = compare_dataclasses(actual_protein_data, expected_protein_data)
+    assert not differences.count, differences.get_difference_description()
@@ -0,0 +1,123 @@
+"""
+Benchmark of the download phase (rest files, validator db reports and ligand ccd files) against local stand-in
+server, so that download improvements can be measured without contacting the real servers. Rsync of mmcif and
+validation xml files is not part of it.
+
+Run from the repository root:
+    python -m tests.download_benchmark.run_download_benchmark --structures 1000 --latency-ms 50
+
+Download settings (parallelism, batch size, rate limits, ...) are taken from the environment as usual
+(see DownloadConfig in src/config.py).
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from unittest import mock
+
+from src.config import Config
+from src.data_download.data_download_manager import DownloadManager, run_data_download
+from tests.download_benchmark.stand_in_server import StandInServer, StandInServerSettings, RequestRecord
+
+
+def main() -> None:
+    """
+    Parse arguments, run the benchmark and print the report.
+    """
+    args = _parse_args()
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s: %(message)s (%(filename)s:%(lineno)d)",
+    )
+    settings = StandInServerSettings(
+        latency_s=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        slow_body_chunk_delay_s=args.slow_body_ms / 1000,
+        ccd_copies=args.ccd_copies,
+        seed=args.seed,
+    )
+    with StandInServer(settings) as server, tempfile.TemporaryDirectory() as temp_folder:
+        wall_time_s = run_benchmark(server, temp_folder, args.structures)
+        print(format_report(server.records.get_all(), wall_time_s))
+
+
+def run_benchmark(server: StandInServer, temp_folder: str, structure_count: int) -> float:
+    """
+    Run the download phase for given number of structures against the stand-in server.
+    :param server: Running stand-in server.
+    :param temp_folder: Folder where the dataset and logs are created.
+    :param structure_count: Number of structures whose files are downloaded.
+    :return: Wall time of the download phase in seconds.
+    """
+    ids_json_path = os.path.join(temp_folder, "ids_to_download.json")
+    with open(ids_json_path, "w", encoding="utf8") as f:
+        json.dump([f"{i % 9 + 1}{i // 9:03x}" for i in range(structure_count)], f)
+
+    config = Config()
+    config.filepaths.dataset_root_path = os.path.join(temp_folder, "dataset")
+    config.filepaths.logs_root_path = os.path.join(temp_folder, "logs")
+    os.makedirs(config.filepaths.logs_root_path)
+    config.override_ids_to_download_filepath = ids_json_path
+    config.download.pdbe_rest_base_url = server.pdbe_rest_base_url
+    config.download.validator_db_base_url = server.validator_db_base_url
+    config.download.ligand_ccd_base_url = server.ligand_ccd_base_url
+
+    start = time.perf_counter()
+    # rsync of validation xmls does not go through http, it is not part of the benchmark
+    with mock.patch.object(DownloadManager, "rsync_xml_validation_files", return_value=[]):
+        run_data_download(config)
+    return time.perf_counter() - start
+
+
+def format_report(records: list[RequestRecord], wall_time_s: float) -> str:
+    """
+    Format throughput and latency of requests handled by the stand-in server.
+    :param records: Records of handled requests.
+    :param wall_time_s: Wall time of the download phase.
+    :return: Report as a table.
+    """
+    lines = [
+        f"Download phase took {wall_time_s:.2f} s.",
+        f"{'source':<12}{'requests':>10}{'req/s':>10}{'MB':>10}{'MB/s':>10}{'p50 ms':>10}{'p99 ms':>10}  statuses",
+    ]
+    sources = sorted({record.source for record in records})
+    for source in sources + ["all"]:
+        source_records = [record for record in records if source in ("all", record.source)]
+        durations_ms = sorted(record.duration_s * 1000 for record in source_records)
+        body_mb = sum(record.body_size for record in source_records) / 1_000_000
+        status_counts = {}
+        for record in source_records:
+            status_counts[record.status_code] = status_counts.get(record.status_code, 0) + 1
+        lines.append(
+            f"{source:<12}{len(source_records):>10}{len(source_records) / wall_time_s:>10.1f}{body_mb:>10.2f}"
+            f"{body_mb / wall_time_s:>10.2f}{_percentile(durations_ms, 50):>10.1f}"
+            f"{_percentile(durations_ms, 99):>10.1f}  "
+            + ", ".join(f"{status}: {count}" for status, count in sorted(status_counts.items()))
+        )
+    return os.linesep.join(lines)
+
+
+def _percentile(sorted_values: list[float], percentile: int) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, len(sorted_values) * percentile // 100)]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--structures", type=int, default=500, help="number of structures to download")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="delay before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests throttled with 429")
+    parser.add_argument("--slow-body-ms", type=float, default=0.0, help="delay between 4 KiB chunks of each body")
+    parser.add_argument("--ccd-copies", type=int, default=100, help="how many times are test ligands repeated")
+    parser.add_argument("--seed", type=int, default=None, help="seed for error and throttle injection")
+    parser.add_argument("--verbose", action="store_true", help="show info logs of the download phase")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlsplit
+
+from tests.test_constants import TEST_DATA_PATH, TEST_PDB_IDS, TEST_LIGAND_IDS
+
+_PDBE_REST_PATH = "/pdbe/api/pdb/entry"
+_VALIDATOR_DB_PATH = "/validatordb"
+_LIGAND_CCD_PATH = "/ccd"
+_PDBE_REST_TYPES = ["summary", "molecules", "assembly", "publications", "related_publications"]
+_SLOW_BODY_CHUNK_SIZE = 4 * 1024
+
+
+@dataclass(slots=True)
+class StandInServerSettings:
+    """
+    Behaviour of the stand-in server, to mimic the real servers under load.
+    """
+
+    # delay before each response
+    latency_s: float = 0.0
+    # fraction of requests answered with 503 Service Unavailable
+    error_rate: float = 0.0
+    # fraction of requests answered with 429 Too Many Requests (with Retry-After header)
+    throttle_rate: float = 0.0
+    retry_after_s: int = 1
+    # delay between each 4 KiB chunk of the response body (0 sends the body at once)
+    slow_body_chunk_delay_s: float = 0.0
+    # how many times are the test ligands repeated (under different ids) in components.cif
+    ccd_copies: int = 1
+    seed: Optional[int] = None
+
+
+@dataclass(slots=True)
+class RequestRecord:
+    """
+    One request handled by the stand-in server.
+    """
+
+    source: str
+    status_code: int
+    body_size: int
+    duration_s: float
+
+
+@dataclass
+class StandInServerRecords:
+    """
+    Requests handled by the stand-in server. Safe to use from multiple threads.
+    """
+
+    items: list[RequestRecord] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, record: RequestRecord) -> None:
+        """
+        Add record of one request.
+        :param record:
+        """
+        with self._lock:
+            self.items.append(record)
+
+    def get_all(self) -> list[RequestRecord]:
+        """
+        Get copy of all records so far.
+        """
+        with self._lock:
+            return list(self.items)
+
+
+class StandInServer:
+    """
+    Local http server standing in for PDBe REST API, ValidatorDB and wwPDB ccd files. It serves the payloads
+    from test data. Structure ids that are not in test data get payload of one of the test structures (with
+    the id replaced), so any number of structures can be downloaded. Runs in background thread, use as context
+    manager.
+    """
+
+    def __init__(self, settings: Optional[StandInServerSettings] = None, test_data_path: str = TEST_DATA_PATH):
+        self.settings = settings if settings is not None else StandInServerSettings()
+        self.records = StandInServerRecords()
+        self._payloads = _StandInPayloads(test_data_path, self.settings.ccd_copies)
+        self._random = random.Random(self.settings.seed)
+        self._random_lock = threading.Lock()
+        self._http_server = ThreadingHTTPServer(("127.0.0.1", 0), _create_request_handler_class(self))
+        self._http_server.daemon_threads = True
+        self._thread = threading.Thread(target=self._http_server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._thread.join()
+
+    @property
+    def base_url(self) -> str:
+        """
+        Url of the server root.
+        """
+        host, port = self._http_server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def pdbe_rest_base_url(self) -> str:
+        """
+        Url standing in for https://www.ebi.ac.uk/pdbe/api/pdb/entry.
+        """
+        return f"{self.base_url}{_PDBE_REST_PATH}"
+
+    @property
+    def validator_db_base_url(self) -> str:
+        """
+        Url standing in for https://webchem.ncbr.muni.cz/Platform/ValidatorDb/Data.
+        """
+        return f"{self.base_url}{_VALIDATOR_DB_PATH}"
+
+    @property
+    def ligand_ccd_base_url(self) -> str:
+        """
+        Url standing in for https://files.wwpdb.org/pub/pdb/data/monomers.
+        """
+        return f"{self.base_url}{_LIGAND_CCD_PATH}"
+
+    def draw_injected_status_code(self) -> Optional[int]:
+        """
+        Decide whether the request is answered with injected error or throttling instead of the payload.
+        :return: Status code to respond with, or None if the payload should be sent.
+        """
+        with self._random_lock:
+            draw = self._random.random()
+        if draw < self.settings.error_rate:
+            return 503
+        if draw < self.settings.error_rate + self.settings.throttle_rate:
+            return 429
+        return None
+
+    def get_payload(self, method: str, path: str, request_body: bytes) -> tuple[str, Optional[bytes]]:
+        """
+        Get payload for given request.
+        :param method: GET or POST.
+        :param path: Path of the request (without query).
+        :param request_body: Body of POST request.
+        :return: Name of the source (rest, rest_batch, vdb, ccd or unknown) and the payload, or None if there
+        is no such payload.
+        """
+        if path.startswith(f"{_PDBE_REST_PATH}/"):
+            rest_type, _, structure_id = path[len(_PDBE_REST_PATH) + 1:].partition("/")
+            if method == "POST" and not structure_id:
+                structure_ids = [item.strip() for item in request_body.decode("utf8").split(",") if item.strip()]
+                return "rest_batch", self._payloads.get_rest_batch_payload(rest_type, structure_ids)
+            return "rest", self._payloads.get_rest_payload(rest_type, structure_id)
+        if path.startswith(f"{_VALIDATOR_DB_PATH}/"):
+            return "vdb", self._payloads.get_validator_db_payload(path[len(_VALIDATOR_DB_PATH) + 1:])
+        if path.startswith(f"{_LIGAND_CCD_PATH}/"):
+            return "ccd", self._payloads.get_ccd_payload(path[len(_LIGAND_CCD_PATH) + 1:])
+        return "unknown", None
+
+
+class _StandInPayloads:
+    def __init__(self, test_data_path: str, ccd_copies: int):
+        self._test_data_path = test_data_path
+        self._ccd_copies = ccd_copies
+        self._rest_templates: dict[tuple[str, str], object] = {}
+        self._validator_db_templates: dict[str, bytes] = {}
+        self._ccd_files: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get_rest_payload(self, rest_type: str, structure_id: str) -> Optional[bytes]:
+        rest_value = self._get_rest_template(rest_type, structure_id)
+        if rest_value is None:
+            return None
+        return json.dumps({structure_id: rest_value}).encode("utf8")
+
+    def get_rest_batch_payload(self, rest_type: str, structure_ids: list[str]) -> Optional[bytes]:
+        if rest_type not in _PDBE_REST_TYPES:
+            return None
+        batch_json = {}
+        for structure_id in structure_ids:
+            rest_value = self._get_rest_template(rest_type, structure_id)
+            if rest_value is not None:
+                batch_json[structure_id] = rest_value
+        return json.dumps(batch_json).encode("utf8")
+
+    def get_validator_db_payload(self, structure_id: str) -> Optional[bytes]:
+        template_id = _get_template_id(structure_id)
+        with self._lock:
+            if template_id not in self._validator_db_templates:
+                self._validator_db_templates[template_id] = _read_file(
+                    os.path.join(self._test_data_path, template_id, "result.json")
+                )
+            return self._validator_db_templates[template_id]
+
+    def get_ccd_payload(self, filename: str) -> Optional[bytes]:
+        with self._lock:
+            if filename not in self._ccd_files:
+                self._ccd_files[filename] = self._assemble_ccd_file(filename)
+            return self._ccd_files[filename]
+
+    def _get_rest_template(self, rest_type: str, structure_id: str) -> Optional[object]:
+        if rest_type not in _PDBE_REST_TYPES:
+            return None
+        template_id = _get_template_id(structure_id)
+        with self._lock:
+            if (rest_type, template_id) not in self._rest_templates:
+                content = _read_file(os.path.join(self._test_data_path, template_id, rest_type, f"{template_id}.json"))
+                self._rest_templates[(rest_type, template_id)] = (
+                    json.loads(content)[template_id] if content is not None else None
+                )
+            return self._rest_templates[(rest_type, template_id)]
+
+    def _assemble_ccd_file(self, filename: str) -> Optional[bytes]:
+        if filename == "aa-variants-v1.cif":
+            return b""
+        if filename != "components.cif":
+            return None
+        ligand_cifs = []
+        for copy_number in range(self._ccd_copies):
+            for ligand_id in TEST_LIGAND_IDS:
+                ligand_cif = _read_file(os.path.join(self._test_data_path, "ligand_ccd_CIF", f"{ligand_id}.cif"))
+                if copy_number > 0:
+                    ligand_cif = ligand_cif.replace(
+                        f"data_{ligand_id}\n".encode("utf8"), f"data_{ligand_id}{copy_number}\n".encode("utf8"), 1
+                    )
+                ligand_cifs.append(ligand_cif if ligand_cif.endswith(b"\n") else ligand_cif + b"\n")
+        return b"".join(ligand_cifs)
+
+
+def _get_template_id(structure_id: str) -> str:
+    if structure_id in TEST_PDB_IDS:
+        return structure_id
+    return TEST_PDB_IDS[zlib.crc32(structure_id.encode("utf8")) % len(TEST_PDB_IDS)]
+
+
+def _read_file(filepath: str) -> Optional[bytes]:
+    try:
+        with open(filepath, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _create_request_handler_class(server: StandInServer) -> type[BaseHTTPRequestHandler]:
+    class StandInRequestHandler(BaseHTTPRequestHandler):
+        """
+        Handles one request to the stand-in server.
+        """
+
+        protocol_version = "HTTP/1.1"  # keeps connections alive, as the real servers do
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            self._handle("GET")
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            self._handle("POST")
+
+        def log_message(self, *_):  # pylint: disable=arguments-differ
+            pass  # requests are recorded instead
+
+        def _handle(self, method: str) -> None:
+            start = time.perf_counter()
+            request_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            source, payload = server.get_payload(method, urlsplit(self.path).path, request_body)
+            if server.settings.latency_s > 0:
+                time.sleep(server.settings.latency_s)
+
+            status_code = server.draw_injected_status_code()
+            if status_code is None:
+                status_code = 200 if payload is not None else 404
+            etag = f'"{zlib.crc32(payload):08x}"' if status_code == 200 else None
+            if etag is not None and self.headers.get("If-None-Match") == etag:
+                status_code = 304
+            body = payload if status_code == 200 else b""
+
+            self.send_response(status_code)
+            self.send_header("Content-Length", str(len(body)))
+            if etag is not None:
+                self.send_header("ETag", etag)
+            if status_code == 429:
+                self.send_header("Retry-After", str(server.settings.retry_after_s))
+            self.end_headers()
+            self._write_body(body)
+            server.records.add(RequestRecord(source, status_code, len(body), time.perf_counter() - start))
+
+        def _write_body(self, body: bytes) -> None:
+            if server.settings.slow_body_chunk_delay_s <= 0:
+                self.wfile.write(body)
+                return
+            for chunk_start in range(0, len(body), _SLOW_BODY_CHUNK_SIZE):
+                self.wfile.write(body[chunk_start:chunk_start + _SLOW_BODY_CHUNK_SIZE])
+                self.wfile.flush()
+                time.sleep(server.settings.slow_body_chunk_delay_s)
+
+    return StandInRequestHandler
@@ -0,0 +1,53 @@
+import json
+import os
+
+from src.data_download.ligand_ccd_handler import download_and_find_changed_ligand_cifs
+from src.data_download.rest_download import RestDataType, download_one_type_rest_files
+from tests.download_benchmark.stand_in_server import StandInServer, StandInServerSettings
+from tests.test_constants import TEST_LIGAND_IDS
+
+
+def test_rest_files_download_from_stand_in_server(tmp_path):
+    # arrange
+    ids_to_download = {"1dey", "x001", "x002"}
+    os.mkdir(tmp_path / "summary")
+
+    # act
+    with StandInServer() as server:
+        batch_result = download_one_type_rest_files(
+            ids_to_download, RestDataType.SUMMARY, str(tmp_path), 10, 2, batch_size=2,
+            base_url=server.pdbe_rest_base_url,
+        )
+        vdb_result = download_one_type_rest_files(
+            ids_to_download, RestDataType.VALIDATOR_DB, str(tmp_path), 10, 2, base_url=server.validator_db_base_url
+        )
+        records = server.records.get_all()
+
+    # assert
+    assert not batch_result.failed_ids
+    assert not vdb_result.failed_ids
+    for structure_id in ids_to_download:
+        with open(tmp_path / "summary" / f"{structure_id}.json", encoding="utf8") as f:
+            assert list(json.load(f)) == [structure_id]
+        assert os.path.exists(tmp_path / structure_id / "result.json")
+    assert sorted(record.source for record in records) == ["rest_batch", "rest_batch", "vdb", "vdb", "vdb"]
+
+
+def test_ligand_ccd_download_from_stand_in_server(tmp_path):
+    # arrange
+    (tmp_path / "ligands").mkdir()
+    (tmp_path / "cache").mkdir()
+
+    # act
+    with StandInServer(StandInServerSettings(ccd_copies=2)) as server:
+        changed_ids = download_and_find_changed_ligand_cifs(
+            str(tmp_path / "ligands"),
+            str(tmp_path / "cache"),
+            str(tmp_path / "ccd_state.json"),
+            str(tmp_path / "manifest.json"),
+            10,
+            ccd_base_url=server.ligand_ccd_base_url,
+        )
+
+    # assert
+    assert sorted(changed_ids.updated) == sorted(TEST_LIGAND_IDS + [f"{ligand_id}1" for ligand_id in TEST_LIGAND_IDS])